@@ -0,0 +1,459 @@
+"""
+File containing a long-running service that generates reports for a watchlist on a schedule.
+Report requests go through a job queue and are processed by a pool of workers, each one with
+its own compiled FinanceGraph, while the requests to yahoo finance and serpapi are rate limited.
+"""
+import os
+import time
+import signal
+import logging
+import argparse
+import datetime as dt
+import threading
+from queue import Empty, PriorityQueue
+from rich.console import Console
+
+from finance_graph import FinanceGraph, model_options, node_model, read_stocks_file
+from utils.rate_limit import set_rate_limit
+from utils.context import DEFAULT_TOKEN_BUDGET
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+
+class WatchlistDaemon:
+    """
+    Service that queues a report request for every stock of a watchlist file once every
+    `interval` seconds (the file is read again on every round, so it can be edited while the
+    service runs), and generates the reports with `workers` workers. At most `llm_slots` LLM
+    calls run at the same time across all the workers.
+
+    Every report is saved in its own `dest_dir/TICKER/YYYYmmdd-HHMMSS` directory, or, with a
+    columnar output format (see `graph_kwargs`), appended to the store in `dest_dir` in batches.
+    """
+    def __init__(self, watchlist_file: str, default_exchange: str, dest_dir: str, interval: float=3600,
+                 workers: int=2, llm_slots: int | None=None, graph_kwargs: dict | None=None):
+        self.watchlist_file = watchlist_file
+        self.default_exchange = default_exchange
+        self.dest_dir = dest_dir
+        self.interval = interval
+        self.workers = workers
+        self.llm_slots = threading.BoundedSemaphore(llm_slots if llm_slots is not None else workers)
+        self.graph_kwargs = graph_kwargs or {}
+
+        # queued report requests, as (due time, sequence number, stock ticker, stock exchange)
+        self.jobs = PriorityQueue()
+        self.completed = 0
+        self.failed = 0
+        self._sequence = 0
+        # tickers with a queued or running report, so that a slow report is not queued twice
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def submit(self, stock_ticker: str, stock_exchange: str, due_at: float | None=None) -> bool:
+        """
+        Queue a report request, unless a report for the same stock is already queued or running.
+        Returns whether the request was queued.
+        """
+        with self._lock:
+            if stock_ticker in self._pending:
+                return False
+            self._pending.add(stock_ticker)
+            self._sequence += 1
+            self.jobs.put((due_at if due_at is not None else time.time(), self._sequence, stock_ticker, stock_exchange))
+        return True
+
+    def schedule_round(self) -> int:
+        """
+        Queue a report request for every stock of the watchlist and return the number of queued requests.
+        """
+        try:
+            stocks = read_stocks_file(self.watchlist_file, default_exchange=self.default_exchange)
+        except Exception as e:
+            logger.error("Could not read watchlist '%s': %s", self.watchlist_file, e)
+            return 0
+        queued = sum(self.submit(ticker, exchange) for ticker, exchange in stocks)
+        logger.info("Queued %d of %d watchlist stocks", queued, len(stocks))
+        return queued
+
+    def _scheduler(self):
+        while not self._stop.is_set():
+            self.schedule_round()
+            self._stop.wait(self.interval)
+
+    def _build_graph(self) -> FinanceGraph:
+        """
+        Create and compile the graph of a worker, which it uses for all of its reports.
+        """
+        fg = FinanceGraph(**self.graph_kwargs)
+        fg.configurable["llm_slots"] = self.llm_slots
+        fg.build()
+        return fg
+
+    def _worker(self, index: int, fg: FinanceGraph):
+        while not self._stop.is_set():
+            try:
+                due_at, sequence, ticker, exchange = self.jobs.get(timeout=0.5)
+            except Empty:
+                # write the partial batch of buffered reports while there is nothing to do
+                fg.flush()
+                continue
+            # jobs that are not due yet go back to the queue
+            if due_at > time.time():
+                self.jobs.put((due_at, sequence, ticker, exchange))
+                self.jobs.task_done()
+                self._stop.wait(min(0.5, due_at - time.time()))
+                continue
+
+            if fg.output_format == "files":
+                dest_dir = os.path.join(self.dest_dir, ticker, dt.datetime.now().strftime('%Y%m%d-%H%M%S'))
+            else:
+                dest_dir = self.dest_dir
+            start = time.perf_counter()
+            try:
+                # with checkpoints, the runs that a previous round (or process) left unfinished today are resumed
+                _, success = fg.run(stock_ticker=ticker, stock_exchange=exchange, dest_dir=dest_dir,
+                                    resume=fg.checkpointer is not None)
+            except Exception as e:
+                logger.error("Worker %d: report for %s failed: %s", index, ticker, e)
+                success = False
+            else:
+                logger.info("Worker %d: report for %s saved in %s (%.1f s)", index, ticker, dest_dir,
+                            time.perf_counter() - start)
+            with self._lock:
+                self._pending.discard(ticker)
+                if success:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self.jobs.task_done()
+        fg.flush()
+        if fg.llm_cache is not None:
+            logger.info("Worker %d: LLM response cache %s", index, fg.llm_cache.stats())
+
+    def start(self, schedule: bool=True):
+        """
+        Start the workers and (if `schedule` is set) the scheduler of the watchlist rounds.
+        The graphs of the workers are built first, so that their errors are raised here
+        (instead of stopping a worker while its jobs wait in the queue).
+        """
+        graphs = [self._build_graph() for _ in range(self.workers)]
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._worker, args=(i, fg), name=f"report-worker-{i}", daemon=True)
+            for i, fg in enumerate(graphs)
+        ]
+        if schedule:
+            self._threads.append(threading.Thread(target=self._scheduler, name="watchlist-scheduler", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the service. Running reports are finished, queued ones are dropped.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run_once(self):
+        """
+        Generate the reports of a single watchlist round and return when all of them are done.
+        """
+        self.start(schedule=False)
+        self.schedule_round()
+        self.jobs.join()
+        self.stop()
+
+    def run_forever(self):
+        """
+        Run the service until the process receives SIGINT or SIGTERM.
+        """
+        stopped = threading.Event()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            signal.signal(signum, lambda *args: stopped.set())
+        self.start()
+        while not stopped.wait(1):
+            pass
+        console.print("[cyan]Stopping: waiting for running reports to finish...")
+        self.stop()
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="WatchlistDaemon")
+    parser.add_argument(
+        "--serving-type",
+        action="store",
+        dest="serving_type",
+        choices=["ollama", "hugging-face", "llama-cpp", "model-server"],
+        required=True,
+        help="LLM serving method",
+    )
+    parser.add_argument(
+        "-m",
+        "--model-name",
+        action="store",
+        dest="model_name",
+        required=False,
+        help="LLM that will be used (when using llama.cpp for model serving, this argument is ignored)",
+    )
+    parser.add_argument(
+        "--model-path",
+        action="store",
+        dest="model_path",
+        required=False,
+        help="Path of the llama.cpp model file (specify only when using llama.cpp for model serving)",
+    )
+    parser.add_argument(
+        "--url",
+        action="store",
+        dest="url",
+        required=False,
+        help="Ollama or worker server ulr (specify only when using Ollama or model-server for model serving)",
+    )
+    parser.add_argument(
+        "-c",
+        "--config-file",
+        action="store",
+        dest="config_file",
+        required=False,
+        help="Configuration (.json) file  with the necessary initialization arguments of LLM interface",
+    )
+    parser.add_argument(
+        "--node-model",
+        action="append",
+        dest="node_models",
+        type=node_model,
+        required=False,
+        metavar="NODE=MODEL",
+        help="Model of an LLM node (technical_analysis, sentiment_analysis, valuation_analysis, report_writer, or analyses for all three), served like the default one. May be repeated",
+    )
+    parser.add_argument(
+        "--router-model",
+        action="store",
+        dest="router_model",
+        required=False,
+        help="Small model, served like the default one, that answers the short analysis prompts (long prompts, and the ones it fails, go to the node's model)",
+    )
+    parser.add_argument(
+        "--router-max-tokens",
+        action="store",
+        dest="router_max_tokens",
+        type=int,
+        required=False,
+        help="Maximum number of prompt tokens that are sent to the --router-model (default is the one of the router, see utils/llm_router.py)",
+    )
+    parser.add_argument(
+        "-w",
+        "--watchlist",
+        action="store",
+        dest="watchlist",
+        required=True,
+        help="File containing one stock per line (as TICKER or TICKER:EXCHANGE), read again on every round",
+    )
+    parser.add_argument(
+        "-e",
+        "--exchange",
+        action="store",
+        dest="exchange",
+        required=True,
+        help="The default exchange market of the watchlist stocks (i.e. NASDAQ, NYSE, etc.)",
+    )
+    parser.add_argument(
+        "-d",
+        "--dest-dir",
+        action="store",
+        dest="dest_dir",
+        required=True,
+        help="Directory in which every report is saved, under TICKER/YYYYmmdd-HHMMSS (or the columnar store, see --output-format)",
+    )
+    parser.add_argument(
+        "--interval",
+        action="store",
+        dest="interval",
+        type=float,
+        default=3600,
+        required=False,
+        help="Number of seconds between two rounds of the watchlist (default is 3600)",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        dest="once",
+        help="Generate the reports of a single round and exit",
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        dest="workers",
+        type=int,
+        default=2,
+        required=False,
+        help="Number of reports generated at the same time (default is 2)",
+    )
+    parser.add_argument(
+        "--llm-slots",
+        action="store",
+        dest="llm_slots",
+        type=int,
+        required=False,
+        help="Maximum number of LLM calls that run at the same time (default is the number of workers)",
+    )
+    parser.add_argument(
+        "--yahoo-rate",
+        action="store",
+        dest="yahoo_rate",
+        type=float,
+        default=2,
+        required=False,
+        help="Maximum number of yahoo finance requests per second (default is 2)",
+    )
+    parser.add_argument(
+        "--yahoo-burst",
+        action="store",
+        dest="yahoo_burst",
+        type=float,
+        default=5,
+        required=False,
+        help="Maximum number of yahoo finance requests sent in a burst (default is 5)",
+    )
+    parser.add_argument(
+        "--serpapi-rate",
+        action="store",
+        dest="serpapi_rate",
+        type=float,
+        default=0.5,
+        required=False,
+        help="Maximum number of serpapi requests per second (default is 0.5)",
+    )
+    parser.add_argument(
+        "--serpapi-burst",
+        action="store",
+        dest="serpapi_burst",
+        type=float,
+        default=2,
+        required=False,
+        help="Maximum number of serpapi requests sent in a burst (default is 2)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        dest="cache_dir",
+        required=False,
+        help="Directory of the on-disk market data cache (if not specified, market data won't be cached)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        action="store",
+        dest="token_budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        required=False,
+        help=f"Maximum number of tokens that the financial data of each LLM prompt may use (default is {DEFAULT_TOKEN_BUDGET})",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        action="store",
+        dest="llm_cache",
+        choices=["memory", "sqlite"],
+        required=False,
+        help="Cache LLM responses in memory or on disk (sqlite requires --cache-dir), so that repeated prompts skip the LLM call",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        action="store",
+        dest="archive_dir",
+        required=False,
+        help="Directory of the archive of past runs, so that a report only regenerates the analyses whose inputs changed since the last round",
+    )
+    parser.add_argument(
+        "--reuse-max-age",
+        action="store",
+        dest="reuse_max_age",
+        type=float,
+        required=False,
+        help="Number of seconds for which the archived analyses of a run are reused (default is 7 days)",
+    )
+    parser.add_argument(
+        "--output-format",
+        action="store",
+        dest="output_format",
+        choices=["files", "parquet", "arrow"],
+        default="files",
+        required=False,
+        help="Save every report as .json/.txt files, or append them to columnar datasets in --dest-dir (requires pyarrow)",
+    )
+    parser.add_argument(
+        "--store-batch-size",
+        action="store",
+        dest="store_batch_size",
+        type=int,
+        default=16,
+        required=False,
+        help="Number of reports written to the columnar store at once by every worker (default is 16)",
+    )
+    parser.add_argument(
+        "--process-workers",
+        action="store",
+        dest="process_workers",
+        type=int,
+        default=0,
+        required=False,
+        help="Number of worker processes, shared by all the workers, that parse the articles and compute the indicators (default is 0, which does this work in the workers themselves)",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        action="store",
+        dest="checkpoint_dir",
+        required=False,
+        help="Directory of the checkpoints of the runs, so that runs that failed (or were stopped) resume from their last completed step",
+    )
+    return parser.parse_args()
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # rate limits are shared by all the workers of the process
+    set_rate_limit("yahoo", args.yahoo_rate, args.yahoo_burst)
+    set_rate_limit("serpapi", args.serpapi_rate, args.serpapi_burst)
+
+    daemon = WatchlistDaemon(
+        watchlist_file=args.watchlist,
+        default_exchange=args.exchange,
+        dest_dir=args.dest_dir,
+        interval=args.interval,
+        workers=args.workers,
+        llm_slots=args.llm_slots,
+        graph_kwargs={
+            "type": args.serving_type,
+            "model_name": args.model_name,
+            "url": args.url,
+            "model_path": args.model_path,
+            "config_file": args.config_file,
+            "cache_dir": args.cache_dir,
+            "token_budget": args.token_budget,
+            "llm_cache": args.llm_cache,
+            "archive_dir": args.archive_dir,
+            "reuse_max_age": args.reuse_max_age,
+            "output_format": args.output_format,
+            "store_batch_size": args.store_batch_size,
+            "checkpoint_dir": args.checkpoint_dir,
+            "process_workers": args.process_workers,
+            **model_options(args)
+        }
+    )
+    if args.once:
+        daemon.run_once()
+    else:
+        console.print(f"[green bold]Watching '{args.watchlist}' every {args.interval:g} s with {args.workers} workers")
+        daemon.run_forever()
+    console.print(f"[green bold]{daemon.completed} reports generated, {daemon.failed} failed")
+
+
+if __name__ == "__main__":
+    ARGS = parse_input()
+    main(ARGS)
@@ -3,32 +3,45 @@ File containing class implementation of the workflow graph.
 """
 import os
 import json
+import asyncio
+import sqlite3
+import logging
 import argparse
+import weakref
+import threading
+import tracemalloc
 from rich.console import Console
-from typing import Literal
-
-from langgraph.graph import StateGraph, START, END
-
-from states.graph_state import GraphState
-from nodes.llm_node import LLMNode
-from utils.utils import llm_endpoint
-from utils.prompts import (
-    TECHNICAL_ANALYSIS_PROMPT, 
-    SENTIMENT_ANALYSIS_PROMPT, 
-    VALUATION_ANALYSIS_PROMPT,
-    REPORT_WRITING_PROMPT
-)
-from nodes.simple_nodes import (
-    get_stock_prices, 
-    get_financial_metrics, 
-    get_general_financial_info,
-    combine_stock_data
-)
+from rich.table import Table
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, AsyncContextManager, Iterator, Literal
+
+from utils.context import DEFAULT_TOKEN_BUDGET
+from utils.retry import DEFAULT_RETRY_ATTEMPTS
+
+# heavy modules (langgraph, the LLM backends and the data sources) are imported when they are
+# first used, so that the CLI starts quickly and only the selected serving type is loaded
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable, RunnableLambda
+    from utils.profiling import Profiler, RunTrace
+    from utils.store import ReportStore
+    from utils.checkpoint import RunSqliteSaver
+    from utils.llm_router import RouteStats
 
 from dotenv import load_dotenv
 load_dotenv()
 
 console = Console()
+logger = logging.getLogger(__name__)
+
+# compiled graphs of the process, reused by every FinanceGraph with the same models and LLM cache. A graph
+# holds its models, cache and checkpointer, so their ids are not reused while it is in use, and it is
+# dropped once no FinanceGraph uses it
+_compiled_graphs = weakref.WeakValueDictionary()
+_compiled_graphs_lock = threading.Lock()
+
+# nodes that call the LLM, which may each use their own model ("analyses" stands for the first three)
+ANALYSIS_NODES = ["technical_analysis", "sentiment_analysis", "valuation_analysis"]
+LLM_NODES = ANALYSIS_NODES + ["report_writer"]
 
 
 class FinanceGraph():
@@ -37,9 +50,27 @@ class FinanceGraph():
     report regarding a given stock. The report features price data, financial
     metrics and indicators as well as relevant articles.
     """
-    def __init__(self, type: Literal["hugging-face", "ollama", "llama-cpp"]="hugging-face",
+    def __init__(self, type: Literal["hugging-face", "ollama", "llama-cpp", "model-server"]="hugging-face",
                 model_name: str | None=None, url: str | None=None, model_path: str | None=None,
-                config_file: str | None=None):
+                config_file: str | None=None, cache_dir: str | None=None, cache_ttl: float=3600,
+                token_budget: int=DEFAULT_TOKEN_BUDGET, incremental_indicators: bool=False,
+                verify_indicators: bool=False, llm_cache: Literal["memory", "sqlite"] | None=None,
+                llm_cache_ttl: float | None=None,
+                prompt_cache: Literal["ram", "disk"] | None=None,
+                output_format: Literal["files", "parquet", "arrow"]="files", store_batch_size: int=1,
+                archive_dir: str | None=None, change_tolerance: float | None=None,
+                reuse_max_age: float | None=None, article_ttl: float | None=None,
+                checkpoint_dir: str | None=None, retry_attempts: int=DEFAULT_RETRY_ATTEMPTS,
+                process_workers: int=0, node_models: dict[str, dict] | None=None, router: dict | None=None,
+                profile: Literal["nodes", "memory"] | None=None):
+        from utils.utils import llm_endpoint
+        from utils.llm_router import DEFAULT_ROUTER_MAX_TOKENS, LLMRouter, RouteStats
+        from utils.cache import MarketDataCache
+        from utils.llm_cache import InMemoryLLMCache, SQLiteLLMCache, llm_identity
+        from utils.profiling import Profiler
+        from utils.archive import StateArchive, DEFAULT_CHANGE_TOLERANCE, DEFAULT_REUSE_MAX_AGE
+        from utils.article_store import ArticleStore, ARTICLE_TTL
+
         # first option: use a configuration file for llm initialization
         if config_file is not None:
             if os.path.exists(config_file):
@@ -59,25 +90,206 @@ class FinanceGraph():
             if url is not None:
                 config["url"] = url
 
+        # per-node models and the small-model router, from the configuration file or the parameters
+        # (which take precedence), i.e. {"models": {"analyses": {"model_name": ...}}, "router": {...}}
+        node_models = {**config.pop("models", {}), **(node_models or {})}
+        config_router = config.pop("router", None)
+        router = router if router is not None else config_router
+
+        # llama.cpp prompt cache, which reuses the prefill of the shared prompt prefix
+        if prompt_cache is not None:
+            config.setdefault("prompt_cache", prompt_cache)
+            if prompt_cache == "disk":
+                if cache_dir is None:
+                    raise ValueError("An on-disk prompt cache requires a cache directory!")
+                config.setdefault("prompt_cache_dir", os.path.join(cache_dir, "llama_prompt_cache"))
+
         self.llm = llm_endpoint(type=type, config=config)
         self.graph = None
 
-    def build(self):
+        # every LLM node uses the default model, unless it has its own (or, for the analyses, the "analyses" one)
+        unknown = set(node_models) - set(LLM_NODES) - {"analyses"}
+        if unknown:
+            raise ValueError(f"Unknown LLM nodes {sorted(unknown)} in the per-node models!")
+        self.node_llms: dict[str, "Runnable"] = {}
+        for node in LLM_NODES:
+            entry = node_models.get(node, node_models.get("analyses") if node in ANALYSIS_NODES else None)
+            self.node_llms[node] = self._endpoint(type, config, entry) if entry is not None else self.llm
+
+        # optional router, which sends the short prompts of its nodes to a small model and the rest
+        # (along with the prompts that the small model fails) to the node's own model
+        self.route_stats: "RouteStats | None" = None
+        if router is not None:
+            router = dict(router)
+            max_tokens = router.pop("max_context_tokens", DEFAULT_ROUTER_MAX_TOKENS)
+            routed_nodes = router.pop("nodes", ANALYSIS_NODES)
+            unknown = set(routed_nodes) - set(LLM_NODES)
+            if unknown:
+                raise ValueError(f"Unknown LLM nodes {sorted(unknown)} in the router!")
+            small = self._endpoint(type, config, router)
+            self.route_stats = RouteStats()
+            # nodes with the same model share a router
+            routers = {}
+            for node in routed_nodes:
+                large = self.node_llms[node]
+                if id(large) not in routers:
+                    routers[id(large)] = LLMRouter(small, large, max_tokens=max_tokens, stats=self.route_stats)
+                self.node_llms[node] = routers[id(large)]
+
+        # optional on-disk cache for market data, shared by all runs of the graph
+        self.cache = MarketDataCache(cache_dir, ttl=cache_ttl) if cache_dir is not None else None
+        # article texts are stored along with the market data, and shared by all the tickers that link to them
+        self.article_store = None
+        if cache_dir is not None:
+            self.article_store = ArticleStore(cache_dir, ttl=article_ttl if article_ttl is not None else ARTICLE_TTL)
+        # optional cache of LLM responses, shared by all LLM nodes
+        if llm_cache == "memory":
+            self.llm_cache = InMemoryLLMCache(ttl=llm_cache_ttl)
+        elif llm_cache == "sqlite":
+            if cache_dir is None:
+                raise ValueError("An on-disk LLM response cache requires a cache directory!")
+            self.llm_cache = SQLiteLLMCache(cache_dir, ttl=llm_cache_ttl)
+        else:
+            self.llm_cache = None
+        # optional archive of past runs, whose analyses are reused while their inputs do not change
+        self.archive = StateArchive(archive_dir) if archive_dir is not None else None
+        # archived responses are reused only if they were generated by the same models
+        if all(llm is self.llm for llm in self.node_llms.values()):
+            self.model = llm_identity(self.llm)
+        else:
+            self.model = json.dumps({node: llm_identity(llm) for node, llm in self.node_llms.items()}, sort_keys=True)
+
+        # optional checkpoints of every run, so that failed runs can resume from their last completed node
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpointer: "RunSqliteSaver | None" = None
+        if checkpoint_dir is not None:
+            from utils.checkpoint import open_checkpointer
+            self.checkpointer = open_checkpointer(checkpoint_dir)
+        # attempts of each LLM call and data request that fails with a transient error (see `utils.retry.is_transient`)
+        self.retry_attempts = retry_attempts
+
+        # optional pool of worker processes for the CPU-bound work of the deterministic nodes (html parsing and
+        # indicators), shared by the FinanceGraph instances of the process. LLM calls keep their own scheduling
+        self.process_pool = None
+        if process_workers > 0:
+            from utils.process_pool import process_pool
+            self.process_pool = process_pool(process_workers)
+
+        # runtime configuration made available to the nodes of the graph
+        self.configurable = {
+            "market_data_cache": self.cache,
+            "context_token_budget": token_budget,
+            # indicator state is persisted in the cache, so incremental updates require one
+            "incremental_indicators": incremental_indicators and self.cache is not None,
+            "verify_indicators": verify_indicators,
+            "article_store": self.article_store,
+            "state_archive": self.archive,
+            "archive_model": self.model,
+            "change_tolerance": change_tolerance if change_tolerance is not None else DEFAULT_CHANGE_TOLERANCE,
+            "archive_max_age": reuse_max_age if reuse_max_age is not None else DEFAULT_REUSE_MAX_AGE,
+            "process_pool": self.process_pool,
+            "retry_attempts": retry_attempts
+        }
+
+        # collects the per-node trace of every run. When profiling, the size of every node's output is
+        # measured too and, to profile memory, the nodes run one at a time: peak memory is process-wide,
+        # so it is only measured for nodes that do not overlap with others
+        self.profile = profile
+        self.profiler = Profiler(measure_outputs=profile is not None)
+
+        # saved runs go either to per-run directories of files, or to a columnar store per destination
+        if output_format != "files":
+            from utils.store import pa
+            if pa is None:
+                raise ImportError(f"Output format '{output_format}' requires the pyarrow package!")
+        self.output_format = output_format
+        self.store_batch_size = store_batch_size
+        self.stores = {}
+        self._stores_lock = threading.Lock()
+
+    @staticmethod
+    def _endpoint(default_type: str, default_config: dict, entry: dict) -> "Runnable":
         """
-        Build and compile the graph.
+        Returns the model of a per-node (or router) entry: its serving type defaults to the graph's
+        one, in which case the entry only needs the settings that differ from the default model's.
         """
+        from utils.utils import llm_endpoint
+
+        entry = dict(entry)
+        type = entry.pop("type", default_type)
+        return llm_endpoint(type=type, config={**default_config, **entry} if type == default_type else entry)
+
+    def build(self, reuse: bool=True):
+        """
+        Build and compile the graph. If parameter `reuse` is set, a graph already compiled in this
+        process for the same models, LLM cache, checkpointer and retries is reused instead.
+        """
+        # the compiled graph only depends on these, the rest of the configuration is given per run
+        llms = tuple(self.node_llms[node] for node in LLM_NODES)
+        key = (tuple(id(llm) for llm in llms), id(self.llm_cache), id(self.checkpointer), self.retry_attempts)
+        with _compiled_graphs_lock:
+            compiled = _compiled_graphs.get(key) if reuse else None
+            if compiled is not None:
+                self.graph = compiled
+                return
+
+        from langgraph.graph import StateGraph, START, END
+        from langgraph.types import RetryPolicy
+        from utils.retry import is_transient, RETRY_INITIAL_INTERVAL, RETRY_BACKOFF_FACTOR, RETRY_MAX_INTERVAL
+        from states.graph_state import GraphState
+        from nodes.llm_node import LLMNode
+        from utils.prompts import (
+            TECHNICAL_ANALYSIS_PROMPT,
+            SENTIMENT_ANALYSIS_PROMPT,
+            VALUATION_ANALYSIS_PROMPT,
+            REPORT_WRITING_PROMPT
+        )
+        from nodes.simple_nodes import (
+            get_stock_prices,
+            get_financial_metrics,
+            get_general_financial_info,
+            combine_stock_data,
+            detect_changes,
+            aget_stock_prices,
+            aget_financial_metrics,
+            aget_general_financial_info,
+            acombine_stock_data,
+            adetect_changes
+        )
+
+        # LLM nodes are retried on transient errors only, with a longer backoff than the data requests.
+        # the data nodes fall back to empty data on errors, so their requests are retried one by one instead
+        # (see `utils.data_access`)
+        llm_retry = RetryPolicy(
+            initial_interval=2 * RETRY_INITIAL_INTERVAL, backoff_factor=RETRY_BACKOFF_FACTOR,
+            max_interval=4 * RETRY_MAX_INTERVAL, max_attempts=self.retry_attempts, retry_on=is_transient
+        )
+
         builder = StateGraph(GraphState)
-        # add simple nodes
-        builder.add_node("get_stock_prices", get_stock_prices)
-        builder.add_node("get_financial_metrics", get_financial_metrics)
-        builder.add_node("get_general_financial_info", get_general_financial_info)
-        builder.add_node("combine_stock_data", combine_stock_data)
+        # add simple nodes (each one with a synchronous and an asynchronous version)
+        for name, func, afunc in [
+            ("get_stock_prices", get_stock_prices, aget_stock_prices),
+            ("get_financial_metrics", get_financial_metrics, aget_financial_metrics),
+            ("get_general_financial_info", get_general_financial_info, aget_general_financial_info),
+            ("combine_stock_data", combine_stock_data, acombine_stock_data),
+            ("detect_changes", detect_changes, adetect_changes)
+        ]:
+            builder.add_node(name, self._instrumented_node(name, func, afunc))
 
         # add LLM nodes
-        builder.add_node("technical_analysis", LLMNode(self.llm, TECHNICAL_ANALYSIS_PROMPT))
-        builder.add_node("sentiment_analysis", LLMNode(self.llm, SENTIMENT_ANALYSIS_PROMPT))
-        builder.add_node("valuation_analysis", LLMNode(self.llm, VALUATION_ANALYSIS_PROMPT))
-        builder.add_node("report_writer", LLMNode(self.llm, REPORT_WRITING_PROMPT))
+        analyses = [
+            LLMNode(self.node_llms[name], prompt, name=name, cache=self.llm_cache)
+            for name, prompt in [
+                ("technical_analysis", TECHNICAL_ANALYSIS_PROMPT),
+                ("sentiment_analysis", SENTIMENT_ANALYSIS_PROMPT),
+                ("valuation_analysis", VALUATION_ANALYSIS_PROMPT)
+            ]
+        ]
+        report_writer = LLMNode(
+            self.node_llms["report_writer"], REPORT_WRITING_PROMPT, name="report_writer", cache=self.llm_cache
+        )
+        for node in analyses + [report_writer]:
+            builder.add_node(node.name, self._instrumented_node(node.name, node, node.__acall__), retry=llm_retry)
 
         # add edges
         builder.add_edge(START, "get_stock_prices")
@@ -88,57 +300,452 @@ class FinanceGraph():
         builder.add_edge("get_financial_metrics", "combine_stock_data")
         builder.add_edge("get_general_financial_info", "combine_stock_data")
 
-        builder.add_edge("combine_stock_data", "technical_analysis")
-        builder.add_edge("combine_stock_data", "sentiment_analysis")
-        builder.add_edge("combine_stock_data", "valuation_analysis")
+        builder.add_edge("combine_stock_data", "detect_changes")
 
-        builder.add_edge("technical_analysis", "report_writer")
-        builder.add_edge("sentiment_analysis", "report_writer")
-        builder.add_edge("valuation_analysis", "report_writer")
+        # the analyses render their prompts from the fetched data, unless they reuse previous responses
+        for node in analyses:
+            builder.add_edge("detect_changes", node.name)
+            builder.add_edge(node.name, "report_writer")
 
         builder.add_edge("report_writer", END)
 
-        # Compile graph
-        self.graph = builder.compile()
+        # Compile graph (with a checkpointer, the state of each run is saved after every step)
+        self.graph = builder.compile(checkpointer=self.checkpointer)
+        with _compiled_graphs_lock:
+            _compiled_graphs[key] = self.graph
+
+    @staticmethod
+    def _instrumented_node(name: str, func, afunc) -> "RunnableLambda":
+        """
+        Create a graph node whose executions are recorded in the trace of each run.
+        """
+        from langchain_core.runnables import RunnableLambda
+        from utils.profiling import instrument
+
+        wrapper, awrapper = instrument(name, func, afunc)
+        return RunnableLambda(wrapper, afunc=awrapper, name=name)
+
+    def _run_config(self, trace: "RunTrace", stock_ticker: str, resume: bool=False) -> dict:
+        """
+        Return the runnable config of a single run, which records its nodes in the given trace
+        (and, with a checkpointer, saves its state in a checkpoint thread of its own or, if `resume`
+        is set, in the thread of the latest unfinished run of the stock on the same day).
+        """
+        configurable = {**self.configurable, "trace": trace}
+        if self.checkpointer is not None:
+            from utils.checkpoint import run_thread_id
+            configurable["thread_id"] = (resume and self._resume_thread(stock_ticker)) or run_thread_id(stock_ticker)
+        if self.profile == "memory":
+            return {"configurable": configurable, "max_concurrency": 1}
+        return {"configurable": configurable}
+
+    def _resume_thread(self, stock_ticker: str) -> str | None:
+        """
+        Return the checkpoint thread of the latest unfinished run of a stock on the same day, if any.
+        """
+        from utils.checkpoint import run_thread_prefix, thread_ids
+
+        for thread_id in thread_ids(self.checkpointer, run_thread_prefix(stock_ticker)):
+            if self._resumable({"configurable": {"thread_id": thread_id}}):
+                return thread_id
+        return None
+
+    def _resumable(self, config: dict) -> bool:
+        """
+        Whether the checkpoint thread of a run config holds an unfinished run (one that stopped
+        before its end, so it has nodes left to run).
+        """
+        return self.checkpointer is not None and bool(self.graph.get_state(config).next)
+
+    def _run_input(self, state: dict, config: dict, resume: bool=False) -> dict | None:
+        """
+        Return the input of a run: None to continue the unfinished checkpointed run of its thread
+        (if `resume` is set and there is one), otherwise the given initial state.
+        """
+        return None if resume and self._resumable(config) else state
+
+    async def _arun_input(self, state: dict, config: dict, resume: bool=False) -> dict | None:
+        """
+        Asynchronous version of `_run_input`.
+        """
+        if resume and self.checkpointer is not None and (await self.graph.aget_state(config)).next:
+            return None
+        return state
 
-    def run(self, stock_ticker: str, stock_exchange: str, dest_dir: str | None=None) -> tuple[str, int]:
+    def _async_checkpointer(self) -> AsyncContextManager:
+        """
+        Return a context that yields the checkpointer of an asynchronous run (None without checkpoints):
+        the graph's checkpointer is synchronous, so every asynchronous run opens one of its event loop.
+        """
+        if self.checkpointer is None:
+            return nullcontext()
+        from utils.checkpoint import async_checkpointer
+
+        return async_checkpointer(self.checkpoint_dir)
+
+    def _end_run(self, config: dict):
+        """
+        Remove the checkpoints of a run that reached the end of the graph, as it cannot be resumed anymore.
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(config["configurable"]["thread_id"])
+
+    def run(self, stock_ticker: str, stock_exchange: str, dest_dir: str | None=None,
+            resume: bool=False) -> tuple[str, int]:
         """
         Take as input a stock ticker and the stock exchange market and return
         a detailed financial report regarding the stock.
 
         If parameter `dest_dir` is specified, saves the fetched data in the given directory.
+        If parameter `resume` is set (and the graph has a checkpointer), the latest unfinished run of the
+        stock on the same day continues from its last completed node instead of starting over.
         """
+        # compile the graph on first use
+        if self.graph is None:
+            self.build()
+        trace = self.profiler.new_trace(stock_ticker=stock_ticker, stock_exchange=stock_exchange)
         try:
-            final_state = self.graph.invoke({
+            config = self._run_config(trace, stock_ticker, resume=resume)
+            final_state = self.graph.invoke(self._run_input({
                 "messages": [],
                 "stock_ticker": stock_ticker,
                 "stock_exchange": stock_exchange
-            })
+            }, config, resume=resume), config=config)
+            self._end_run(config)
+            self.profiler.add(trace)
+            self._archive_state(final_state, trace)
             
             if dest_dir is not None:
-                # create destination directory if it does not already exist
-                if not os.path.exists(dest_dir):
-                    os.makedirs(dest_dir)
-
-                # get all dictionary-like attributes of graph state and save them in a list as tuple (attr_name, attr_value)
-                json_files = [(attr, final_state[attr]) for attr in final_state if type(attr) == dict]
-                # store each of those attributes in its own .json file inside dest_dir
-                for name, content in json_files:
-                    with open(os.path.join(dest_dir, f"{name}.json"), 'w') as f:
-                        json.dump(content, f)
-                
-                # save LLM response contents in .txt files
-                for msg in final_state['messages']:
-                    with open(os.path.join(dest_dir, f"{msg.name}.txt"), 'w') as f:
-                        f.write(msg.content)
+                self._save_state(final_state, dest_dir, trace)
+
+            # if everything went smoothly, return final report and 1 to represent 'OK' code
+            return final_state["messages"][-1].content, 1
+
+        except Exception:
+            # errors are raised to the caller (batch runs turn them into failed results, see `run_many`)
+            self.profiler.add(trace)
+            raise
+
+    async def arun(self, stock_ticker: str, stock_exchange: str, dest_dir: str | None=None,
+                   resume: bool=False) -> tuple[str, int]:
+        """
+        Asynchronous version of `run`, so that many reports can be generated concurrently
+        by a single event loop. Like `run`, it raises the errors of the run.
+        """
+        # compile the graph on first use
+        if self.graph is None:
+            self.build()
+        trace = self.profiler.new_trace(stock_ticker=stock_ticker, stock_exchange=stock_exchange)
+        try:
+            async with self._async_checkpointer() as checkpointer:
+                # looking up the run to resume reads the checkpoints, so it runs off the event loop
+                config = await asyncio.to_thread(self._run_config, trace, stock_ticker, resume)
+                if checkpointer is not None:
+                    from langgraph.constants import CONFIG_KEY_CHECKPOINTER
+                    config["configurable"][CONFIG_KEY_CHECKPOINTER] = checkpointer
+                final_state = await self.graph.ainvoke(await self._arun_input({
+                    "messages": [],
+                    "stock_ticker": stock_ticker,
+                    "stock_exchange": stock_exchange
+                }, config, resume=resume), config=config)
+                if checkpointer is not None:
+                    await checkpointer.adelete_thread(config["configurable"]["thread_id"])
+            self.profiler.add(trace)
+            self._archive_state(final_state, trace)
+
+            if dest_dir is not None:
+                self._save_state(final_state, dest_dir, trace)
 
             # if everything went smoothly, return final report and 1 to represent 'OK' code
             return final_state["messages"][-1].content, 1
 
-        except Exception as e:
-            raise e
-            # if error occured, return the error message along with 0 for 'Failed' code
-            return f"[ERROR]: {str(e)}", 0
+        except Exception:
+            self.profiler.add(trace)
+            raise
+
+    def stream(self, stock_ticker: str, stock_exchange: str, dest_dir: str | None=None,
+               resume: bool=False) -> Iterator[tuple[Literal["node", "token"], Any]]:
+        """
+        Same as `run`, but instead of returning the final report, yields progress events while
+        the graph runs: ("node", node_name) whenever a node finishes, and ("token", text) for
+        every chunk of the final report, as soon as it is generated.
+
+        If parameter `dest_dir` is specified, saves the fetched data in the given directory.
+        Parameter `resume` is the same as in `run`.
+        """
+        # compile the graph on first use
+        if self.graph is None:
+            self.build()
+        final_state = None
+        report_streamed = False
+        trace = self.profiler.new_trace(stock_ticker=stock_ticker, stock_exchange=stock_exchange)
+        config = self._run_config(trace, stock_ticker, resume=resume)
+        for mode, payload in self.graph.stream(self._run_input({
+            "messages": [],
+            "stock_ticker": stock_ticker,
+            "stock_exchange": stock_exchange
+        }, config, resume=resume), config=config, stream_mode=["updates", "messages", "values"]):
+            if mode == "updates":
+                for node_name, update in payload.items():
+                    # reports served from the LLM cache are not streamed, so yield them whole
+                    if node_name == "report_writer" and not report_streamed:
+                        message = update["messages"]
+                        yield "token", (message[-1] if isinstance(message, list) else message).content
+                    yield "node", node_name
+            elif mode == "messages":
+                # only stream the tokens of the final report
+                chunk, metadata = payload
+                if metadata.get("langgraph_node") == "report_writer" and chunk.content:
+                    report_streamed = True
+                    yield "token", chunk.content
+            else:
+                final_state = payload
+
+        self._end_run(config)
+        self.profiler.add(trace)
+        if final_state is not None:
+            self._archive_state(final_state, trace)
+        if dest_dir is not None and final_state is not None:
+            self._save_state(final_state, dest_dir, trace)
+
+    def run_many(self, stocks: list[tuple[str, str]], dest_dir: str | None=None,
+                 max_concurrency: int=4, resume: bool=False) -> dict[str, tuple[str, int]]:
+        """
+        Take as input a list of (stock ticker, stock exchange) pairs and return a detailed
+        financial report for each one of them, as a dictionary mapping each ticker to a
+        (report, status code) tuple. A ticker that is listed more than once only runs for
+        its first entry.
+
+        Price data for all the stocks is fetched with a single bulk download, and the graph
+        runs for at most `max_concurrency` stocks at the same time.
+
+        If parameter `dest_dir` is specified, saves the fetched data of each stock in its own
+        sub-directory of the given directory (or, with a columnar output format, in a single
+        batched write to the store in the given directory). Parameter `resume` is the same as in `run`.
+        """
+        from yfinance.exceptions import YFException
+        from utils.indicators import compute_indicators_frame
+        from nodes.simple_nodes import (
+            fetch_stock_prices,
+            compute_stock_price_indicators,
+            update_stock_price_indicators
+        )
+
+        # compile the graph on first use
+        if self.graph is None:
+            self.build()
+
+        # results are keyed by ticker, so a ticker listed twice would overwrite the result of its first run
+        exchanges = {}
+        for ticker, exchange in stocks:
+            if ticker in exchanges:
+                logger.warning("Stock %s is listed more than once, only its first entry (%s) is run",
+                               ticker, exchanges[ticker])
+            else:
+                exchanges[ticker] = exchange
+        stocks = list(exchanges.items())
+
+        # every run gets its own trace
+        traces = [self.profiler.new_trace(stock_ticker=ticker, stock_exchange=exchange) for ticker, exchange in stocks]
+        configs = [
+            {"max_concurrency": max_concurrency, **self._run_config(trace, ticker, resume=resume)}
+            for trace, (ticker, _) in zip(traces, stocks)
+        ]
+        # resumed runs continue from their checkpoints, so their prices are not downloaded again
+        resumed = {ticker for (ticker, _), config in zip(stocks, configs) if resume and self._resumable(config)}
+
+        # errors of the bulk steps, which are recorded in the state and trace of the stocks they concern
+        # (the runs of those stocks then fetch their prices and compute their indicators on their own)
+        errors = {ticker: [] for ticker, _ in stocks}
+
+        # fetch the price data of all the stocks with a single call and split it per ticker
+        tickers = [ticker for ticker, _ in stocks if ticker not in resumed]
+        try:
+            frames = fetch_stock_prices(tickers, cache=self.cache, attempts=self.retry_attempts) if tickers else {}
+        except (OSError, ValueError, KeyError, sqlite3.Error, YFException) as e:
+            logger.warning("Bulk download of the prices of %s failed: %r", ", ".join(tickers), e)
+            for ticker in tickers:
+                errors[ticker].append(f"fetch_stock_prices: {e!r}")
+            frames = {}
+
+        # compute the technical indicators of all the stocks at once (unless they are updated incrementally)
+        indicators = None
+        if not self.configurable["incremental_indicators"]:
+            try:
+                indicators = compute_indicators_frame(frames)
+            except (ValueError, KeyError, IndexError) as e:
+                logger.warning("Bulk computation of the indicators of %s failed: %r", ", ".join(frames), e)
+                for ticker in frames:
+                    errors[ticker].append(f"compute_indicators_frame: {e!r}")
+
+        states = []
+        for (ticker, exchange), trace in zip(stocks, traces):
+            state = {
+                "messages": [],
+                "stock_ticker": ticker,
+                "stock_exchange": exchange
+            }
+            # stocks whose prices are missing from the bulk download will fetch them on their own
+            if ticker in frames:
+                try:
+                    if self.configurable["incremental_indicators"]:
+                        state["stock_price_indicators"] = update_stock_price_indicators(
+                            ticker, frames[ticker], self.cache, verify=self.configurable["verify_indicators"]
+                        )
+                    else:
+                        ticker_indicators = None
+                        if indicators is not None:
+                            # keep only the dates on which the stock was traded
+                            ticker_indicators = indicators.xs(ticker, axis=1, level="ticker").reindex(frames[ticker].index)
+                        state["stock_price_indicators"] = compute_stock_price_indicators(frames[ticker], ticker_indicators)
+                except (ValueError, KeyError, IndexError, sqlite3.Error) as e:
+                    logger.warning("Computation of the indicators of %s failed: %r", ticker, e)
+                    errors[ticker].append(f"compute_stock_price_indicators: {e!r}")
+            if errors[ticker]:
+                state["errors"] = errors[ticker]
+                for error in errors[ticker]:
+                    trace.add_error(error)
+            states.append(state)
+
+        final_states = self.graph.batch(
+            [
+                None if state["stock_ticker"] in resumed else self._run_input(state, config)
+                for state, config in zip(states, configs)
+            ],
+            config=configs, 
+            return_exceptions=True
+        )
+
+        results = {}
+        for (ticker, _), final_state, trace, config in zip(stocks, final_states, traces, configs):
+            self.profiler.add(trace)
+            # if error occured, store the error message along with 0 for 'Failed' code
+            if isinstance(final_state, Exception):
+                results[ticker] = (f"[ERROR]: {str(final_state)}", 0)
+                continue
+
+            self._end_run(config)
+            self._archive_state(final_state, trace)
+            if dest_dir is not None:
+                if self.output_format == "files":
+                    self._save_state(final_state, os.path.join(dest_dir, ticker), trace)
+                else:
+                    self._save_state(final_state, dest_dir, trace, write=False)
+            results[ticker] = (final_state["messages"][-1].content, 1)
+
+        self.flush()
+        return results
+
+    def store(self, dest_dir: str) -> "ReportStore":
+        """
+        Return the columnar store in the given directory, opening it on first use.
+        """
+        from utils.store import ReportStore
+
+        with self._stores_lock:
+            if dest_dir not in self.stores:
+                self.stores[dest_dir] = ReportStore(dest_dir, format=self.output_format, batch_size=self.store_batch_size)
+            return self.stores[dest_dir]
+
+    def flush(self):
+        """
+        Write the runs buffered by the columnar stores (see `store_batch_size`).
+        """
+        with self._stores_lock:
+            stores = list(self.stores.values())
+        for store in stores:
+            store.flush()
+
+    def _archive_state(self, final_state: dict, trace: "RunTrace"):
+        """
+        Add the final state of a run to the archive (if there is one), so that the next runs of the
+        stock can reuse its responses.
+        """
+        if self.archive is not None:
+            self.archive.put(final_state, run_id=trace.run_id, model=self.model)
+
+    def _save_state(self, final_state: dict, dest_dir: str, trace: "RunTrace | None"=None, write: bool=True):
+        """
+        Save the fetched data and the LLM responses of a final graph state in the given directory,
+        along with the trace of the run (if given).
+        """
+        from states.records import PriceIndicators, to_json
+
+        # columnar output: the run is buffered and written along with the rest of its batch
+        if self.output_format != "files":
+            self.store(dest_dir).add(final_state, trace, write=write)
+            return
+
+        # create destination directory if it does not already exist
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir)
+
+        if trace is not None:
+            trace.save(os.path.join(dest_dir, "trace.json"))
+
+        # get all dictionary-like attributes (and records) of graph state and save them in a list as tuple (attr_name, attr_value)
+        # (reused responses are saved along with the rest of the LLM responses)
+        json_files = [
+            (attr, final_state[attr]) for attr in final_state
+            if isinstance(final_state[attr], (dict, PriceIndicators)) and attr not in ["reused_responses", "reused_origins"]
+        ]
+        # store each of those attributes in its own .json file inside dest_dir
+        for name, content in json_files:
+            with open(os.path.join(dest_dir, f"{name}.json"), 'w') as f:
+                json.dump(content, f, default=to_json)
+        
+        # save LLM response contents in .txt files
+        for msg in final_state['messages']:
+            with open(os.path.join(dest_dir, f"{msg.name}.txt"), 'w') as f:
+                f.write(msg.content)
+
+
+def read_stocks_file(stocks_file: str, default_exchange: str) -> list[tuple[str, str]]:
+    """
+    Read a watchlist file containing one stock per line, either as `TICKER` or as
+    `TICKER:EXCHANGE`, and return it as a list of (stock ticker, stock exchange) pairs.
+    Empty lines and lines starting with '#' are ignored.
+    """
+    if not os.path.exists(stocks_file):
+        raise FileNotFoundError(f"File '{stocks_file}' does not exist!")
+
+    stocks = []
+    with open(stocks_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            # stocks without an explicit exchange use the default one
+            ticker, _, exchange = line.partition(':')
+            stocks.append((ticker.strip(), exchange.strip() or default_exchange))
+    return stocks
+
+
+def node_model(value: str) -> tuple[str, str]:
+    """
+    Parse a NODE=MODEL command line argument (NODE being an LLM node or "analyses").
+    """
+    node, _, model = value.partition("=")
+    if not node or not model:
+        raise argparse.ArgumentTypeError(f"'{value}' is not of the form NODE=MODEL")
+    if node not in LLM_NODES + ["analyses"]:
+        raise argparse.ArgumentTypeError(f"'{node}' is not one of {', '.join(LLM_NODES + ['analyses'])}")
+    return node, model
+
+
+def model_options(args: argparse.Namespace) -> dict:
+    """
+    Returns the per-node models and the router of the command line arguments, as FinanceGraph
+    parameters. Models are given by name, or by model file path when using llama.cpp.
+    """
+    key = "model_path" if args.serving_type == "llama-cpp" else "model_name"
+    router = None
+    if args.router_model is not None:
+        router = {key: args.router_model}
+        # the router module is only imported when the graph is created, so its default is applied there
+        if args.router_max_tokens is not None:
+            router["max_context_tokens"] = args.router_max_tokens
+    return {"node_models": {node: {key: model} for node, model in args.node_models or []} or None, "router": router}
 
 
 def parse_input():
@@ -147,9 +754,9 @@ def parse_input():
         "--serving-type",
         action="store",
         dest="serving_type",
-        choices=["ollama", "hugging-face", "llama-cpp"],
+        choices=["ollama", "hugging-face", "llama-cpp", "model-server"],
         required=True,
-        help="LLM serving method",
+        help="LLM serving method (model-server uses a model shared through a local worker server, see model_server.py)",
     )
     parser.add_argument(
         "-m",
@@ -171,7 +778,7 @@ def parse_input():
         action="store",
         dest="url",
         required=False,
-        help="Ollama ulr (specify only when using Ollama for model serving)",
+        help="Ollama or worker server ulr (specify only when using Ollama or model-server for model serving)",
     )
     parser.add_argument(
         "-c",
@@ -181,14 +788,20 @@ def parse_input():
         required=False,
         help="Configuration (.json) file  with the necessary initialization arguments of LLM interface",
     )
-    parser.add_argument(
+    stock_group = parser.add_mutually_exclusive_group(required=True)
+    stock_group.add_argument(
         "-s",
         "--stock",
         action="store",
         dest="stock",
-        required=True,
         help="The ticker of the desired stock (i.e. AAPL, GOOG, etc.)",
     )
+    stock_group.add_argument(
+        "--stocks-file",
+        action="store",
+        dest="stocks_file",
+        help="File containing one stock per line (as TICKER or TICKER:EXCHANGE), for which reports will be generated in batch",
+    )
     parser.add_argument(
         "-e",
         "--exchange",
@@ -204,7 +817,251 @@ def parse_input():
         required=False,
         help="Destination directory to which the fetched data will be stored (if not specified, data won't be stored)"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--max-concurrency",
+        action="store",
+        dest="max_concurrency",
+        type=int,
+        default=4,
+        required=False,
+        help="Maximum number of stocks processed at the same time when using --stocks-file (default is 4)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        action="store",
+        dest="token_budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        required=False,
+        help=f"Maximum number of tokens that the financial data of each LLM prompt may use (default is {DEFAULT_TOKEN_BUDGET})",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        dest="stream",
+        help="Show the progress of each step and print the final report while it is being generated (ignored with --stocks-file)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        dest="profile",
+        help="Print a per-node breakdown of latency, fetched and output bytes, LLM tokens and peak memory after the run",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        dest="profile_memory",
+        help="Same as --profile, but runs the steps one at a time, so that the peak memory of every step is measured",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        dest="cache_dir",
+        required=False,
+        help="Directory of the on-disk market data cache (if not specified, market data won't be cached)",
+    )
+    parser.add_argument(
+        "--incremental-indicators",
+        action="store_true",
+        dest="incremental_indicators",
+        help="Update technical indicators from their state persisted in the cache, instead of recomputing them (requires --cache-dir)",
+    )
+    parser.add_argument(
+        "--verify-indicators",
+        action="store_true",
+        dest="verify_indicators",
+        help="Check incrementally updated indicators against a full recompute and warn about differences",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        action="store",
+        dest="llm_cache",
+        choices=["memory", "sqlite"],
+        required=False,
+        help="Cache LLM responses in memory or on disk (sqlite requires --cache-dir), so that repeated prompts skip the LLM call",
+    )
+    parser.add_argument(
+        "--llm-cache-ttl",
+        action="store",
+        dest="llm_cache_ttl",
+        type=float,
+        required=False,
+        help="Number of seconds for which cached LLM responses are reused (if not specified, they never expire)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        action="store",
+        dest="cache_ttl",
+        type=float,
+        default=3600,
+        required=False,
+        help="Number of seconds for which cached market data is considered fresh (default is 3600)",
+    )
+    parser.add_argument(
+        "--article-ttl",
+        action="store",
+        dest="article_ttl",
+        type=float,
+        required=False,
+        help="Number of seconds after which stored articles are revalidated with a conditional request (default is 86400)",
+    )
+    parser.add_argument(
+        "--prompt-cache",
+        action="store",
+        dest="prompt_cache",
+        choices=["ram", "disk"],
+        required=False,
+        help="Reuse the llama.cpp model state of shared prompt prefixes from memory or disk (disk requires --cache-dir)",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        action="store",
+        dest="archive_dir",
+        required=False,
+        help="Directory of the archive of past runs: analyses whose inputs have not meaningfully changed since the last run of the stock reuse its responses",
+    )
+    parser.add_argument(
+        "--change-tolerance",
+        action="store",
+        dest="change_tolerance",
+        type=float,
+        required=False,
+        help="Relative change of an indicator or a financial metric that counts as meaningful (default is 0.02)",
+    )
+    parser.add_argument(
+        "--reuse-max-age",
+        action="store",
+        dest="reuse_max_age",
+        type=float,
+        required=False,
+        help="Number of seconds for which the archived analyses of a run are reused (default is 7 days)",
+    )
+    parser.add_argument(
+        "--output-format",
+        action="store",
+        dest="output_format",
+        choices=["files", "parquet", "arrow"],
+        default="files",
+        required=False,
+        help="Save the fetched data as .json/.txt files per run, or append it to columnar datasets in --dest-dir (requires pyarrow)",
+    )
+    parser.add_argument(
+        "--store-batch-size",
+        action="store",
+        dest="store_batch_size",
+        type=int,
+        default=1,
+        required=False,
+        help="Number of runs written to the columnar store at once (default is 1, while --stocks-file runs are written in a single batch)",
+    )
+    parser.add_argument(
+        "--process-workers",
+        action="store",
+        dest="process_workers",
+        type=int,
+        default=0,
+        required=False,
+        help="Number of worker processes that parse the articles and compute the indicators, so that batch runs use all the cpu cores (default is 0, which does this work in the main process)",
+    )
+    parser.add_argument(
+        "--node-model",
+        action="append",
+        dest="node_models",
+        type=node_model,
+        required=False,
+        metavar="NODE=MODEL",
+        help="Model of an LLM node (technical_analysis, sentiment_analysis, valuation_analysis, report_writer, or analyses for all three), served like the default one. May be repeated",
+    )
+    parser.add_argument(
+        "--router-model",
+        action="store",
+        dest="router_model",
+        required=False,
+        help="Small model, served like the default one, that answers the short analysis prompts (long prompts, and the ones it fails, go to the node's model)",
+    )
+    parser.add_argument(
+        "--router-max-tokens",
+        action="store",
+        dest="router_max_tokens",
+        type=int,
+        required=False,
+        help="Maximum number of prompt tokens that are sent to the --router-model (default is the one of the router, see utils/llm_router.py)",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        action="store",
+        dest="checkpoint_dir",
+        required=False,
+        help="Directory of the checkpoints of the runs, saved after every step so that failed runs can be resumed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        help="Continue the unfinished run of each stock from its last completed step, instead of starting over (requires --checkpoint-dir)",
+    )
+    parser.add_argument(
+        "--retry-attempts",
+        action="store",
+        dest="retry_attempts",
+        type=int,
+        default=DEFAULT_RETRY_ATTEMPTS,
+        required=False,
+        help=f"Number of attempts of each LLM step and data request that fails with a transient error (default is {DEFAULT_RETRY_ATTEMPTS})",
+    )
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_dir is None:
+        parser.error("--resume requires --checkpoint-dir")
+    return args
+
+
+def print_profile(profiler: "Profiler"):
+    """
+    Print the per-node latency breakdown (along with fetched bytes, tokens and memory) of all runs.
+    """
+    table = Table(title=f"Per-node profile ({profiler.runs} runs)")
+    for column in ["node", "runs", "mean time (s)", "max time (s)", "fetched (KB)", "output (KB)",
+                   "prompt tokens", "completion tokens", "errors", "peak memory (MB)"]:
+        table.add_column(column, justify="left" if column == "node" else "right")
+
+    aggregate = profiler.aggregate()
+    for node, stats in sorted(aggregate.items(), key=lambda item: -item[1]["wall_time"]):
+        peak = stats["max_peak_memory"]
+        table.add_row(
+            node, str(stats["count"]), f"{stats['mean_wall_time']:.3f}", f"{stats['max_wall_time']:.3f}",
+            f"{stats['bytes_fetched'] / 1024:.1f}", f"{stats['output_bytes'] / 1024:.1f}", str(stats["prompt_tokens"]),
+            str(stats["completion_tokens"]), str(stats["errors"]), f"{peak / 2**20:.1f}" if peak is not None else "-"
+        )
+    console.print(table)
+
+    # peak memory is process-wide, so it is not measured for the steps that ran along with others
+    unmeasured = sum(stats["count"] - stats["memory_count"] for stats in aggregate.values())
+    if unmeasured:
+        console.print(
+            f"Peak memory was not measured for {unmeasured} of {sum(stats['count'] for stats in aggregate.values())} "
+            "steps, which ran at the same time as other steps (use --profile-memory to run the steps one at a time)"
+        )
+
+
+def print_routing(route_stats: "RouteStats"):
+    """
+    Print the calls, latency and tokens of every route of the router, along with its savings.
+    """
+    stats = route_stats.to_dict()
+    table = Table(title="LLM routing")
+    for column in ["route", "calls", "mean time (s)", "prompt tokens", "completion tokens"]:
+        table.add_column(column, justify="left" if column == "route" else "right")
+    for route, counters in stats["routes"].items():
+        table.add_row(
+            route, str(counters["calls"]), f"{counters['mean_wall_time']:.3f}",
+            str(counters["prompt_tokens"]), str(counters["completion_tokens"])
+        )
+    console.print(table)
+
+    saved = f"Tokens not processed by the large models: {stats['saved_tokens']}"
+    if stats["saved_time"] is not None:
+        saved += f" (about {stats['saved_time']:.1f} s of large-model time saved)"
+    console.print(saved)
 
 
 def main(args):
@@ -215,20 +1072,84 @@ def main(args):
         model_name=args.model_name, 
         url=args.url, 
         model_path=args.model_path,
-        config_file=args.config_file
+        config_file=args.config_file,
+        cache_dir=args.cache_dir,
+        cache_ttl=args.cache_ttl,
+        article_ttl=args.article_ttl,
+        token_budget=args.token_budget,
+        incremental_indicators=args.incremental_indicators,
+        verify_indicators=args.verify_indicators,
+        llm_cache=args.llm_cache,
+        llm_cache_ttl=args.llm_cache_ttl,
+        prompt_cache=args.prompt_cache,
+        output_format=args.output_format,
+        store_batch_size=args.store_batch_size,
+        archive_dir=args.archive_dir,
+        change_tolerance=args.change_tolerance,
+        reuse_max_age=args.reuse_max_age,
+        checkpoint_dir=args.checkpoint_dir,
+        retry_attempts=args.retry_attempts,
+        process_workers=args.process_workers,
+        profile="memory" if args.profile_memory else "nodes" if args.profile else None,
+        **model_options(args)
     )
     fg.build()
-    
-    with console.status("[cyan]Generating report..."):
-        response, success = fg.run(stock_ticker=args.stock, stock_exchange=args.exchange, dest_dir=args.dest_dir)
-
-    # if no error occured, return financial report along with success message in green color
-    if success:
-        console.print("[green bold]Report Generated Successfully!")
-        print(response)
+
+    # start tracing memory allocations, so that the peak memory of each node is recorded
+    if fg.profile is not None:
+        tracemalloc.start()
+
+    # batch mode: generate a report for every stock in the given file
+    if args.stocks_file is not None:
+        stocks = read_stocks_file(args.stocks_file, default_exchange=args.exchange)
+        with console.status(f"[cyan]Generating {len(stocks)} reports..."):
+            results = fg.run_many(
+                stocks, dest_dir=args.dest_dir, max_concurrency=args.max_concurrency, resume=args.resume
+            )
+
+        for ticker, (response, success) in results.items():
+            if success:
+                console.print(f"[green bold]Report for {ticker} Generated Successfully!")
+                print(response)
+            else:
+                console.print(f"[red bold]{ticker}: {response}")
+
+    # streaming mode: show progress of each node and print the report tokens as they arrive
+    elif args.stream:
+        streaming_report = False
+        for kind, payload in fg.stream(stock_ticker=args.stock, stock_exchange=args.exchange, dest_dir=args.dest_dir,
+                                        resume=args.resume):
+            if kind == "node":
+                if streaming_report:
+                    print()
+                    streaming_report = False
+                console.print(f"[cyan]Finished step: {payload}")
+            else:
+                streaming_report = True
+                print(payload, end="", flush=True)
+
     else:
-        # if error occurred, return the error message in bold red color
-        console.print(f"[red bold]{response}")
+        with console.status("[cyan]Generating report..."):
+            response, success = fg.run(stock_ticker=args.stock, stock_exchange=args.exchange, dest_dir=args.dest_dir,
+                                       resume=args.resume)
+
+        # if no error occured, return financial report along with success message in green color
+        if success:
+            console.print("[green bold]Report Generated Successfully!")
+            print(response)
+        else:
+            # if error occurred, return the error message in bold red color
+            console.print(f"[red bold]{response}")
+
+    # write the runs that the columnar stores still buffer (see --store-batch-size)
+    fg.flush()
+    if fg.llm_cache is not None:
+        stats = fg.llm_cache.stats()
+        console.print(f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses")
+    if fg.profile is not None:
+        print_profile(fg.profiler)
+        if fg.route_stats is not None:
+            print_routing(fg.route_stats)
     # except Exception as e:
         # console.print(f"[red bold][ERROR]:{e}")
 
@@ -0,0 +1,269 @@
+"""
+File containing a local model worker server: it loads a model once and serves it through an
+OpenAI-compatible chat completions api, so that several FinanceGraph processes (using the
+'model-server' serving type) share a single copy of the model in memory.
+"""
+import json
+import time
+import uuid
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rich.console import Console
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from utils.utils import llm_endpoint
+
+console = Console()
+
+# default port of the model server
+DEFAULT_PORT = 8765
+# fields that hold the sampling options of a request in the chat models of each serving type
+# (ChatHuggingFace keeps them in the endpoint of its `llm` field)
+OPTION_FIELDS = {
+    "temperature": ("temperature",),
+    "max_tokens": ("max_tokens", "num_predict", "max_new_tokens")
+}
+
+
+def to_messages(messages: list[dict]) -> list[BaseMessage]:
+    """
+    Converts OpenAI-style chat messages to langchain messages.
+    """
+    types = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+    return [types.get(message.get("role"), HumanMessage)(content=message.get("content") or "") for message in messages]
+
+
+def request_options(request: dict) -> tuple[dict, list[str] | None]:
+    """
+    Returns the sampling options (temperature and max_tokens) and the stop sequences of an
+    OpenAI-style chat completion request, raising a ValueError if any of them is invalid.
+    """
+    options = {}
+    temperature = request.get("temperature")
+    if temperature is not None:
+        if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not 0 <= temperature <= 2:
+            raise ValueError("'temperature' must be a number between 0 and 2")
+        options["temperature"] = float(temperature)
+    max_tokens = request.get("max_tokens", request.get("max_completion_tokens"))
+    if max_tokens is not None:
+        if isinstance(max_tokens, bool) or not isinstance(max_tokens, int) or max_tokens < 1:
+            raise ValueError("'max_tokens' must be a positive integer")
+        options["max_tokens"] = max_tokens
+
+    stop = request.get("stop")
+    if isinstance(stop, str):
+        stop = [stop]
+    elif stop is not None and not (isinstance(stop, list) and all(isinstance(s, str) for s in stop)):
+        raise ValueError("'stop' must be a string or a list of strings")
+    return options, stop or None
+
+
+def with_options(model: BaseChatModel, options: dict) -> BaseChatModel:
+    """
+    Returns a copy of a chat model that samples with the given options (the model itself if there
+    are none). The copy shares the client (and the loaded weights) of the model. Raises a ValueError
+    if the model has no field for one of the options.
+    """
+    if not options:
+        return model
+
+    def copy(target):
+        fields = type(target).model_fields
+        update = {}
+        for option, value in options.items():
+            field = next((field for field in OPTION_FIELDS[option] if field in fields), None)
+            if field is None:
+                return None
+            update[field] = value
+        return target.model_copy(update=update)
+
+    configured = copy(model)
+    if configured is None and "llm" in type(model).model_fields:
+        llm = copy(model.llm)
+        configured = model.model_copy(update={"llm": llm}) if llm is not None else None
+    if configured is None:
+        raise ValueError(f"The served model does not support the options {', '.join(options)}")
+    return configured
+
+
+def make_handler(model: BaseChatModel, model_name: str) -> type[BaseHTTPRequestHandler]:
+    """
+    Returns the request handler class serving the given model.
+    """
+    class ModelRequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_event(self, payload: dict | str):
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            self.wfile.write(f"data: {data}\n\n".encode())
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/v1/models":
+                self._send_json(200, {"object": "list", "data": [{"id": model_name, "object": "model"}]})
+            elif self.path.rstrip("/") == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path '{self.path}'"}})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v1/chat/completions":
+                self._send_json(404, {"error": {"message": f"Unknown path '{self.path}'"}})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                messages = to_messages(request.get("messages", []))
+                options, stop = request_options(request)
+                served = with_options(model, options)
+            except Exception as e:
+                self._send_json(400, {"error": {"message": f"Invalid request: {e}"}})
+                return
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            # calls to the model are serialized by the model itself (if it is not thread-safe)
+            if request.get("stream", False):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                # the stream has no length, so the connection is closed when it ends
+                self.close_connection = True
+                error = None
+                try:
+                    for chunk in served.stream(messages, stop=stop):
+                        self._send_event({
+                            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model_name,
+                            "choices": [{"index": 0, "delta": {"role": "assistant", "content": chunk.content}, "finish_reason": None}]
+                        })
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client went away, so there is no one to report to
+                    return
+                except Exception as e:
+                    error = e
+                try:
+                    if error is None:
+                        self._send_event({
+                            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model_name,
+                            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                        })
+                    else:
+                        # the status has already been sent, so the error is reported as an event of the stream
+                        self._send_event({"error": {"message": str(error), "type": "server_error"}})
+                    self._send_event("[DONE]")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                return
+
+            try:
+                response = served.invoke(messages, stop=stop)
+            except Exception as e:
+                self._send_json(500, {"error": {"message": str(e)}})
+                return
+            usage = response.usage_metadata or {}
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model_name,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": response.content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": usage.get("input_tokens", 0),
+                    "completion_tokens": usage.get("output_tokens", 0),
+                    "total_tokens": usage.get("total_tokens", 0)
+                }
+            })
+
+    return ModelRequestHandler
+
+
+def serve(model: BaseChatModel, host: str="127.0.0.1", port: int=DEFAULT_PORT, model_name: str="local"):
+    """
+    Serve a model until the process is interrupted.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(model, model_name))
+    server.daemon_threads = True
+    console.print(f"[green bold]Serving model '{model_name}' on http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="ModelServer")
+    parser.add_argument(
+        "--serving-type",
+        action="store",
+        dest="serving_type",
+        choices=["ollama", "hugging-face", "llama-cpp"],
+        required=True,
+        help="LLM serving method of the served model",
+    )
+    parser.add_argument(
+        "-m",
+        "--model-name",
+        action="store",
+        dest="model_name",
+        required=False,
+        help="LLM that will be served (when using llama.cpp for model serving, this argument is ignored)",
+    )
+    parser.add_argument(
+        "--model-path",
+        action="store",
+        dest="model_path",
+        required=False,
+        help="Path of the llama.cpp model file (specify only when using llama.cpp for model serving)",
+    )
+    parser.add_argument(
+        "--url",
+        action="store",
+        dest="url",
+        required=False,
+        help="Ollama ulr (specify only when using Ollama for model serving)",
+    )
+    parser.add_argument(
+        "--host",
+        action="store",
+        dest="host",
+        default="127.0.0.1",
+        required=False,
+        help="Address on which the server listens (default is 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        action="store",
+        dest="port",
+        type=int,
+        default=DEFAULT_PORT,
+        required=False,
+        help=f"Port on which the server listens (default is {DEFAULT_PORT})",
+    )
+    return parser.parse_args()
+
+
+def main(args):
+    config = {"model_path": args.model_path if args.model_path is not None else ""}
+    if args.model_name is not None:
+        config["model_name"] = args.model_name
+    if args.url is not None:
+        config["url"] = args.url
+
+    with console.status("[cyan]Loading model..."):
+        model = llm_endpoint(type=args.serving_type, config=config)
+    serve(model, host=args.host, port=args.port, model_name=args.model_name or "local")
+
+
+if __name__ == "__main__":
+    ARGS = parse_input()
+    main(ARGS)
@@ -1,31 +1,241 @@
 """
 File containing class implementation for nodes that perform LLM calls
 """
+import asyncio
+from typing import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+
 from langchain_core.runnables import Runnable, RunnableConfig
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
 
 from states.graph_state import GraphState
+from utils.llm_cache import LLMResponseCache, llm_cache_key
+from utils.context import estimate_tokens, render_contexts, DEFAULT_TOKEN_BUDGET
+
+
+@contextmanager
+def llm_slot(config: RunnableConfig | None):
+    """
+    Hold one of the LLM slots of the run (a semaphore in the 'llm_slots' key of the runnable config),
+    which limits the number of LLM calls that run at the same time across graphs. Without slots,
+    calls are not limited.
+    """
+    slots = (config or {}).get("configurable", {}).get("llm_slots")
+    if slots is None:
+        yield
+        return
+    with slots:
+        yield
+
+
+@asynccontextmanager
+async def allm_slot(config: RunnableConfig | None):
+    """
+    Asynchronous version of `llm_slot`.
+    """
+    slots = (config or {}).get("configurable", {}).get("llm_slots")
+    if slots is None:
+        yield
+        return
+    # wait for a slot without blocking the event loop
+    await asyncio.to_thread(slots.acquire)
+    try:
+        yield
+    finally:
+        slots.release()
 
 
 class LLMNode:
     """
     Class implementation for graph nodes that use LLMs
+
+    The fetched data of the state is rendered to the texts that the prompt uses (within the
+    'context_token_budget' of the runnable config) only when the prompt is rendered, and the
+    number of tokens of each text is added to the 'context_tokens' of the state.
+
+    If a response cache is given, responses are stored under a hash of the rendered prompt
+    and the model, and LLM calls with an already answered prompt are skipped. Responses of a
+    previous run that the state marks as reusable (see `detect_changes`) skip the call as well.
     """
-    def __init__(self, runnable: Runnable, prompt: ChatPromptTemplate, name: str | None=None):
-        self.llm = prompt | runnable
+    def __init__(self, runnable: Runnable, prompt: ChatPromptTemplate, name: str | None=None,
+                 cache: LLMResponseCache | None=None):
+        self.prompt = prompt
+        self.runnable = runnable
         self.name = "llm_node" if name is None else name
+        self.cache = cache
 
     def __call__(self, state: GraphState, config: RunnableConfig | None=None) -> dict:
         """
-        Make LLM call based on input state and update the state messages list with the 
+        Make LLM call based on input state and update the state messages list with the
         response.
         """
-        # get the response from the LLM
-        response = self.llm.invoke(state)
+        return self.invoke(state, config)
+
+    async def __acall__(self, state: GraphState, config: RunnableConfig | None=None) -> dict:
+        """
+        Asynchronous version of `__call__`.
+        """
+        return await self.ainvoke(state, config)
+
+    def invoke(self, state: GraphState, config: RunnableConfig | None=None) -> dict:
+        """
+        Make LLM call based on input state and return the state update with the response.
+        """
+        reused = self._reused(state)
+        if reused is not None:
+            return self._to_update(self._cached_message(reused, reused=True))
+
+        messages, key, tokens = self._render(state, config)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._to_update(self._cached_message(cached), tokens)
+
+        # get the response from the LLM (passing the config so that callbacks, i.e. token streaming, work)
+        with llm_slot(config):
+            response = self.runnable.invoke(messages, config)
+        if self.cache is not None:
+            self.cache.put(key, self._content(response))
+        return self._to_update(self._with_usage(response, messages), tokens)
+
+    async def ainvoke(self, state: GraphState, config: RunnableConfig | None=None) -> dict:
+        """
+        Asynchronous version of `invoke`.
+        """
+        reused = self._reused(state)
+        if reused is not None:
+            return self._to_update(self._cached_message(reused, reused=True))
+
+        messages, key, tokens = self._render(state, config)
+        if self.cache is not None:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return self._to_update(self._cached_message(cached), tokens)
+
+        async with allm_slot(config):
+            response = await self.runnable.ainvoke(messages, config)
+        if self.cache is not None:
+            await self.cache.aput(key, self._content(response))
+        return self._to_update(self._with_usage(response, messages), tokens)
+
+    def stream(self, state: GraphState, config: RunnableConfig | None=None) -> Iterator[str]:
+        """
+        Make LLM call based on input state and yield the text of the response as it is generated.
+        """
+        reused = self._reused(state)
+        if reused is not None:
+            yield reused
+            return
 
+        messages, key, _ = self._render(state, config)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        with llm_slot(config):
+            for chunk in self.runnable.stream(messages, config):
+                chunks.append(self._content(chunk))
+                yield chunks[-1]
+        if self.cache is not None:
+            self.cache.put(key, "".join(chunks))
+
+    async def astream(self, state: GraphState, config: RunnableConfig | None=None) -> AsyncIterator[str]:
+        """
+        Asynchronous version of `stream`.
+        """
+        reused = self._reused(state)
+        if reused is not None:
+            yield reused
+            return
+
+        messages, key, _ = self._render(state, config)
+        if self.cache is not None:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        async with allm_slot(config):
+            async for chunk in self.runnable.astream(messages, config):
+                chunks.append(self._content(chunk))
+                yield chunks[-1]
+        if self.cache is not None:
+            await self.cache.aput(key, "".join(chunks))
+
+    @staticmethod
+    def _inputs(state: GraphState) -> dict:
+        """
+        Prepare the prompt inputs from the state. Previous LLM responses are given as plain text,
+        without message metadata (i.e. ids), so that identical responses render identical prompts.
+        """
+        messages = state.get("messages", [])
+        return {
+            **state,
+            "messages": "\n\n".join(f"{msg.name}:\n{msg.content}" if msg.name else msg.content for msg in messages)
+        }
+
+    def _render(self, state: GraphState, config: RunnableConfig | None=None) -> tuple[list[BaseMessage], str | None, dict]:
+        """
+        Render the prompt messages for the input state and compute their cache key (None when
+        there is no cache), along with the number of tokens of the texts of the fetched data.
+        """
+        budget = (config or {}).get("configurable", {}).get("context_token_budget", DEFAULT_TOKEN_BUDGET)
+        contexts = render_contexts(state, self.prompt.input_variables, budget=budget)
+        messages = self.prompt.invoke({**self._inputs(state), **contexts}).to_messages()
+        tokens = {name: estimate_tokens(text) for name, text in contexts.items()}
+        return messages, llm_cache_key(messages, self.runnable) if self.cache is not None else None, tokens
+
+    def _reused(self, state: GraphState) -> str | None:
+        """
+        Return the response of a previous run that the state marks as reusable for this node, if any.
+        """
+        return (state.get("reused_responses") or {}).get(self.name)
+
+    @staticmethod
+    def _cached_message(content: str, reused: bool=False) -> AIMessage:
+        """
+        Create the response message for a cached (or reused) response (no tokens were spent on it).
+        """
+        return AIMessage(
+            content=content,
+            response_metadata={"reused": True} if reused else {"cached": True},
+            usage_metadata={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        )
+
+    @staticmethod
+    def _with_usage(response: str | BaseMessage, messages: list[BaseMessage]) -> str | BaseMessage:
+        """
+        Estimate the token usage of a response whose model does not report it.
+        """
+        if isinstance(response, AIMessage) and not response.usage_metadata:
+            input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+            output_tokens = estimate_tokens(str(response.content))
+            response.usage_metadata = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        return response
+
+    @staticmethod
+    def _content(response: str | BaseMessage) -> str:
+        return response if type(response) == str else response.content
+
+    def _to_update(self, response: str | BaseMessage, context_tokens: dict | None=None) -> dict:
+        """
+        Convert an LLM response to a state update, naming the message after the node, along with
+        the number of tokens of the texts of the fetched data in its prompt (if any).
+        """
+        update = {"context_tokens": context_tokens} if context_tokens else {}
         # handle different types of responses
         if type(response) == str:
-            return {"messages": [AIMessage(content=response)]}
+            return {**update, "messages": [AIMessage(content=response, name=self.name)]}
         else:
-            return {"messages": response}
+            response.name = self.name
+            return {**update, "messages": response}
+
@@ -2,103 +2,234 @@
 File containing functions that will be used as deterministic nodes in the workflow graph
 """
 import os
+import time
+import logging
+import numpy as np
 import pandas as pd
 import datetime as dt
-import yfinance as yf
 
 from typing import TypedDict
+from collections import defaultdict
 
-from ta.momentum import RSIIndicator, StochasticOscillator
-from ta.trend import MACD
-from ta.volume import volume_weighted_average_price
+from langchain_core.runnables import RunnableConfig
 
-from utils.utils import extract_text_from_url
+from utils.utils import (
+    fetch_articles,
+    afetch_articles,
+    ARTICLE_MAX_WORKERS,
+    ARTICLE_TIMEOUT,
+    ARTICLE_DEADLINE
+)
+from utils.cache import MarketDataCache
+from utils.retry import DEFAULT_RETRY_ATTEMPTS
+from utils.process_pool import run_in_pool
+from utils.data_access import yahoo_download, yahoo_info, serpapi_search, run_blocking
+from utils.indicators import (
+    compute_stock_price_indicators,
+    IncrementalIndicators,
+    INDICATORS,
+    INDICATOR_STATE_VERSION
+)
+from utils.archive import (
+    changed_inputs,
+    input_fingerprints,
+    ANALYSIS_INPUTS,
+    DEFAULT_CHANGE_TOLERANCE
+)
+from utils.context import fit_articles, DEFAULT_TOKEN_BUDGET
+from states.records import IndicatorSeries, PriceIndicators, PriceSeries, Statement, intern_text
 
-import serpapi
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-def get_stock_prices(state: TypedDict) -> TypedDict: # type:ignore
+
+# number of weeks of price history fetched for every stock
+PRICE_HISTORY_WEEKS = 24*3
+
+
+def _configurable(config: RunnableConfig | None, key: str, default=None):
+    """Returns a value from the 'configurable' section of a runnable config."""
+    return (config or {}).get("configurable", {}).get(key, default)
+
+
+def download_stock_prices(tickers: list[str], interval: str='1wk', start: dt.datetime | None=None,
+                          attempts: int=DEFAULT_RETRY_ATTEMPTS) -> dict[str, pd.DataFrame]:
+    """
+    Downloads historical price data for one or more tickers with a single yahoo finance
+    call and splits the result into a separate dataframe (indexed by date, with columns
+    Open, High, Low, Close, Volume) for each ticker.
+
+    If `start` is not specified, the last `PRICE_HISTORY_WEEKS` weeks are downloaded. The download
+    is attempted up to `attempts` times on transient errors.
+    """
+    if start is None:
+        start = dt.datetime.now() - dt.timedelta(weeks=PRICE_HISTORY_WEEKS)
+    # concurrent runs for the same tickers share the download
+    data = yahoo_download(tickers, start=start, interval=interval, group_by='ticker', attempts=attempts)
+
+    frames = {}
+    for ticker in tickers:
+        # multi-level columns are keyed by (ticker, price field)
+        if isinstance(data.columns, pd.MultiIndex):
+            if ticker not in data.columns.get_level_values(0):
+                continue
+            df = data[ticker]
+        else:
+            df = data
+        # tickers may trade on different dates, so drop the rows that belong only to other tickers
+        frames[ticker] = df.dropna(how='all').copy()
+    return frames
+
+
+def fetch_stock_prices(tickers: list[str], interval: str='1wk', cache: MarketDataCache | None=None,
+                       attempts: int=DEFAULT_RETRY_ATTEMPTS) -> dict[str, pd.DataFrame]:
+    """
+    Returns the price data of the last `PRICE_HISTORY_WEEKS` weeks for the given tickers,
+    in the same format as `download_stock_prices`.
+
+    If a cache is given, fresh cached prices are returned without any network call, while
+    for expired ones only the bars newer than the cached ones are downloaded.
+    """
+    if cache is None:
+        return download_stock_prices(tickers, interval, attempts=attempts)
+
+    start = (dt.datetime.now() - dt.timedelta(weeks=PRICE_HISTORY_WEEKS)).strftime('%Y-%m-%d')
+    frames, stale = {}, {}
+    for ticker in tickers:
+        cached, fresh = cache.get_prices(ticker, interval, start)
+        if fresh:
+            frames[ticker] = cached
+        else:
+            stale[ticker] = cached
+
+    # group stale tickers by the date from which they need new bars, so that they share downloads.
+    # the last cached bar is fetched again, since it may have been incomplete when it was cached
+    groups = defaultdict(list)
+    for ticker, cached in stale.items():
+        since = cached.index[-1].strftime('%Y-%m-%d') if cached is not None else start
+        groups[since].append(ticker)
+
+    for since, group in groups.items():
+        downloaded = download_stock_prices(
+            group, interval, start=dt.datetime.strptime(since, '%Y-%m-%d'), attempts=attempts
+        )
+        for ticker, df in downloaded.items():
+            if df.empty:
+                continue
+            # tickers without cached bars start a new cached range
+            cache.put_prices(ticker, interval, df, range_start=start if stale[ticker] is None else None)
+            frames[ticker], _ = cache.get_prices(ticker, interval, start)
+
+    return frames
+
+
+def update_stock_price_indicators(ticker: str, df: pd.DataFrame, cache: MarketDataCache,
+                                  interval: str='1wk', verify: bool=False, tolerance: float=1.0) -> PriceIndicators:
+    """
+    Same as `compute_stock_price_indicators`, but updates the indicator state persisted in the
+    cache with the bars that are newer than it, instead of recomputing the indicators over the
+    whole price history.
+
+    The latest bar is not committed to the persisted state, since it may still change until its
+    period closes. If `verify` is set, the results are compared against a full recompute, and
+    differences larger than `tolerance` are logged as warnings.
+    """
+    dates = df.index.strftime('%Y-%m-%d')
+    bars = df[['High', 'Low', 'Close', 'Volume']].to_numpy(dtype=float)
+
+    # start from scratch if there is no state (or one of an older format), or if there is a gap between
+    # the state and the prices
+    saved = cache.get_indicator_state(ticker, interval)
+    state = None
+    if saved is not None and saved.get("version") == INDICATOR_STATE_VERSION:
+        state = IncrementalIndicators.from_dict(saved)
+    if state is None or state.last_date < dates[0]:
+        state = IncrementalIndicators()
+
+    # commit every closed bar that is newer than the state (the last one may still change)
+    for date, (high, low, close, volume) in zip(dates[:-1], bars[:-1]):
+        if state.last_date is None or date > state.last_date:
+            state.update(date, high, low, close, volume)
+    cache.put_indicator_state(ticker, interval, state.to_dict())
+
+    # add the latest bar to a copy of the state
+    latest = state.peek(dates[-1], *bars[-1]) if state.last_date is None or dates[-1] > state.last_date else state
+    indicators = {
+        name: {date: int(value) for date, value in latest.recent[name] if not np.isnan(value)}
+        for name in INDICATORS
+    }
+
+    if verify:
+        full = compute_stock_price_indicators(df).indicators.to_dict()
+        for name in INDICATORS:
+            for date, value in full[name].items():
+                if abs(indicators[name].get(date, np.nan) - value) > tolerance or date not in indicators[name]:
+                    logger.warning(
+                        "Incremental %s of %s on %s is %s, but full recompute gives %s",
+                        name, ticker, date, indicators[name].get(date), value
+                    )
+
+    return PriceIndicators(PriceSeries.from_frame(df), IndicatorSeries.from_dict(indicators))
+
+
+def get_stock_prices(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
     """Fetches historical stock price data and technical indicator for a given stock_ticker."""
+    # price data may have already been fetched in bulk (i.e. by FinanceGraph.run_many)
+    if state.get('stock_price_indicators'):
+        return {'stock_price_indicators': state['stock_price_indicators']}
+
     try:
-        # get stock data from yahoo finance and store them in a dataframe
-        data = yf.download(
-            state['stock_ticker'],
-            start=dt.datetime.now() - dt.timedelta(weeks=24*3),
-            end=dt.datetime.now(),
-            interval='1wk'
+        # get stock data from yahoo finance (or the cache)
+        cache = _configurable(config, "market_data_cache")
+        frames = fetch_stock_prices(
+            [state['stock_ticker']], cache=cache,
+            attempts=_configurable(config, "retry_attempts", DEFAULT_RETRY_ATTEMPTS)
         )
-        df = data.copy()
-        data.reset_index(inplace=True)
-        data.Date = data.Date.astype(str)
-        
-        # get separate series objects from the dataframe
-        close = pd.Series(df['Close'].squeeze(), index=df['Close'].index)
-        high = pd.Series(df['High'].squeeze(), index=df['High'].index)
-        low =  pd.Series(df['Low'].squeeze(), index=df['Low'].index)
-        volume = pd.Series(df['Volume'].squeeze(), index=df['Volume'].index)
-
-        # compute technical indicators and store them in a dictionary
-        indicators = {}
-        rsi_series = RSIIndicator(close, window=14).rsi().iloc[-12:]
-        indicators["RSI"] = {date.strftime('%Y-%m-%d'): int(value) 
-                    for date, value in rsi_series.dropna().to_dict().items()}
-        
-        sto_series = StochasticOscillator(
-            high, low, close, window=14).stoch().iloc[-12:]
-        indicators["Stochastic_Oscillator"] = {
-                    date.strftime('%Y-%m-%d'): int(value) 
-                    for date, value in sto_series.dropna().to_dict().items()}
-
-        macd = MACD(close)
-        macd_series = macd.macd().iloc[-12:]
-        indicators["MACD"] = {date.strftime('%Y-%m-%d'): int(value) 
-                    for date, value in macd_series.to_dict().items()}
-        
-        macd_signal_series = macd.macd_signal().iloc[-12:]
-        indicators["MACD_Signal"] = {date.strftime('%Y-%m-%d'): int(value) 
-                    for date, value in macd_signal_series.to_dict().items()}
-        
-        vwap_series = volume_weighted_average_price(
-            high=high, low=low, close=close,volume=volume,
-        ).iloc[-12:]
-        indicators["volume_weighted_average_price"] = {date.strftime('%Y-%m-%d'): int(value) 
-                    for date, value in vwap_series.to_dict().items()}
-        
-        # keep only key[0] for keys that were tuples inside the stock price list 
-        stock_price = [{k[0]:v for k,v in item.items()} for item in data.to_dict(orient='records')]
-        return {
-            'stock_price_indicators': {
-                'stock_price': stock_price,
-                'indicators': indicators
-            }
-        }
+        df = frames[state['stock_ticker']]
+
+        # update the persisted indicator state, or compute the technical indicators from scratch
+        # (in a worker of the process pool, if there is one)
+        if cache is not None and _configurable(config, "incremental_indicators", False):
+            stock_price_indicators = update_stock_price_indicators(
+                state['stock_ticker'], df, cache, verify=_configurable(config, "verify_indicators", False)
+            )
+        else:
+            stock_price_indicators = run_in_pool(_configurable(config, "process_pool"), compute_stock_price_indicators, df)
+        return {'stock_price_indicators': stock_price_indicators}
 
     except Exception as e:
-        return {"stock_price_indicators": {}}
+        return {"stock_price_indicators": None, "errors": [f"get_stock_prices: {e!r}"]}
 
 
-def get_financial_metrics(state: TypedDict) -> TypedDict: # type:ignore
+def get_financial_metrics(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
     """Fetches key financial ratios for a given stock_ticker."""
     try:
-        # fetch stock infor from yahoo finance
-        stock = yf.Ticker(state['stock_ticker'])
-        info = stock.info
-        # return dictionary with selected metrics
-        return {
-            'financial_metrics': {
-                'pe_ratio': info.get('forwardPE'),
-                'price_to_book': info.get('priceToBook'),
-                'debt_to_equity': info.get('debtToEquity'),
-                'profit_margins': info.get('profitMargins')
-            }
+        # use the cached metrics if they are still fresh
+        cache = _configurable(config, "market_data_cache")
+        if cache is not None:
+            metrics = cache.get_metrics(state['stock_ticker'])
+            if metrics is not None:
+                return {'financial_metrics': metrics}
+
+        # fetch stock infor from yahoo finance (concurrent runs for the same stock share the request)
+        info = yahoo_info(state['stock_ticker'], attempts=_configurable(config, "retry_attempts", DEFAULT_RETRY_ATTEMPTS))
+        # keep only selected metrics
+        metrics = {
+            'pe_ratio': info.get('forwardPE'),
+            'price_to_book': info.get('priceToBook'),
+            'debt_to_equity': info.get('debtToEquity'),
+            'profit_margins': info.get('profitMargins')
         }
+        if cache is not None:
+            cache.put_metrics(state['stock_ticker'], metrics)
+        return {'financial_metrics': metrics}
     except Exception as e:
-        return {"financial_metrics": {}}
+        return {"financial_metrics": {}, "errors": [f"get_financial_metrics: {e!r}"]}
 
 
-def get_general_financial_info(state: TypedDict) -> TypedDict: # type:ignore
+def get_general_financial_info(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
     """
     Fetches general financial information for the given stock, including the three main
     financial statements (Income Statement, Balance Sheet and Cash flow Statement) as well 
@@ -112,8 +243,8 @@ def get_general_financial_info(state: TypedDict) -> TypedDict: # type:ignore
         "api_key": os.getenv("SERPAPI_KEY_TOKEN")
         }
 
-        # fetch results as a dictionary
-        results = serpapi.search(params).as_dict()
+        # fetch results as a dictionary (concurrent runs for the same stock share the request)
+        results = serpapi_search(params, attempts=_configurable(config, "retry_attempts", DEFAULT_RETRY_ATTEMPTS))
 
         # extract articles from fetched results
         articles = []
@@ -125,34 +256,139 @@ def get_general_financial_info(state: TypedDict) -> TypedDict: # type:ignore
                 # if item contains nested articles, pick the first of those artickles
                 if item.get("items", False):
                     # append the title and link of the article
-                    articles.append((item['items'][0]['snippet'], item['items'][0]['link']))
+                    articles.append((intern_text(item['items'][0]['snippet']), item['items'][0]['link']))
                 # else, add the article to the list
                 else:
-                    articles.append(item['snippet'], item['link'])
+                    articles.append((intern_text(item['snippet']), item['link']))
 
-        # add financial statements and related articles (if they exist) to the graph state
+        # add financial statements (pruned to the values used by the prompts) and related articles
+        # (if they exist) to the graph state
         return {
-            "financial_statements": results.get('financials', []),
+            "financial_statements": [Statement.from_serpapi(statement) for statement in results.get('financials', [])],
             "news_results": articles
         }
     
     except Exception as e:
         return {
             "financial_statements": [],
-            "news_results": []
+            "news_results": [],
+            "errors": [f"get_general_financial_info: {e!r}"]
         }
 
 
-def combine_stock_data(state: TypedDict) -> TypedDict: # type:ignore
+def _fit_articles(state: TypedDict, texts: list[str | None], config: RunnableConfig | None) -> list[tuple[str, str]]: # type:ignore
+    """
+    Pair the fetched texts with the titles of the articles (dropping the articles that failed or were
+    too late) and keep only the part of each text that fits in the token budget of the prompts, with
+    the texts shared by the runs of the process (see `TextPool`).
+    """
+    articles = [(title, text) for (title, _), text in zip(state['news_results'], texts) if text]
+    budget = _configurable(config, "context_token_budget", DEFAULT_TOKEN_BUDGET)
+    return [(title, intern_text(text)) for title, text in fit_articles(articles, state['stock_ticker'], budget=budget)]
+
+
+def combine_stock_data(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
     """
     Combines price data, indicators, financial metrics, financial statements
-    and relevant articles for a stock.
+    and relevant articles for a stock. Articles are looked up in the article
+    store first (if there is one), parsed in the process pool (if there is one),
+    and only the part of them that fits in the prompts is kept.
     """
     # convert relevant articles links to text if they exist
     if state.get('news_results', False):
-        # convert links to text
-        articles = list(map(lambda x: (x[0], extract_text_from_url(x[1])), state['news_results']))
+        # convert links to text concurrently
+        texts = fetch_articles(
+            [link for _, link in state['news_results']],
+            max_workers=_configurable(config, "article_max_workers", ARTICLE_MAX_WORKERS),
+            timeout=_configurable(config, "article_timeout", ARTICLE_TIMEOUT),
+            deadline=_configurable(config, "article_deadline", ARTICLE_DEADLINE),
+            store=_configurable(config, "article_store"),
+            pool=_configurable(config, "process_pool")
+        )
         # update apporpriate state attribute
-        return {"news_results": articles}
-    # else, simply return the previous state attributes
-    return {**state}
+        return {"news_results": _fit_articles(state, texts, config)}
+    # else, there are no articles to convert
+    return {"news_results": []}
+
+
+def detect_changes(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
+    """
+    Compares the fetched data against the latest archived run of the stock (made with the same
+    model), and marks the analyses whose inputs have not meaningfully changed, so that they reuse
+    their previous responses instead of calling the LLM. Every response is compared against the
+    inputs of the run that generated it (not the run that last reused it), so that small changes
+    can not add up run after run, and is not reused once it is older than the maximum age. The
+    report is reused only along with all the analyses.
+    """
+    archive = _configurable(config, "state_archive")
+    if archive is None:
+        return {"reused_responses": {}, "reused_origins": {}}
+
+    try:
+        max_age = _configurable(config, "archive_max_age")
+        previous = archive.latest(state['stock_ticker'], model=_configurable(config, "archive_model"), max_age=max_age)
+        if previous is None:
+            return {"reused_responses": {}, "reused_origins": {}}
+
+        fingerprints = input_fingerprints(state)
+        tolerance = _configurable(config, "change_tolerance", DEFAULT_CHANGE_TOLERANCE)
+        responses, origins = previous["responses"], previous["origins"]
+
+        def reusable(name: str) -> bool:
+            origin = origins.get(name)
+            return (
+                name in responses and origin is not None
+                and (max_age is None or origin["stored_at"] >= time.time() - max_age)
+            )
+
+        reused = {
+            name: responses[name] for name, inputs in ANALYSIS_INPUTS.items()
+            if reusable(name) and not changed_inputs(origins[name]["fingerprints"], fingerprints, tolerance).intersection(inputs)
+        }
+        if len(reused) == len(ANALYSIS_INPUTS) and reusable("report_writer"):
+            reused["report_writer"] = responses["report_writer"]
+        return {"reused_responses": reused, "reused_origins": {name: origins[name] for name in reused}}
+
+    except Exception as e:
+        return {"reused_responses": {}, "reused_origins": {}, "errors": [f"detect_changes: {e!r}"]}
+
+
+# asynchronous versions of the nodes, used when the graph runs through `ainvoke`.
+# yahoo finance and serpapi only offer blocking clients, so their calls run in the
+# data thread pool of the process (see `utils.data_access.get_executor`) instead of
+# blocking the event loop.
+
+async def aget_stock_prices(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
+    """Asynchronous version of `get_stock_prices`."""
+    return await run_blocking("data", get_stock_prices, state, config)
+
+
+async def aget_financial_metrics(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
+    """Asynchronous version of `get_financial_metrics`."""
+    return await run_blocking("data", get_financial_metrics, state, config)
+
+
+async def aget_general_financial_info(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
+    """Asynchronous version of `get_general_financial_info`."""
+    return await run_blocking("data", get_general_financial_info, state, config)
+
+
+async def acombine_stock_data(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
+    """Asynchronous version of `combine_stock_data`."""
+    if state.get('news_results', False):
+        # convert links to text concurrently
+        texts = await afetch_articles(
+            [link for _, link in state['news_results']],
+            max_workers=_configurable(config, "article_max_workers", ARTICLE_MAX_WORKERS),
+            timeout=_configurable(config, "article_timeout", ARTICLE_TIMEOUT),
+            deadline=_configurable(config, "article_deadline", ARTICLE_DEADLINE),
+            store=_configurable(config, "article_store"),
+            pool=_configurable(config, "process_pool")
+        )
+        return {"news_results": _fit_articles(state, texts, config)}
+    return {"news_results": []}
+
+
+async def adetect_changes(state: TypedDict, config: RunnableConfig | None=None) -> TypedDict: # type:ignore
+    """Asynchronous version of `detect_changes`."""
+    return await run_blocking("data", detect_changes, state, config)
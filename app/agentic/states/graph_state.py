@@ -1,9 +1,12 @@
 """
 File containing the state class implementation for the workflow graph
 """
+import operator
 from typing import Annotated, TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 
+from states.records import PriceIndicators, Statement
+
 
 # State class for the workflow
 class GraphState(TypedDict):
@@ -14,8 +17,21 @@ class GraphState(TypedDict):
     stock_ticker: str
     stock_exchange: str
 
-    # financial data regarding given stock
-    stock_price_indicators: dict
+    # financial data regarding given stock, as compact records (see states/records.py) that are
+    # converted to the token-budgeted texts of the prompts by the LLM nodes that use them
+    stock_price_indicators: PriceIndicators | None
     financial_metrics: dict
-    financial_statements: list
-    news_results: list
\ No newline at end of file
+    financial_statements: list[Statement]
+    # (title, text) of the articles, with the texts fitted in the token budget
+    news_results: list
+
+    # number of tokens used by each of the texts of the fetched data in the prompts, by text
+    context_tokens: Annotated[dict, operator.or_]
+
+    # responses of a previous run, by LLM node, which are reused since their inputs have not changed
+    reused_responses: dict
+    # run_id, time and input fingerprints of the run that generated each reused response
+    reused_origins: dict
+
+    # errors caught by the nodes, which fall back to empty data instead of failing the run
+    errors: Annotated[list[str], operator.add]
@@ -0,0 +1,216 @@
+"""
+File containing the compact records that hold the fetched data in the graph state: price bars and
+technical indicators as arrays instead of per-row dictionaries, financial statements pruned to the
+values used by the prompts, and a pool that shares identical strings (i.e. article texts) between
+the runs of a process. The records are converted to prompt text only by the LLM nodes.
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass
+from collections import OrderedDict
+
+
+class TextPool:
+    """
+    Bounded pool of strings, so that equal strings of different runs (i.e. the text of an article
+    that many stocks link to, or the line items of the financial statements) are kept in memory
+    once. Unlike `sys.intern`, the least recently used strings are released when the pool is full.
+    """
+    def __init__(self, max_size: int=4096):
+        self.max_size = max_size
+        self._texts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> str:
+        """
+        Return the pooled string equal to `text`, adding it to the pool if there is none.
+        """
+        with self._lock:
+            pooled = self._texts.get(text)
+            if pooled is not None:
+                self._texts.move_to_end(text)
+                return pooled
+            self._texts[text] = text
+            if len(self._texts) > self.max_size:
+                self._texts.popitem(last=False)
+            return text
+
+
+_pool = TextPool()
+
+
+def intern_text(text: str) -> str:
+    """
+    Returns the pooled copy of a string (see `TextPool`).
+    """
+    return _pool.get(text)
+
+
+def _dates(index: pd.Index) -> np.ndarray:
+    # dates are kept as fixed-width YYYY-mm-dd strings (which, unlike datetime64, can be checkpointed),
+    # and timezone-aware dates keep their local day
+    return np.asarray(index.strftime('%Y-%m-%d'), dtype='U10')
+
+
+@dataclass(frozen=True, slots=True)
+class PriceSeries:
+    """
+    Price bars of a stock: an array of dates (as YYYY-mm-dd) and, for every price field (Open, High,
+    Low, Close, Volume), an array of values in the dtype it was downloaded with.
+    """
+    dates: np.ndarray
+    fields: tuple[str, ...]
+    columns: tuple[np.ndarray, ...]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "PriceSeries":
+        """
+        Create the price series of a dataframe indexed by date, with a column per price field.
+        """
+        fields = tuple(str(field) for field in df.columns)
+        return cls(_dates(df.index), fields, tuple(df[field].to_numpy().copy() for field in fields))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def rows(self):
+        """
+        Yield the (date as YYYY-mm-dd, list of values) of every bar, oldest first.
+        """
+        columns = [column.tolist() for column in self.columns]
+        for i, date in enumerate(self.dates.tolist()):
+            yield date, [column[i] for column in columns]
+
+    def records(self) -> list[dict]:
+        """
+        Returns the bars as a list of {"Date": ..., field: value} dictionaries.
+        """
+        return [{"Date": date, **dict(zip(self.fields, values))} for date, values in self.rows()]
+
+
+@dataclass(frozen=True, slots=True)
+class IndicatorSeries:
+    """
+    Recent values of the technical indicators of a stock: an array of dates (as YYYY-mm-dd), and a
+    matrix with a row per indicator and a column per date (NaN where an indicator has no value on a date).
+    """
+    names: tuple[str, ...]
+    dates: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, names: list[str]) -> "IndicatorSeries":
+        """
+        Create the indicator series of a dataframe indexed by date, with a column per indicator.
+        Values are truncated to integers, and dates on which no indicator has a value are dropped.
+        """
+        values = np.trunc(frame[names].to_numpy(dtype=float).T)
+        valid = ~np.isnan(values).all(axis=0)
+        return cls(tuple(names), _dates(frame.index)[valid], values[:, valid].copy())
+
+    @classmethod
+    def from_dict(cls, indicators: dict[str, dict[str, int]]) -> "IndicatorSeries":
+        """
+        Create the indicator series of a {indicator: {date: value}} dictionary.
+        """
+        names = tuple(indicators)
+        dates = sorted({date for series in indicators.values() for date in series})
+        values = np.array(
+            [[series.get(date, np.nan) for date in dates] for series in indicators.values()], dtype=float
+        ).reshape(len(names), len(dates))
+        return cls(names, np.asarray(dates, dtype='U10'), values)
+
+    def rows(self):
+        """
+        Yield the (date as YYYY-mm-dd, list of values) of every date, oldest first, with the values
+        as integers (or None where an indicator has no value).
+        """
+        columns = [[None if np.isnan(value) else int(value) for value in row] for row in self.values.tolist()]
+        for i, date in enumerate(self.dates.tolist()):
+            yield date, [column[i] for column in columns]
+
+    def latest(self) -> dict[str, int]:
+        """
+        Returns the latest value of every indicator that has one.
+        """
+        latest = {}
+        for name, row in zip(self.names, self.values):
+            valid = np.flatnonzero(~np.isnan(row))
+            if valid.size:
+                latest[name] = int(row[valid[-1]])
+        return latest
+
+    def to_dict(self) -> dict[str, dict[str, int]]:
+        """
+        Returns the indicators as a {indicator: {date: value}} dictionary.
+        """
+        indicators = {name: {} for name in self.names}
+        for date, values in self.rows():
+            for name, value in zip(self.names, values):
+                if value is not None:
+                    indicators[name][date] = value
+        return indicators
+
+
+@dataclass(frozen=True, slots=True)
+class PriceIndicators:
+    """
+    Price bars and technical indicators of a stock (the `stock_price_indicators` of the graph state).
+    """
+    prices: PriceSeries
+    indicators: IndicatorSeries
+
+    def to_dict(self) -> dict:
+        """
+        Returns the bars and the indicators as {"stock_price": [...], "indicators": {...}}.
+        """
+        return {"stock_price": self.prices.records(), "indicators": self.indicators.to_dict()}
+
+
+@dataclass(frozen=True, slots=True)
+class Statement:
+    """
+    A financial statement (i.e. the Income Statement), pruned to its line items and their values
+    in each period.
+    """
+    title: str
+    period_type: str
+    periods: tuple[str, ...]
+    items: tuple[tuple[str, tuple[str, ...]], ...]
+
+    @classmethod
+    def from_serpapi(cls, statement: dict) -> "Statement":
+        """
+        Create a statement from one of the `financials` of a SerpAPI google finance search.
+        """
+        results = statement.get("results", [])
+        items = {}
+        for i, result in enumerate(results):
+            for row in result.get("table", []):
+                values = items.setdefault(intern_text(row.get("title", "")), [""] * len(results))
+                values[i] = str(row.get("value", ""))
+        return cls(
+            intern_text(statement.get("title", "Statement")),
+            intern_text(results[0].get("period_type", "")) if results else "",
+            tuple(intern_text(result.get("date", "")) for result in results),
+            tuple((item, tuple(values)) for item, values in items.items())
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "title": self.title,
+            "period_type": self.period_type,
+            "periods": list(self.periods),
+            "items": {item: list(values) for item, values in self.items}
+        }
+
+
+def to_json(value):
+    """
+    `default` hook of `json.dump`, which converts the records of a graph state to dictionaries.
+    """
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return str(value)
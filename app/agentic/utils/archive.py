@@ -0,0 +1,225 @@
+"""
+File containing an archive of the final graph states of past runs, and the change detection
+that lets a new run reuse the analyses whose inputs have not meaningfully changed since.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import datetime as dt
+from contextlib import contextmanager
+
+from states.records import to_json
+
+
+# inputs of every analysis (besides the stock itself), as named in `input_fingerprints`
+ANALYSIS_INPUTS = {
+    "technical_analysis": ["indicators", "metrics"],
+    "sentiment_analysis": ["articles"],
+    "valuation_analysis": ["statements", "metrics"]
+}
+# default relative change of an indicator or a metric that counts as meaningful
+DEFAULT_CHANGE_TOLERANCE = 0.02
+# default age (in seconds) after which archived analyses are not reused
+DEFAULT_REUSE_MAX_AGE = 7 * 24 * 3600
+
+
+def input_fingerprints(state: dict) -> dict:
+    """
+    Returns a compact summary of the fetched data of a graph state, which is compared against the
+    summary of a previous run to find the inputs that changed: the latest value of every technical
+    indicator, the financial metrics, the titles of the articles and a hash of the statements.
+    """
+    stock_price_indicators = state.get("stock_price_indicators")
+    statements = json.dumps(state.get("financial_statements", []), sort_keys=True, default=to_json)
+    return {
+        "indicators": stock_price_indicators.indicators.latest() if stock_price_indicators is not None else {},
+        "metrics": dict(state.get("financial_metrics") or {}),
+        "articles": sorted(title for title, _ in state.get("news_results", [])),
+        "statements": hashlib.sha256(statements.encode()).hexdigest()
+    }
+
+
+def _values_changed(previous: dict, current: dict, tolerance: float) -> bool:
+    """
+    Whether any value of two dictionaries of numbers differs by more than `tolerance` (relative).
+    """
+    if previous.keys() != current.keys():
+        return True
+    for name, value in current.items():
+        before = previous[name]
+        if value is None or before is None:
+            if value is not before:
+                return True
+        elif abs(value - before) > tolerance * max(abs(value), abs(before), 1e-9):
+            return True
+    return False
+
+
+def changed_inputs(previous: dict, current: dict, tolerance: float=DEFAULT_CHANGE_TOLERANCE) -> set[str]:
+    """
+    Returns the names of the inputs whose fingerprints (see `input_fingerprints`) have meaningfully
+    changed: indicators or metrics that moved by more than `tolerance`, new articles (articles that
+    are no longer listed do not count) or different statements.
+    """
+    changed = set()
+    for name in ["indicators", "metrics"]:
+        if _values_changed(previous.get(name, {}), current[name], tolerance):
+            changed.add(name)
+    if set(current["articles"]) - set(previous.get("articles", [])):
+        changed.add("articles")
+    if previous.get("statements") != current["statements"]:
+        changed.add("statements")
+    return changed
+
+
+class StateArchive:
+    """
+    SQLite archive of the final graph states of past runs (compressed), along with their LLM
+    responses and input fingerprints, indexed by ticker and date.
+    """
+    def __init__(self, archive_dir: str):
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        self.path = os.path.join(archive_dir, "archive.sqlite")
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    run_id TEXT PRIMARY KEY,
+                    ticker TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    model TEXT,
+                    errors INTEGER NOT NULL,
+                    fingerprints TEXT NOT NULL,
+                    responses TEXT NOT NULL,
+                    state BLOB NOT NULL,
+                    origins TEXT
+                );
+                CREATE INDEX IF NOT EXISTS snapshots_ticker_date ON snapshots (ticker, date);
+            """)
+            # archives created before the origins of the responses were kept
+            if "origins" not in {row[1] for row in conn.execute("PRAGMA table_info(snapshots)")}:
+                conn.execute("ALTER TABLE snapshots ADD COLUMN origins TEXT")
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open a connection to the archive database, commit on success and always close it.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def put(self, final_state: dict, run_id: str, model: str | None=None):
+        """
+        Archive the final state of a run, made with the given model, along with the origin of each
+        of its responses: the run that generated it, when, and from which inputs. Reused responses
+        keep the origin of the run they were reused from (see `reused_origins` in the graph state),
+        so that their inputs are always compared against the ones they were generated from.
+        """
+        messages = [{"name": message.name, "content": message.content} for message in final_state.get("messages", [])]
+        state = {**final_state, "messages": messages}
+        stored_at = time.time()
+        fingerprints = input_fingerprints(final_state)
+        reused_origins = final_state.get("reused_origins") or {}
+        origins = {
+            message["name"]: reused_origins.get(message["name"])
+            or {"run_id": run_id, "stored_at": stored_at, "fingerprints": fingerprints}
+            for message in messages
+        }
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots "
+                "(run_id, ticker, date, stored_at, model, errors, fingerprints, responses, state, origins) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, final_state["stock_ticker"], dt.date.today().isoformat(), stored_at, model,
+                    len(final_state.get("errors", [])), json.dumps(fingerprints),
+                    json.dumps({message["name"]: message["content"] for message in messages}),
+                    zlib.compress(json.dumps(state, default=to_json).encode()), json.dumps(origins)
+                )
+            )
+
+    def latest(self, ticker: str, model: str | None=None, max_age: float | None=None) -> dict | None:
+        """
+        Returns the run_id, date, fingerprints, LLM responses and their origins (see `put`) of the
+        latest run of a stock that had no errors, made with the given model (any model if None) and
+        not older than `max_age` seconds. Returns None if there is no such run. Its responses may be
+        older than the run itself (if it reused them), so their age is given by their origins.
+        """
+        query = (
+            "SELECT run_id, date, stored_at, fingerprints, responses, origins FROM snapshots "
+            "WHERE ticker = ? AND errors = 0"
+        )
+        params = [ticker]
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model)
+        if max_age is not None:
+            query += " AND stored_at >= ?"
+            params.append(time.time() - max_age)
+
+        with self._connect() as conn:
+            row = conn.execute(query + " ORDER BY stored_at DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        run_id, date, stored_at, fingerprints, responses, origins = row
+        fingerprints, responses = json.loads(fingerprints), json.loads(responses)
+        # runs archived without origins count as the origin of all their responses
+        if origins is None:
+            origins = {name: {"run_id": run_id, "stored_at": stored_at, "fingerprints": fingerprints} for name in responses}
+        else:
+            origins = json.loads(origins)
+        return {
+            "run_id": run_id,
+            "date": date,
+            "stored_at": stored_at,
+            "fingerprints": fingerprints,
+            "responses": responses,
+            "origins": origins
+        }
+
+    def history(self, ticker: str, start: str | None=None, end: str | None=None) -> list[dict]:
+        """
+        Returns the archived runs of a stock within a range of dates (inclusive, as YYYY-mm-dd),
+        oldest first, with their LLM responses (but not their states, see `get`).
+        """
+        query = "SELECT run_id, date, stored_at, model, errors, responses FROM snapshots WHERE ticker = ?"
+        params = [ticker]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(end)
+
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY stored_at", params).fetchall()
+        return [
+            {"run_id": run_id, "date": date, "stored_at": stored_at, "model": model, "errors": errors,
+             "responses": json.loads(responses)}
+            for run_id, date, stored_at, model, errors, responses in rows
+        ]
+
+    def get(self, run_id: str) -> dict | None:
+        """
+        Returns the archived final state of a run (with its messages as name/content dictionaries).
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT state FROM snapshots WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def prune(self, max_age: float):
+        """
+        Remove the runs older than `max_age` seconds.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM snapshots WHERE stored_at < ?", (time.time() - max_age,))
@@ -0,0 +1,185 @@
+"""
+File containing a persistent, content-addressed store for the extracted text of articles,
+shared by all the tickers (and runs) that link to the same article.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+# seconds after which a stored article is revalidated with the website
+ARTICLE_TTL = 24 * 3600
+# seconds after which an article that was not revalidated is evicted
+ARTICLE_MAX_AGE = 30 * 24 * 3600
+# query parameters that only track the visitor, and do not change the article
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ocid", "cmpid", "guccounter", "guce_referrer", "guce_referrer_sig"}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Returns the normalized form of an article url, so that links that differ only in letter case
+    of the scheme and host, default ports, tracking parameters, the order of the query parameters
+    or the fragment map to the same article.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and (scheme, parts.port) not in [("http", 80), ("https", 443)]:
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+class ArticleStore:
+    """
+    SQLite-backed store for the extracted text of articles, keyed by normalized url. Texts are
+    stored once per content hash (so the same story under different urls is stored once), along
+    with the ETag / Last-Modified validators of every url and the time it was fetched.
+
+    Articles are fresh for `ttl` seconds, after which they should be revalidated with a conditional
+    GET (see `conditional_headers`). Articles that were not revalidated for `max_age` seconds are
+    evicted, as are the least recently used ones whenever the texts grow beyond `max_size` bytes.
+    """
+    def __init__(self, cache_dir: str, ttl: float=ARTICLE_TTL, max_age: float=ARTICLE_MAX_AGE,
+                 max_size: int=128*1024*1024):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, "articles.sqlite")
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_size = max_size
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    key TEXT PRIMARY KEY,
+                    text_hash TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS texts (
+                    hash TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS articles_accessed_at ON articles (accessed_at);
+                CREATE INDEX IF NOT EXISTS articles_text_hash ON articles (text_hash);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open a connection to the store database, commit on success and always close it.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, url: str) -> dict | None:
+        """
+        Return the stored article of a url as a dictionary with its text, validators (etag and
+        last_modified), fetch time and whether it is still fresh, or None if it is not stored.
+        """
+        key = normalize_url(url)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT texts.text, articles.etag, articles.last_modified, articles.fetched_at "
+                "FROM articles JOIN texts ON texts.hash = articles.text_hash WHERE articles.key = ?",
+                (key,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE articles SET accessed_at = ? WHERE key = ?", (time.time(), key))
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        fresh = time.time() - row[3] < self.ttl
+        if fresh:
+            with self._lock:
+                self.hits += 1
+        return {"text": row[0], "etag": row[1], "last_modified": row[2], "fetched_at": row[3], "fresh": fresh}
+
+    @staticmethod
+    def conditional_headers(entry: dict | None) -> dict:
+        """
+        Returns the headers of a conditional GET that revalidates a stored article.
+        """
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, text: str, etag: str | None=None, last_modified: str | None=None):
+        """
+        Store the extracted text of an article, along with the validators of its response.
+        """
+        text_hash = hashlib.sha256(text.encode()).hexdigest()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO texts VALUES (?, ?, ?)", (text_hash, text, len(text.encode())))
+            conn.execute(
+                "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), text_hash, etag, last_modified, now, now)
+            )
+            self._evict(conn)
+
+    def revalidate(self, url: str):
+        """
+        Mark a stored article as fresh again, after the website confirmed that it did not change.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE articles SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, normalize_url(url))
+            )
+        with self._lock:
+            self.revalidated += 1
+
+    def _evict(self, conn: sqlite3.Connection):
+        """
+        Remove the articles older than `max_age`, then the least recently used ones until the texts
+        fit in `max_size` bytes, along with the texts that no article links to anymore.
+        """
+        conn.execute("DELETE FROM articles WHERE fetched_at < ?", (time.time() - self.max_age,))
+        conn.execute("DELETE FROM texts WHERE hash NOT IN (SELECT text_hash FROM articles)")
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM texts").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, text_hash in conn.execute("SELECT key, text_hash FROM articles ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM articles WHERE key = ?", (key,))
+            # texts are shared, so they are only removed along with their last article
+            if conn.execute("SELECT 1 FROM articles WHERE text_hash = ? LIMIT 1", (text_hash,)).fetchone() is None:
+                size = conn.execute("SELECT size FROM texts WHERE hash = ?", (text_hash,)).fetchone()[0]
+                conn.execute("DELETE FROM texts WHERE hash = ?", (text_hash,))
+                total -= size
+            if total <= self.max_size:
+                break
+
+    def stats(self) -> dict:
+        """
+        Return the number of fresh hits, revalidated articles and misses of the store.
+        """
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
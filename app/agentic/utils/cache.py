@@ -0,0 +1,204 @@
+"""
+File containing the implementation of a persistent, on-disk cache for market data.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import pandas as pd
+from contextlib import contextmanager
+
+
+# approximate size (in bytes) of a single cached price bar, used for the size cap
+BAR_SIZE = 64
+# price fields stored for each bar
+PRICE_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+class MarketDataCache:
+    """
+    SQLite-backed cache for price bars and financial metrics. Entries are keyed by
+    ticker (and interval, for price bars), expire after `ttl` seconds and are evicted
+    in least-recently-used order whenever the cache grows beyond `max_size` bytes.
+
+    Expired price entries are not discarded: their bars are kept, so that only the
+    bars newer than the cached ones need to be fetched again.
+    """
+    def __init__(self, cache_dir: str, ttl: float=3600, max_size: int=256*1024*1024):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, "market_data.sqlite")
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    range_start TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS price_bars (
+                    key TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL, high REAL, low REAL, close REAL, volume REAL,
+                    PRIMARY KEY (key, date)
+                );
+                CREATE TABLE IF NOT EXISTS metrics (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open a connection to the cache database, commit on success and always close it.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _prices_key(ticker: str, interval: str) -> str:
+        return f"prices:{ticker}:{interval}"
+
+    @staticmethod
+    def _metrics_key(ticker: str) -> str:
+        return f"metrics:{ticker}"
+
+    def _touch(self, conn: sqlite3.Connection, key: str) -> tuple[str | None, float] | None:
+        """
+        Mark an entry as recently used and return its (range_start, fetched_at) values,
+        or None if the entry does not exist.
+        """
+        row = conn.execute("SELECT range_start, fetched_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def get_prices(self, ticker: str, interval: str, start: str) -> tuple[pd.DataFrame | None, bool]:
+        """
+        Return the cached price bars of a ticker from date `start` onwards, along with a flag
+        showing whether they are still fresh. If the cache does not hold bars for the whole
+        requested range, (None, False) is returned.
+        """
+        key = self._prices_key(ticker, interval)
+        with self._lock, self._connect() as conn:
+            entry = self._touch(conn, key)
+            # the cached bars must cover the whole requested range
+            if entry is None or entry[0] > start:
+                return None, False
+            rows = conn.execute(
+                "SELECT date, open, high, low, close, volume FROM price_bars "
+                "WHERE key = ? AND date >= ? ORDER BY date",
+                (key, start)
+            ).fetchall()
+
+        if not rows:
+            return None, False
+        df = pd.DataFrame(rows, columns=["Date"] + PRICE_FIELDS)
+        df["Date"] = pd.to_datetime(df["Date"])
+        df = df.set_index("Date")
+        return df, time.time() - entry[1] < self.ttl
+
+    def put_prices(self, ticker: str, interval: str, df: pd.DataFrame, range_start: str | None=None):
+        """
+        Store (or update) the price bars of a ticker. Parameter `range_start` marks the start of
+        the cached date range and should be specified when the bars are not a continuation of
+        the already cached ones.
+        """
+        key = self._prices_key(ticker, interval)
+        rows = [
+            (key, str(date.date()), *(float(row[field]) for field in PRICE_FIELDS))
+            for date, row in df[PRICE_FIELDS].dropna().iterrows()
+        ]
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            if range_start is not None:
+                # the new bars replace the previously cached range
+                conn.execute("DELETE FROM price_bars WHERE key = ?", (key,))
+            else:
+                entry = conn.execute("SELECT range_start FROM entries WHERE key = ?", (key,)).fetchone()
+                range_start = entry[0] if entry is not None else str(df.index[0].date())
+            conn.executemany("INSERT OR REPLACE INTO price_bars VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            count = conn.execute("SELECT COUNT(*) FROM price_bars WHERE key = ?", (key,)).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, range_start, now, now, count * BAR_SIZE)
+            )
+            self._evict(conn)
+
+    def get_indicator_state(self, ticker: str, interval: str) -> dict | None:
+        """
+        Return the persisted indicator state of a ticker, or None if it does not exist.
+        The state is stored along with the price bars and is evicted together with them.
+        """
+        key = self._prices_key(ticker, interval)
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT payload FROM indicator_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_indicator_state(self, ticker: str, interval: str, state: dict):
+        """
+        Store the indicator state of a ticker.
+        """
+        key = self._prices_key(ticker, interval)
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO indicator_state VALUES (?, ?)", (key, json.dumps(state)))
+
+    def get_metrics(self, ticker: str) -> dict | None:
+        """
+        Return the cached financial metrics of a ticker, or None if they are missing or expired.
+        """
+        key = self._metrics_key(ticker)
+        with self._lock, self._connect() as conn:
+            entry = self._touch(conn, key)
+            if entry is None or time.time() - entry[1] >= self.ttl:
+                return None
+            row = conn.execute("SELECT payload FROM metrics WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_metrics(self, ticker: str, metrics: dict):
+        """
+        Store the financial metrics of a ticker.
+        """
+        key = self._metrics_key(ticker)
+        payload = json.dumps(metrics)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO metrics VALUES (?, ?)", (key, payload))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, None, now, now, len(payload))
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """
+        Remove least recently used entries until the cache fits in `max_size` bytes.
+        """
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.execute("DELETE FROM price_bars WHERE key = ?", (key,))
+            conn.execute("DELETE FROM metrics WHERE key = ?", (key,))
+            conn.execute("DELETE FROM indicator_state WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
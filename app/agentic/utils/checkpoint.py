@@ -0,0 +1,129 @@
+"""
+File containing the SQLite checkpoints of the workflow graph, which save the state of every run
+after each step, so that a run that failed (or whose process was killed) can resume from its last
+completed node instead of starting over. Checkpoints are saved by langgraph's SqliteSaver (and by
+an AsyncSqliteSaver of the running event loop for asynchronous runs), while the helpers of this
+module name the threads of the runs, find them again and remove the old ones.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import datetime as dt
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    get_serializable_checkpoint_metadata
+)
+from langgraph.checkpoint.base.id import UUID
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+# seconds after which the checkpoints of a run are removed
+CHECKPOINT_MAX_AGE = 7 * 24 * 3600
+# name of the checkpoint database inside the checkpoint directory
+CHECKPOINTS_FILE = "checkpoints.db"
+# checkpoint ids are version 6 uuids, whose timestamps count 100 ns intervals since 1582-10-15
+_UUID_EPOCH = 0x01b21dd213814000
+
+
+def run_thread_prefix(stock_ticker: str, date: dt.date | None=None) -> str:
+    """
+    Returns the prefix of the ids of the checkpoint threads of a stock's runs on the given date
+    (today by default), so that a resumed run can find the runs of the same stock and day.
+    """
+    return f"{stock_ticker}:{(date or dt.date.today()).isoformat()}:"
+
+
+def run_thread_id(stock_ticker: str, date: dt.date | None=None) -> str:
+    """
+    Returns the id of the checkpoint thread of a new run of a stock on the given date (today by
+    default): every run has its own thread, so that concurrent runs of the same stock do not share
+    (or remove) each other's checkpoints.
+    """
+    return run_thread_prefix(stock_ticker, date) + uuid.uuid4().hex
+
+
+class RunSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver that leaves the writes of the step out of the metadata of its checkpoints: the
+    metadata is saved as JSON, which cannot hold the arrays of the records that the nodes return,
+    while the writes themselves are saved on their own (see `put_writes`).
+    """
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        return super().put(config, checkpoint, get_serializable_checkpoint_metadata(config, metadata), new_versions)
+
+
+class AsyncRunSqliteSaver(AsyncSqliteSaver):
+    """
+    Asynchronous version of `RunSqliteSaver`.
+    """
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await super().aput(config, checkpoint, get_serializable_checkpoint_metadata(config, metadata), new_versions)
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """
+    Returns the time (in seconds since the epoch) at which a checkpoint was created, from its id.
+    """
+    return (UUID(checkpoint_id).time - _UUID_EPOCH) / 1e7
+
+
+def open_checkpointer(checkpoint_dir: str, max_age: float | None=CHECKPOINT_MAX_AGE) -> RunSqliteSaver:
+    """
+    Returns a checkpointer that saves to the checkpoint database of the given directory, after
+    removing the threads whose latest checkpoint is older than `max_age` seconds. The checkpointer
+    serializes its operations, so it can be shared by the threads of the process.
+    """
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    checkpointer = RunSqliteSaver(sqlite3.connect(os.path.join(checkpoint_dir, CHECKPOINTS_FILE), check_same_thread=False))
+    checkpointer.setup()
+    if max_age is not None:
+        prune_threads(checkpointer, max_age)
+    return checkpointer
+
+
+@asynccontextmanager
+async def async_checkpointer(checkpoint_dir: str) -> AsyncIterator[AsyncRunSqliteSaver]:
+    """
+    Yields an asynchronous checkpointer of the checkpoint database of the given directory, which
+    is bound to the running event loop (so every asynchronous run opens its own).
+    """
+    async with AsyncRunSqliteSaver.from_conn_string(os.path.join(checkpoint_dir, CHECKPOINTS_FILE)) as checkpointer:
+        yield checkpointer
+
+
+def thread_ids(checkpointer: SqliteSaver, prefix: str) -> list[str]:
+    """
+    Returns the ids of the threads that start with the given prefix, the most recently updated first.
+    """
+    with checkpointer.cursor(transaction=False) as cursor:
+        # checkpoint ids increase with time
+        cursor.execute(
+            "SELECT thread_id FROM checkpoints WHERE substr(thread_id, 1, ?) = ? "
+            "GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC",
+            (len(prefix), prefix)
+        )
+        return [thread_id for thread_id, in cursor.fetchall()]
+
+
+def prune_threads(checkpointer: SqliteSaver, max_age: float):
+    """
+    Remove the threads whose latest checkpoint is older than `max_age` seconds.
+    """
+    with checkpointer.cursor(transaction=False) as cursor:
+        cursor.execute("SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id")
+        threads = cursor.fetchall()
+    oldest = time.time() - max_age
+    for thread_id, checkpoint_id in threads:
+        if checkpoint_time(checkpoint_id) < oldest:
+            checkpointer.delete_thread(thread_id)
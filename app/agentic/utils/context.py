@@ -0,0 +1,178 @@
+"""
+File containing functions that compact the fetched stock data into short, token-budgeted
+texts that are used in the LLM prompts.
+"""
+import re
+import math
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from states.records import PriceIndicators, Statement
+
+
+# default number of tokens that the data of a single prompt may use
+DEFAULT_TOKEN_BUDGET = 6000
+# truncated articles that would get less than this many tokens are dropped
+MIN_ARTICLE_TOKENS = 64
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough estimate of the number of tokens of a text (about 4 characters per token).
+    """
+    return math.ceil(len(text) / 4)
+
+
+def _fit_rows(header: list[str], rows: list[str], budget: int, count_tokens: Callable[[str], int]) -> str:
+    """
+    Join header and rows into a text, dropping the oldest (first) rows until it fits in the budget.
+    """
+    while rows and count_tokens("\n".join(header + rows)) > budget:
+        rows = rows[1:]
+    return "\n".join(header + rows) if rows else ""
+
+
+def _format_number(value, decimals: int) -> str:
+    if isinstance(value, float):
+        return f"{value:.{decimals}f}"
+    return str(value)
+
+
+def compact_indicators(stock_price_indicators: "PriceIndicators | None", budget: int=DEFAULT_TOKEN_BUDGET, decimals: int=2,
+                       count_tokens: Callable[[str], int]=estimate_tokens) -> str:
+    """
+    Format the price bars and technical indicators as pipe-separated tables with rounded values.
+    The most recent rows are kept when the tables do not fit in the budget, and half of the
+    budget is reserved for the indicators.
+    """
+    if not stock_price_indicators:
+        return ""
+
+    # technical indicators, one row per date
+    indicators = stock_price_indicators.indicators
+    indicator_rows = [
+        " | ".join([date] + ["" if value is None else _format_number(value, decimals) for value in values])
+        for date, values in indicators.rows()
+    ]
+    indicator_text = _fit_rows(
+        ["Technical indicators", " | ".join(["Date", *indicators.names])], indicator_rows, budget // 2, count_tokens
+    )
+
+    # price bars, one row per date
+    prices = stock_price_indicators.prices
+    price_rows = [
+        " | ".join([date] + [_format_number(value, decimals) for value in values])
+        for date, values in prices.rows()
+    ]
+    price_text = _fit_rows(
+        ["Stock prices", " | ".join(["Date", *prices.fields])], price_rows,
+        budget - count_tokens(indicator_text), count_tokens
+    )
+    return "\n\n".join(text for text in (price_text, indicator_text) if text)
+
+
+def compact_statements(financial_statements: "list[Statement]", budget: int=DEFAULT_TOKEN_BUDGET,
+                       count_tokens: Callable[[str], int]=estimate_tokens) -> str:
+    """
+    Format the financial statements as one table per statement, with a row per line item and
+    a column per period. The oldest periods are dropped first, then the last statements and,
+    if a single period of a single statement still does not fit, its last line items, until the
+    text fits in the budget.
+    """
+    tables = []
+    for statement in financial_statements or []:
+        if not statement.periods:
+            continue
+        title = f"{statement.title} ({statement.period_type})" if statement.period_type else statement.title
+        tables.append((title, list(statement.periods), dict(statement.items)))
+
+    # keep dropping the oldest period (last column) until every table fits
+    n_periods = max((len(periods) for _, periods, _ in tables), default=0)
+    while True:
+        text = "\n\n".join(
+            "\n".join(
+                [title, " | ".join(["Item"] + periods[:n_periods])]
+                + [" | ".join([item, *values[:n_periods]]) for item, values in items.items()]
+            )
+            for title, periods, items in tables
+        )
+        if count_tokens(text) <= budget or (n_periods <= 1 and len(tables) <= 1):
+            break
+        if n_periods > 1:
+            n_periods -= 1
+        else:
+            tables = tables[:-1]
+    if count_tokens(text) <= budget:
+        return text
+
+    # the line items of the remaining table are kept in their order (the main ones come first)
+    title, periods, items = tables[0]
+    header = [title, " | ".join(["Item"] + periods[:1])]
+    rows = [" | ".join([item, *values[:1]]) for item, values in items.items()]
+    while rows and count_tokens("\n".join(header + rows)) > budget:
+        rows = rows[:-1]
+    return "\n".join(header + rows) if rows else ""
+
+
+def _relevance(title: str, text: str, stock_ticker: str) -> int:
+    """
+    Score an article by how many times it mentions the stock ticker (title mentions count double).
+    """
+    pattern = re.compile(rf"\b{re.escape(stock_ticker)}\b", re.IGNORECASE)
+    return 2 * len(pattern.findall(title)) + len(pattern.findall(text))
+
+
+def fit_articles(articles: list[tuple[str, str]], stock_ticker: str, budget: int=DEFAULT_TOKEN_BUDGET,
+                 count_tokens: Callable[[str], int]=estimate_tokens) -> list[tuple[str, str]]:
+    """
+    Fit the (title, text) articles in the budget. Articles are ranked by relevance to the stock
+    (keeping their original order on ties), the budget is shared evenly among them with unused
+    tokens passed on to the others, and each article is truncated to its share. Returns the
+    (title, truncated text) of the articles that got a share, most relevant first.
+    """
+    ranked = sorted(
+        enumerate(articles), key=lambda item: (-_relevance(item[1][0], item[1][1], stock_ticker), item[0])
+    )
+
+    # water-filling: shorter articles get what they need, longer ones share the rest
+    needs = {i: count_tokens(f"Title: {title}\n{text}") for i, (title, text) in ranked}
+    shares = {}
+    remaining, left = budget, len(ranked)
+    for i, _ in sorted(ranked, key=lambda item: needs[item[0]]):
+        shares[i] = min(needs[i], remaining // left)
+        remaining -= shares[i]
+        left -= 1
+
+    fitted = []
+    for i, (title, text) in ranked:
+        if shares[i] < min(needs[i], MIN_ARTICLE_TOKENS):
+            continue
+        section = f"Title: {title}\n{text}"
+        if needs[i] > shares[i]:
+            # truncate proportionally to the share, then trim until it fits
+            section = section[:int(len(section) * shares[i] / needs[i])]
+            while section and count_tokens(section) > shares[i]:
+                section = section[:int(len(section) * 0.95)]
+        fitted.append((title, section[len(f"Title: {title}\n"):]))
+    return fitted
+
+
+def format_articles(articles: list[tuple[str, str]]) -> str:
+    """
+    Format (title, text) articles, i.e. the ones fitted in the budget by `fit_articles`, as a text.
+    """
+    return "\n\n".join(f"Title: {title}\n{text}" for title, text in articles)
+
+
+def render_contexts(state: dict, names: list[str], budget: int=DEFAULT_TOKEN_BUDGET) -> dict[str, str]:
+    """
+    Render the prompt variables among `names` that hold the fetched data of the state as text
+    (`indicators_context`, `statements_context` and `news_context`). The articles of the state
+    are expected to be fitted in the budget already (see `combine_stock_data`).
+    """
+    renderers = {
+        "indicators_context": lambda: compact_indicators(state.get("stock_price_indicators"), budget=budget),
+        "statements_context": lambda: compact_statements(state.get("financial_statements", []), budget=budget),
+        "news_context": lambda: format_articles(state.get("news_results", []))
+    }
+    return {name: renderers[name]() for name in names if name in renderers}
@@ -0,0 +1,237 @@
+"""
+File containing the data-access layer of the external data services (yahoo finance and serpapi).
+Concurrent identical requests share a single in-flight call (single-flight), and the ones that
+follow it within a minute reuse its result. All the requests of the process to a service reuse the
+same http session and connection pool, and requests that fail with a transient error are retried
+with backoff. The blocking calls of asynchronous runs go to dedicated, bounded thread pools.
+"""
+import json
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+import datetime as dt
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.profiling import count_fetched_bytes
+from utils.rate_limit import wait_for
+from utils.retry import call_with_retry, DEFAULT_RETRY_ATTEMPTS
+
+
+# seconds for which the result of a request is reused by identical requests
+RECENT_RESULT_TTL = 60
+# threads of the executors that run the blocking calls of the asynchronous runs, per kind of call
+EXECUTOR_THREADS = {"data": 16, "article": 32}
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces calls with the same key: the first caller runs the function, while the callers
+    that arrive before it finishes wait for its result (or exception) instead of calling it
+    again. Successful results are also kept for `ttl` seconds, so that the callers of a burst
+    that arrive after the call finished (i.e. because a bounded executor runs them one after
+    the other) reuse it as well. Results are shared, so callers must not modify them.
+    """
+    def __init__(self, ttl: float=RECENT_RESULT_TTL):
+        self.ttl = ttl
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        # results of finished calls, as {key: (expiry time, result)}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Any, func: Callable, *args, **kwargs):
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None and recent[0] > time.monotonic():
+                self.shared += 1
+                return recent[1]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.error is None and self.ttl > 0:
+                    now = time.monotonic()
+                    self._recent = {other: recent for other, recent in self._recent.items() if recent[0] > now}
+                    self._recent[key] = (now + self.ttl, call.result)
+            call.done.set()
+
+    def clear(self):
+        """
+        Drop the results of the finished calls, so that the next calls are made again.
+        """
+        with self._lock:
+            self._recent.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the number of calls that were made, and of calls that shared an in-flight or recent one.
+        """
+        return {"calls": self.calls, "shared": self.shared}
+
+
+# in-flight requests of the process, by service
+_flights = {"yahoo": SingleFlight(), "serpapi": SingleFlight(), "article": SingleFlight()}
+
+# http sessions of the process, by service
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _count_response(response: requests.Response, *args, **kwargs):
+    # streamed responses (i.e. articles) are counted by their readers, as they may not be read to the end
+    if not kwargs.get("stream"):
+        count_fetched_bytes(len(response.content))
+
+
+def get_session(service: str) -> requests.Session:
+    """
+    Returns the http session of a service, creating it on first use, so that all the requests of
+    the process to the service reuse its cookies and connection pool. The size of every response
+    is added to the fetched bytes of the node that made the request.
+    """
+    with _sessions_lock:
+        if service not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(_count_response)
+            _sessions[service] = session
+        return _sessions[service]
+
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    """
+    Returns the thread pool of a kind of blocking call ('data' for the data nodes, 'article' for
+    the article downloads), shared by the asynchronous runs of the process. Blocking calls do not
+    use the default executor of the event loop, so they can not exhaust it (or each other's pool).
+    """
+    with _executors_lock:
+        if kind not in _executors:
+            _executors[kind] = ThreadPoolExecutor(max_workers=EXECUTOR_THREADS[kind], thread_name_prefix=f"{kind}-io")
+        return _executors[kind]
+
+
+async def run_blocking(kind: str, func: Callable, *args, **kwargs):
+    """
+    Run a blocking call in the thread pool of its kind (see `get_executor`) without blocking the event
+    loop. Like `asyncio.to_thread`, the call runs in a copy of the caller's context, so that its fetched
+    bytes are counted for the calling node. A call that did not start yet is dropped if the caller is
+    cancelled, while a running one has to stop on its own (i.e. see the `cancel` event of `download_article`).
+    """
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(kind), call)
+
+
+def single_flight(service: str, key: Any, func: Callable, *args, **kwargs):
+    """
+    Run a request to a service, or wait for the identical one that is already in flight.
+    """
+    return _flights[service].do(key, func, *args, **kwargs)
+
+
+def clear_recent_results():
+    """
+    Drop the recent results of every service, so that the next requests reach the services again.
+    """
+    for flight in _flights.values():
+        flight.clear()
+
+
+def coalescing_stats() -> dict:
+    """
+    Return the number of requests made and shared per service.
+    """
+    return {service: flight.stats() for service, flight in _flights.items()}
+
+
+def yahoo_download(tickers: list[str], start: dt.datetime, interval: str='1wk', group_by: str='ticker',
+                   attempts: int=DEFAULT_RETRY_ATTEMPTS):
+    """
+    Downloads the price data of the given tickers from yahoo finance, from `start` until now.
+    Concurrent (and recent) downloads of the same tickers from the same day share a single request
+    (which is attempted up to `attempts` times on transient errors).
+    """
+    import yfinance as yf
+
+    def download():
+        wait_for("yahoo")
+        return yf.download(
+            tickers,
+            start=start,
+            end=dt.datetime.now(),
+            interval=interval,
+            group_by=group_by,
+            session=get_session("yahoo")
+        )
+
+    key = ("download", tuple(tickers), start.strftime('%Y-%m-%d'), interval, group_by)
+    return single_flight("yahoo", key, call_with_retry, download, attempts=attempts)
+
+
+def yahoo_info(ticker: str, attempts: int=DEFAULT_RETRY_ATTEMPTS) -> dict:
+    """
+    Returns the info (key statistics) of a ticker from yahoo finance. Concurrent (and recent) requests
+    for the same ticker share a single request (which is attempted up to `attempts` times on transient errors).
+    """
+    import yfinance as yf
+
+    def info():
+        # the ticker object caches its info, so a new one is made for every request (on the shared session)
+        stock = yf.Ticker(ticker, session=get_session("yahoo"))
+        wait_for("yahoo")
+        return stock.info
+
+    return single_flight("yahoo", ("info", ticker), call_with_retry, info, attempts=attempts)
+
+
+def serpapi_search(params: dict, attempts: int=DEFAULT_RETRY_ATTEMPTS) -> dict:
+    """
+    Returns the results of a serpapi search as a dictionary. Concurrent (and recent) identical searches
+    share a single request (which is attempted up to `attempts` times on transient errors).
+    """
+    import serpapi
+
+    def search():
+        client = serpapi.Client(api_key=params.get("api_key"))
+        client.session = get_session("serpapi")
+        wait_for("serpapi")
+        return client.search(dict(params)).as_dict()
+
+    return single_flight("serpapi", json.dumps(params, sort_keys=True, default=str), call_with_retry, search, attempts=attempts)
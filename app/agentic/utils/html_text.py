@@ -0,0 +1,132 @@
+"""
+File containing a streaming extractor that converts html to human-readable text.
+"""
+import codecs
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+# tags whose whole subtree is skipped during extraction
+SKIPPED_TAGS = {"script", "style", "nav", "noscript", "template"}
+
+
+class _TextCollector:
+    """
+    Collects the text of an html document from parser events, ignoring the contents
+    of skipped tags and stopping once `max_chars` characters have been collected.
+    """
+    def __init__(self, max_chars: int | None=None):
+        self.max_chars = max_chars
+        self.parts = []
+        self.size = 0
+        self.skip_depth = 0
+        self.done = False
+
+    def start(self, tag: str, attrs=None):
+        if tag.lower() in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag: str):
+        if tag.lower() in SKIPPED_TAGS and self.skip_depth > 0:
+            self.skip_depth -= 1
+
+    def data(self, data: str):
+        if self.skip_depth > 0 or self.done:
+            return
+        self.parts.append(data)
+        self.size += len(data.strip())
+        if self.max_chars is not None and self.size >= self.max_chars:
+            self.done = True
+
+    def close(self) -> str:
+        # break into lines and remove leading and trailing space on each
+        lines = (line.strip() for line in "".join(self.parts).splitlines())
+        # drop blank lines and form the final extracted text
+        text = "\n".join(line for line in lines if line)
+        return text[:self.max_chars].rstrip() if self.max_chars is not None else text
+
+
+class _StdlibParser(HTMLParser):
+    """
+    Event-based html parser from the standard library, forwarding events to a collector.
+    """
+    def __init__(self, collector: _TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class StreamingTextExtractor:
+    """
+    Incrementally extracts text from html that is fed in chunks, without building
+    a document tree. The contents of script, style and navigation elements are skipped,
+    and extraction stops after `max_chars` characters of text.
+
+    Parameter `engine` selects the underlying parser: 'lxml', 'html.parser' or 'auto'
+    (lxml when it is installed, else html.parser).
+    """
+    def __init__(self, max_chars: int | None=None, engine: str="auto", encoding: str="utf-8"):
+        if engine == "auto":
+            engine = "lxml" if etree is not None else "html.parser"
+
+        self.collector = _TextCollector(max_chars)
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        if engine == "lxml":
+            if etree is None:
+                raise ImportError("Engine 'lxml' requires the lxml package!")
+            self.parser = etree.HTMLParser(target=self.collector, no_network=True)
+        elif engine == "html.parser":
+            self.parser = _StdlibParser(self.collector)
+        else:
+            raise ValueError(f"Engine '{engine}' is not supported!")
+
+    @property
+    def done(self) -> bool:
+        return self.collector.done
+
+    def feed(self, chunk: bytes | str) -> bool:
+        """
+        Feed the next chunk of the document and return whether enough text has been extracted.
+        """
+        if not self.done:
+            if isinstance(chunk, bytes):
+                chunk = self.decoder.decode(chunk)
+            self.parser.feed(chunk)
+        return self.done
+
+    def close(self) -> str:
+        """
+        Finish parsing and return the extracted text.
+        """
+        try:
+            if not self.done:
+                self.parser.feed(self.decoder.decode(b"", final=True))
+            self.parser.close()
+        except Exception:
+            # lxml raises if it was closed early, but the text collected so far is still valid
+            pass
+        return self.collector.close()
+
+
+def html_to_text(html: bytes | str, max_chars: int | None=None, engine: str="auto",
+                 encoding: str="utf-8", chunk_size: int=16384) -> str:
+    """
+    Extracts text from a complete html document, feeding it to a streaming extractor in chunks.
+    """
+    extractor = StreamingTextExtractor(max_chars=max_chars, engine=engine, encoding=encoding)
+    for i in range(0, len(html), chunk_size):
+        if extractor.feed(html[i:i + chunk_size]):
+            break
+    return extractor.close()
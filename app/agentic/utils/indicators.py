@@ -0,0 +1,295 @@
+"""
+File containing a vectorized engine for the technical indicators used in the reports.
+
+Indicators are computed with NumPy over column-stacked (dates x tickers) arrays, so that
+a whole watchlist is processed in a few passes. The formulas follow the `ta` library
+(RSIIndicator, StochasticOscillator, MACD and volume_weighted_average_price) with their
+default parameters.
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from states.records import IndicatorSeries, PriceIndicators, PriceSeries
+
+
+# names of the computed indicators, in the order they appear in the results
+INDICATORS = ["RSI", "Stochastic_Oscillator", "MACD", "MACD_Signal", "volume_weighted_average_price"]
+
+RSI_WINDOW = 14
+STOCH_WINDOW = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+VWAP_WINDOW = 14
+# version of the format of the persisted `IncrementalIndicators` states (older states are rebuilt)
+INDICATOR_STATE_VERSION = 2
+
+
+def ema(values: np.ndarray, alpha: float, min_periods: int=0) -> np.ndarray:
+    """
+    Exponential moving average along the first axis, equivalent to pandas'
+    `ewm(alpha=alpha, min_periods=min_periods, adjust=False).mean()` applied to each column.
+    Leading NaNs are skipped, so every column starts at its first valid value.
+    """
+    out = np.full(values.shape, np.nan)
+    prev = np.full(values.shape[1:], np.nan)
+    count = np.zeros(values.shape[1:], dtype=int)
+    for t in range(values.shape[0]):
+        x = values[t]
+        valid = ~np.isnan(x)
+        # columns without a previous average start from the current value
+        prev = np.where(valid, np.where(np.isnan(prev), x, (1 - alpha) * prev + alpha * x), prev)
+        count += valid
+        out[t] = np.where(count >= max(min_periods, 1), prev, np.nan)
+    return out
+
+
+def _rolling(values: np.ndarray, window: int, reduce) -> np.ndarray:
+    """
+    Rolling reduction along the first axis, with NaN for incomplete windows
+    (like pandas' `rolling(window, min_periods=window)`).
+    """
+    out = np.full(values.shape, np.nan)
+    if values.shape[0] >= window:
+        # windows have shape (T - window + 1, N, window); NaNs propagate through the reduction
+        out[window - 1:] = reduce(sliding_window_view(values, window, axis=0), axis=-1)
+    return out
+
+
+def rsi(close: np.ndarray, window: int=RSI_WINDOW) -> np.ndarray:
+    """Relative Strength Index."""
+    diff = np.diff(close, axis=0, prepend=np.nan)
+    # the first bar of each column counts as a zero change, bars before it are missing
+    missing = np.isnan(close)
+    up = np.where(missing, np.nan, np.where(diff > 0, diff, 0.0))
+    down = np.where(missing, np.nan, np.where(diff < 0, -diff, 0.0))
+
+    ema_up = ema(up, alpha=1 / window, min_periods=window)
+    ema_down = ema(down, alpha=1 / window, min_periods=window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ema_down == 0, 100.0, 100 - 100 / (1 + ema_up / ema_down))
+
+
+def stochastic_oscillator(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                          window: int=STOCH_WINDOW) -> np.ndarray:
+    """Stochastic Oscillator (%K)."""
+    lowest = _rolling(low, window, np.min)
+    highest = _rolling(high, window, np.max)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100 * (close - lowest) / (highest - lowest)
+
+
+def macd(close: np.ndarray, fast: int=MACD_FAST, slow: int=MACD_SLOW,
+         signal: int=MACD_SIGNAL) -> tuple[np.ndarray, np.ndarray]:
+    """Moving Average Convergence Divergence line and its signal line."""
+    line = ema(close, alpha=2 / (fast + 1), min_periods=fast) - ema(close, alpha=2 / (slow + 1), min_periods=slow)
+    return line, ema(line, alpha=2 / (signal + 1), min_periods=signal)
+
+
+def volume_weighted_average_price(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                                  volume: np.ndarray, window: int=VWAP_WINDOW) -> np.ndarray:
+    """Rolling Volume Weighted Average Price."""
+    typical_price = (high + low + close) / 3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _rolling(typical_price * volume, window, np.sum) / _rolling(volume, window, np.sum)
+
+
+def compute_indicators(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                       volume: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Compute all the indicators on (dates x tickers) price arrays. Returns a dictionary
+    mapping each indicator name to a (dates x tickers) array.
+    """
+    macd_line, macd_signal = macd(close)
+    return {
+        "RSI": rsi(close),
+        "Stochastic_Oscillator": stochastic_oscillator(high, low, close),
+        "MACD": macd_line,
+        "MACD_Signal": macd_signal,
+        "volume_weighted_average_price": volume_weighted_average_price(high, low, close, volume),
+    }
+
+
+def compute_indicators_frame(frames: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Compute the indicators of many tickers at once. Takes a dictionary mapping each ticker to its
+    price dataframe (indexed by date, with High, Low, Close and Volume columns) and returns a
+    single dataframe indexed by date, with (indicator, ticker) columns.
+
+    The price data of all the tickers is aligned on the union of their dates.
+    """
+    tickers = list(frames)
+    if not tickers:
+        return pd.DataFrame()
+
+    # column-stack every price field into a (dates x tickers) array
+    prices = {
+        field: pd.concat({ticker: frames[ticker][field] for ticker in tickers}, axis=1).sort_index()
+        for field in ["High", "Low", "Close", "Volume"]
+    }
+    dates = prices["Close"].index
+    arrays = {field: df.to_numpy(dtype=float) for field, df in prices.items()}
+
+    results = compute_indicators(arrays["High"], arrays["Low"], arrays["Close"], arrays["Volume"])
+    columns = pd.MultiIndex.from_product([INDICATORS, tickers], names=["indicator", "ticker"])
+    return pd.DataFrame(np.concatenate([results[name] for name in INDICATORS], axis=1), index=dates, columns=columns)
+
+
+def compute_stock_price_indicators(df: pd.DataFrame, indicators: pd.DataFrame | None=None) -> PriceIndicators:
+    """
+    Computes technical indicators on the price data of a single stock and returns them
+    along with the price data, as the `stock_price_indicators` record of the graph state.
+
+    If `indicators` is given (a dataframe indexed by date with a column per indicator, i.e.
+    the slice of `compute_indicators_frame` for this stock), it is used instead of computing them.
+    """
+    if indicators is None:
+        indicators = compute_indicators_frame({"stock": df}).droplevel("ticker", axis=1)
+
+    # keep the last 12 points of each indicator
+    return PriceIndicators(PriceSeries.from_frame(df), IndicatorSeries.from_frame(indicators.iloc[-12:], INDICATORS))
+
+
+class IncrementalIndicators:
+    """
+    Keeps the state of every indicator (EMA accumulators, monotonic high/low windows and running
+    price-volume sums) for a single ticker, so that each new bar updates the indicators in
+    amortized O(1) instead of recomputing them over the whole history (or over their windows).
+    The state can be persisted with `to_dict` and restored with `from_dict`.
+
+    Since the EMA-based indicators (RSI, MACD) remember every bar since the state was created,
+    their values may slightly differ from a recompute over a shorter window of history; the
+    difference decays geometrically with the number of bars.
+    """
+    def __init__(self, history: int=12):
+        self.version = INDICATOR_STATE_VERSION
+        self.history = history
+        self.last_date = None
+        # number of bars added to the state, which indexes the bars in the stochastic windows
+        self.bars = 0
+        # RSI state
+        self.prev_close = None
+        self.rsi_up = self.rsi_down = None
+        self.rsi_count = 0
+        # MACD state
+        self.ema_fast = self.ema_slow = self.ema_signal = None
+        self.macd_count = self.signal_count = 0
+        # (bar index, value) windows of the stochastic oscillator, whose highs decrease and lows increase,
+        # so that the first entry of each is the highest high (lowest low) of the last STOCH_WINDOW bars
+        self.highs, self.lows = deque(), deque()
+        # (price-volume, volume) window of the VWAP, along with its running sums
+        self.vwap_window = deque()
+        self.pv_sum = self.volume_sum = 0.0
+        # most recent values of each indicator, as (date, value) pairs
+        self.recent = {name: [] for name in INDICATORS}
+
+    @staticmethod
+    def _ema_step(prev: float | None, value: float, alpha: float) -> float:
+        return value if prev is None else (1 - alpha) * prev + alpha * value
+
+    @staticmethod
+    def _push(window: list, value: float, size: int):
+        window.append(value)
+        if len(window) > size:
+            del window[0]
+
+    def _push_extreme(self, window: deque, value: float, sign: float):
+        """
+        Add a bar's value to a monotonic window of the stochastic oscillator (`sign` is 1 for the
+        highs and -1 for the lows), dropping the values it dominates and the ones that left the window.
+        """
+        while window and sign * window[-1][1] <= sign * value:
+            window.pop()
+        window.append((self.bars, value))
+        if window[0][0] <= self.bars - STOCH_WINDOW:
+            window.popleft()
+
+    def update(self, date: str, high: float, low: float, close: float, volume: float) -> dict[str, float]:
+        """
+        Add a new bar to the state and return the values of the indicators for it.
+        """
+        nan = float("nan")
+        values = {}
+
+        # RSI: the first bar counts as a zero change
+        change = 0.0 if self.prev_close is None else close - self.prev_close
+        self.rsi_up = self._ema_step(self.rsi_up, max(change, 0.0), 1 / RSI_WINDOW)
+        self.rsi_down = self._ema_step(self.rsi_down, max(-change, 0.0), 1 / RSI_WINDOW)
+        self.rsi_count += 1
+        self.prev_close = close
+        if self.rsi_count < RSI_WINDOW:
+            values["RSI"] = nan
+        elif self.rsi_down == 0:
+            values["RSI"] = 100.0
+        else:
+            values["RSI"] = 100 - 100 / (1 + self.rsi_up / self.rsi_down)
+
+        # stochastic oscillator over the rolling high/low window
+        self.bars += 1
+        self._push_extreme(self.highs, high, 1.0)
+        self._push_extreme(self.lows, low, -1.0)
+        values["Stochastic_Oscillator"] = nan
+        if self.bars >= STOCH_WINDOW:
+            lowest, highest = self.lows[0][1], self.highs[0][1]
+            if highest != lowest:
+                values["Stochastic_Oscillator"] = 100 * (close - lowest) / (highest - lowest)
+
+        # MACD line and signal line
+        self.ema_fast = self._ema_step(self.ema_fast, close, 2 / (MACD_FAST + 1))
+        self.ema_slow = self._ema_step(self.ema_slow, close, 2 / (MACD_SLOW + 1))
+        self.macd_count += 1
+        values["MACD"] = values["MACD_Signal"] = nan
+        if self.macd_count >= MACD_SLOW:
+            values["MACD"] = self.ema_fast - self.ema_slow
+            self.ema_signal = self._ema_step(self.ema_signal, values["MACD"], 2 / (MACD_SIGNAL + 1))
+            self.signal_count += 1
+            if self.signal_count >= MACD_SIGNAL:
+                values["MACD_Signal"] = self.ema_signal
+
+        # VWAP over the rolling price-volume window
+        pv = (high + low + close) / 3 * volume
+        self.vwap_window.append((pv, volume))
+        self.pv_sum += pv
+        self.volume_sum += volume
+        if len(self.vwap_window) > VWAP_WINDOW:
+            old_pv, old_volume = self.vwap_window.popleft()
+            self.pv_sum -= old_pv
+            self.volume_sum -= old_volume
+        values["volume_weighted_average_price"] = nan
+        if len(self.vwap_window) == VWAP_WINDOW and self.volume_sum != 0:
+            values["volume_weighted_average_price"] = self.pv_sum / self.volume_sum
+
+        for name, value in values.items():
+            self._push(self.recent[name], (date, value), self.history)
+        self.last_date = date
+        return values
+
+    def peek(self, date: str, high: float, low: float, close: float, volume: float) -> "IncrementalIndicators":
+        """
+        Return a copy of the state updated with a bar, leaving this state unchanged. Useful for
+        the latest bar, which may still change until its period closes.
+        """
+        state = IncrementalIndicators.from_dict(self.to_dict())
+        state.update(date, high, low, close, volume)
+        return state
+
+    def to_dict(self) -> dict:
+        """
+        Return the state as a json-serializable dictionary.
+        """
+        return {name: list(value) if isinstance(value, deque) else value for name, value in vars(self).items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IncrementalIndicators":
+        """
+        Restore a state created with `to_dict`.
+        """
+        state = cls()
+        for name, value in data.items():
+            setattr(state, name, value)
+        # json turns the (date, value) tuples into lists, and the windows into lists of lists
+        state.recent = {name: [tuple(item) for item in items] for name, items in state.recent.items()}
+        for name in ["highs", "lows", "vwap_window"]:
+            setattr(state, name, deque(tuple(item) for item in getattr(state, name)))
+        return state
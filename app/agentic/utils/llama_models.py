@@ -0,0 +1,49 @@
+"""
+File containing the llama.cpp chat models of the model pool, in their own module so that
+llama.cpp is only imported when a llama.cpp model is used.
+"""
+import threading
+from typing import Any, Iterator
+
+from pydantic import PrivateAttr
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_community.chat_models import ChatLlamaCpp
+
+
+class SerializedChatLlamaCpp(ChatLlamaCpp):
+    """
+    ChatLlamaCpp that runs a single generation at a time, since a llama.cpp context is not thread-safe.
+    """
+    # a plain lock, since streamed generations may be resumed from other threads
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None=None,
+                  run_manager: Any=None, **kwargs) -> ChatResult:
+        # streaming generations are serialized by `_stream`
+        if self.streaming:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        with self._lock:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None=None,
+                run_manager: Any=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        with self._lock:
+            yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+
+def with_prompt_cache(model: SerializedChatLlamaCpp, prompt_cache: str | None, prompt_cache_dir: str | None,
+                      prompt_cache_size: int) -> SerializedChatLlamaCpp:
+    """
+    Attach a prompt cache to the llama.cpp context of a model: the model state is saved after
+    every prompt, keyed by its tokens, and restored for later prompts that start with the same
+    tokens, so that the prefill of a shared prefix is skipped.
+    """
+    from llama_cpp import LlamaDiskCache, LlamaRAMCache
+
+    if prompt_cache == "ram":
+        model.client.set_cache(LlamaRAMCache(capacity_bytes=prompt_cache_size))
+    elif prompt_cache == "disk":
+        # the disk cache is shared by all the processes (and runs) that use the same directory
+        model.client.set_cache(LlamaDiskCache(cache_dir=prompt_cache_dir, capacity_bytes=prompt_cache_size))
+    return model
@@ -0,0 +1,173 @@
+"""
+File containing response caches for LLM calls, keyed by a hash of the rendered prompt
+and the identity of the model.
+"""
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable
+
+
+def llm_identity(runnable: Runnable) -> str:
+    """
+    Returns a description of the model and its sampling parameters.
+    """
+    # chat models describe themselves (class and parameters) through their llm string
+    try:
+        return runnable._get_llm_string()
+    except Exception:
+        return repr(runnable)
+
+
+def llm_cache_key(messages: list[BaseMessage], runnable: Runnable) -> str:
+    """
+    Returns a hash of the rendered prompt messages, the model and its sampling parameters.
+    """
+    payload = json.dumps({
+        "model": llm_identity(runnable),
+        "messages": [(message.type, message.content) for message in messages]
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMResponseCache(ABC):
+    """
+    Base class of the response caches. Entries expire after `ttl` seconds (never, if `ttl`
+    is None), and cache hits and misses are counted.
+    """
+    def __init__(self, ttl: float | None=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at >= self.ttl
+
+    def get(self, key: str) -> str | None:
+        """
+        Return the cached response for a key, or None if it is missing or expired.
+        """
+        response = self._get(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    @abstractmethod
+    def put(self, key: str, response: str):
+        """
+        Store the response for a key.
+        """
+
+    @abstractmethod
+    def _get(self, key: str) -> str | None:
+        """
+        Return the stored response for a key, or None if it is missing or expired.
+        """
+
+    # asynchronous versions, which run the lookups and writes in the default executor
+    # (so that on-disk caches do not block the event loop)
+
+    async def aget(self, key: str) -> str | None:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, response: str):
+        await asyncio.to_thread(self.put, key, response)
+
+    def stats(self) -> dict:
+        """
+        Return the number of hits and misses of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class InMemoryLLMCache(LLMResponseCache):
+    """
+    In-memory response cache, holding at most `max_entries` responses and evicting
+    the least recently used ones.
+    """
+    def __init__(self, ttl: float | None=None, max_entries: int=1024):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = (response, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # in-memory lookups do not block, so they run in the event loop
+
+    async def aget(self, key: str) -> str | None:
+        return self.get(key)
+
+    async def aput(self, key: str, response: str):
+        self.put(key, response)
+
+
+class SQLiteLLMCache(LLMResponseCache):
+    """
+    On-disk response cache, stored in a SQLite database inside `cache_dir`, so that
+    responses are reused across runs.
+    """
+    def __init__(self, cache_dir: str, ttl: float | None=None):
+        super().__init__(ttl)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, "llm_responses.sqlite")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open a connection to the cache database, commit on success and always close it.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get(self, key: str) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1]):
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+        return row[0]
+
+    def put(self, key: str, response: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, time.time()))
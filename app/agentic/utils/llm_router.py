@@ -0,0 +1,208 @@
+"""
+File containing a router that sends the prompts of an LLM node either to a small (fast) model or
+to the node's own (large) model: short prompts go to the small model, while long ones, and the
+ones whose small-model call fails, go to the large one. Latency and tokens are tracked per route.
+"""
+import json
+import time
+import logging
+import operator
+import threading
+from functools import reduce
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from utils.context import estimate_tokens
+from utils.llm_cache import llm_identity
+
+logger = logging.getLogger(__name__)
+
+
+# prompts of up to this many tokens are sent to the small model
+DEFAULT_ROUTER_MAX_TOKENS = 2048
+
+# prompts answered by the small model, sent to the large model because of their length,
+# and sent to the large model after the small model failed
+ROUTES = ("small", "large", "escalated")
+
+
+def _prompt_tokens(messages: list[BaseMessage]) -> int:
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+def _content(response: str | BaseMessage) -> str:
+    return response if isinstance(response, str) else str(response.content)
+
+
+class RouteStats:
+    """
+    Number of calls, wall time and tokens of every route, shared by the routers of a graph.
+    """
+    def __init__(self):
+        self.routes = {
+            route: {"calls": 0, "wall_time": 0.0, "prompt_tokens": 0, "completion_tokens": 0} for route in ROUTES
+        }
+        self._lock = threading.Lock()
+
+    def add(self, route: str, wall_time: float, messages: list[BaseMessage], response: str | BaseMessage):
+        """
+        Record a call of a route, using the token usage of the response (estimated if the model does not report it).
+        """
+        usage = getattr(response, "usage_metadata", None) or {}
+        with self._lock:
+            stats = self.routes[route]
+            stats["calls"] += 1
+            stats["wall_time"] += wall_time
+            stats["prompt_tokens"] += usage.get("input_tokens") or _prompt_tokens(messages)
+            stats["completion_tokens"] += usage.get("output_tokens") or estimate_tokens(_content(response))
+
+    def to_dict(self) -> dict:
+        """
+        Return the counters of every route (with their mean wall time), along with the savings of the
+        small route: the tokens that the large model did not process, and an estimate of the time
+        saved, i.e. the time the large model would have taken to generate the small route's responses
+        (at the seconds per generated token of the calls sent to it directly) minus the small route's time.
+        """
+        with self._lock:
+            routes = {
+                route: {**stats, "mean_wall_time": stats["wall_time"] / stats["calls"] if stats["calls"] else 0.0}
+                for route, stats in self.routes.items()
+            }
+        small, large = routes["small"], routes["large"]
+        saved_tokens = small["prompt_tokens"] + small["completion_tokens"]
+        saved_time = None
+        # generation, rather than prefill, dominates the latency of a call
+        if large["completion_tokens"]:
+            saved_time = large["wall_time"] / large["completion_tokens"] * small["completion_tokens"] - small["wall_time"]
+        return {"routes": routes, "saved_tokens": saved_tokens, "saved_time": saved_time}
+
+
+class LLMRouter(Runnable):
+    """
+    Runnable that takes the prompt messages of an LLM node and answers them with the `small` model
+    if they are at most `max_tokens` (estimated) tokens long, else with the `large` one. Prompts
+    whose small-model call raises, or returns an empty response, are escalated to the large model.
+
+    Responses are tagged with their route (in their `response_metadata`), and every call is
+    recorded in `stats`.
+    """
+    def __init__(self, small: Runnable, large: Runnable, max_tokens: int=DEFAULT_ROUTER_MAX_TOKENS,
+                 stats: RouteStats | None=None):
+        self.small = small
+        self.large = large
+        self.max_tokens = max_tokens
+        self.stats = stats if stats is not None else RouteStats()
+
+    def _get_llm_string(self) -> str:
+        # cached and archived responses depend on both models and on the routing threshold
+        return json.dumps({
+            "router": {"max_tokens": self.max_tokens},
+            "small": llm_identity(self.small),
+            "large": llm_identity(self.large)
+        }, sort_keys=True)
+
+    def route(self, messages: list[BaseMessage]) -> str:
+        """
+        Returns the route of a prompt, before any escalation ('small' or 'large').
+        """
+        return "small" if _prompt_tokens(messages) <= self.max_tokens else "large"
+
+    def _tag(self, route: str, wall_time: float, messages: list[BaseMessage], response):
+        self.stats.add(route, wall_time, messages, response)
+        if isinstance(response, AIMessage):
+            response.response_metadata = {**response.response_metadata, "route": route}
+        return response
+
+    @staticmethod
+    def _failed(response) -> bool:
+        return isinstance(response, Exception) or not _content(response).strip()
+
+    def _escalate(self, error: Any):
+        logger.info("Escalating a prompt to the large model after the small model %s",
+                    f"failed with {error!r}" if isinstance(error, Exception) else "returned an empty response")
+
+    def invoke(self, input: list[BaseMessage], config: RunnableConfig | None=None, **kwargs) -> BaseMessage:
+        start = time.perf_counter()
+        if self.route(input) == "large":
+            response = self.large.invoke(input, config, **kwargs)
+            return self._tag("large", time.perf_counter() - start, input, response)
+        try:
+            response = self.small.invoke(input, config, **kwargs)
+        except Exception as e:
+            response = e
+        if not self._failed(response):
+            return self._tag("small", time.perf_counter() - start, input, response)
+        self._escalate(response)
+        # the latency of an escalated prompt includes the failed call of the small model
+        response = self.large.invoke(input, config, **kwargs)
+        return self._tag("escalated", time.perf_counter() - start, input, response)
+
+    async def ainvoke(self, input: list[BaseMessage], config: RunnableConfig | None=None, **kwargs) -> BaseMessage:
+        start = time.perf_counter()
+        if self.route(input) == "large":
+            response = await self.large.ainvoke(input, config, **kwargs)
+            return self._tag("large", time.perf_counter() - start, input, response)
+        try:
+            response = await self.small.ainvoke(input, config, **kwargs)
+        except Exception as e:
+            response = e
+        if not self._failed(response):
+            return self._tag("small", time.perf_counter() - start, input, response)
+        self._escalate(response)
+        response = await self.large.ainvoke(input, config, **kwargs)
+        return self._tag("escalated", time.perf_counter() - start, input, response)
+
+    def stream(self, input: list[BaseMessage], config: RunnableConfig | None=None, **kwargs) -> Iterator:
+        start = time.perf_counter()
+        route = self.route(input)
+        if route == "small":
+            chunks = []
+            try:
+                for chunk in self.small.stream(input, config, **kwargs):
+                    chunks.append(chunk)
+                    yield chunk
+                response = reduce(operator.add, chunks) if chunks else ""
+            except Exception as e:
+                # a response that was partially streamed can not be taken back
+                if any(_content(chunk).strip() for chunk in chunks):
+                    raise
+                response = e
+            if not self._failed(response):
+                self._tag("small", time.perf_counter() - start, input, response)
+                return
+            self._escalate(response)
+            route = "escalated"
+
+        chunks = []
+        for chunk in self.large.stream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._tag(route, time.perf_counter() - start, input, reduce(operator.add, chunks) if chunks else "")
+
+    async def astream(self, input: list[BaseMessage], config: RunnableConfig | None=None, **kwargs) -> AsyncIterator:
+        start = time.perf_counter()
+        route = self.route(input)
+        if route == "small":
+            chunks = []
+            try:
+                async for chunk in self.small.astream(input, config, **kwargs):
+                    chunks.append(chunk)
+                    yield chunk
+                response = reduce(operator.add, chunks) if chunks else ""
+            except Exception as e:
+                if any(_content(chunk).strip() for chunk in chunks):
+                    raise
+                response = e
+            if not self._failed(response):
+                self._tag("small", time.perf_counter() - start, input, response)
+                return
+            self._escalate(response)
+            route = "escalated"
+
+        chunks = []
+        async for chunk in self.large.astream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._tag(route, time.perf_counter() - start, input, reduce(operator.add, chunks) if chunks else "")
@@ -0,0 +1,71 @@
+"""
+File containing a process-level pool of chat models, so that every model (i.e. a multi-GB
+llama.cpp GGUF file) is loaded once and shared by all the FinanceGraph instances of the process.
+"""
+import json
+import threading
+from typing import Callable, Literal
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+# loaded models, keyed by their serving type and initialization parameters
+_models = {}
+_models_lock = threading.Lock()
+
+
+def pooled_model(type: str, params: dict, factory: Callable[[], BaseChatModel]) -> BaseChatModel:
+    """
+    Returns the pooled model of the given serving type and parameters, creating it with
+    `factory` on first use. Concurrent first uses create the model only once.
+    """
+    key = (type, json.dumps(params, sort_keys=True, default=str))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = factory()
+        return _models[key]
+
+
+def clear_pool():
+    """
+    Drop every pooled model, so that their memory is released once they are no longer used.
+    """
+    with _models_lock:
+        _models.clear()
+
+
+def llama_cpp_model(model_path: str, prompt_cache: Literal["ram", "disk"] | None=None,
+                    prompt_cache_dir: str | None=None, prompt_cache_size: int=2*1024**3, **params) -> BaseChatModel:
+    """
+    Returns the pooled llama.cpp chat model of a model file. The weights are memory-mapped,
+    so that processes that load the same file share its pages, and calls to the model are
+    serialized, since a llama.cpp context is not thread-safe.
+
+    If `prompt_cache` is given, the model states of previous prompts are kept in memory, or on disk
+    inside `prompt_cache_dir` (up to `prompt_cache_size` bytes), and reused for prompts that share
+    a prefix with them.
+    """
+    # llama.cpp is only imported when it is used
+    from utils.llama_models import SerializedChatLlamaCpp, with_prompt_cache
+
+    if prompt_cache == "disk" and prompt_cache_dir is None:
+        raise ValueError("An on-disk prompt cache requires a cache directory!")
+    cache = (prompt_cache, prompt_cache_dir, prompt_cache_size)
+    params = {"use_mmap": True, "use_mlock": False, **params}
+    return pooled_model(
+        "llama-cpp", {"model_path": model_path, "prompt_cache": cache, **params},
+        lambda: with_prompt_cache(SerializedChatLlamaCpp(model_path=model_path, **params), *cache)
+    )
+
+
+def ollama_model(base_url: str, model: str, **params) -> BaseChatModel:
+    """
+    Returns the pooled Ollama chat model of a server and model, so that its http connections
+    are reused. The weights themselves are held (once) by the Ollama server, which also reuses
+    the cached prefill of a prompt prefix for as long as the model stays loaded (see `keep_alive`).
+    """
+    from langchain_ollama import ChatOllama
+
+    return pooled_model(
+        "ollama", {"base_url": base_url, "model": model, **params},
+        lambda: ChatOllama(base_url=base_url, model=model, **params)
+    )
@@ -0,0 +1,76 @@
+"""
+File containing the process pool of the CPU-bound work of the deterministic nodes (html parsing
+and technical indicators), so that in batch runs it is spread over all the cores instead of
+competing for the GIL of the process with the other runs and the LLM calls.
+"""
+import logging
+import importlib
+import threading
+import multiprocessing
+from typing import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+# modules of the functions that run in the pools, imported by every worker when it starts
+WORKER_MODULES = ("utils.html_text", "utils.indicators")
+
+# process pools of the process, by number of workers
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _init_worker(modules: tuple[str, ...]):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the pool of the process with the given number of worker processes, creating it on
+    first use, so that all the FinanceGraph instances of the process (i.e. the workers of the
+    daemon) share it. Workers are spawned rather than forked, so that they do not inherit the
+    threads and the loaded models of this process. They start right away, in the background, so
+    that they are ready (with `WORKER_MODULES` imported) by the time the first runs need them.
+    """
+    if workers < 1:
+        raise ValueError("A process pool needs at least one worker!")
+    with _pools_lock:
+        if workers not in _pools:
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(WORKER_MODULES,)
+            )
+            # every submitted task starts a worker, until there are `workers` of them
+            for _ in range(workers):
+                pool.submit(int)
+            _pools[workers] = pool
+        return _pools[workers]
+
+
+def run_in_pool(pool: Executor | None, func: Callable, *args, **kwargs):
+    """
+    Run a function in a pool and wait for its result, or run it in the calling thread if there is
+    no pool (or if a worker of the pool died). The function and its arguments are pickled, so they
+    should be module-level functions and compact values (i.e. bytes and arrays, not open files).
+    """
+    if pool is None:
+        return func(*args, **kwargs)
+    try:
+        return pool.submit(func, *args, **kwargs).result()
+    except BrokenProcessPool as e:
+        logger.warning("Process pool is broken (%s), running %s in this process", e, func.__name__)
+        return func(*args, **kwargs)
+
+
+def shutdown_pools():
+    """
+    Stop the worker processes of every pool, once their running tasks are done.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,265 @@
+"""
+File containing the instrumentation of the graph nodes: per-run traces with the wall time,
+fetched bytes, LLM token counts and memory of every node, and aggregate counters over
+many runs.
+"""
+import json
+import time
+import uuid
+import inspect
+import threading
+import contextvars
+import tracemalloc
+from typing import Callable
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+
+
+class RunTrace:
+    """
+    Trace of a single run of the graph, holding one record per executed node. The size of the
+    outputs of the nodes is only measured if `measure_outputs` is set.
+    """
+    def __init__(self, measure_outputs: bool=False, **metadata):
+        self.run_id = str(uuid.uuid4())
+        self.measure_outputs = measure_outputs
+        self.metadata = metadata
+        self.started_at = time.time()
+        self.finished_at = None
+        self.nodes = []
+        # errors of the run that happened outside of its nodes (i.e. in the bulk steps of `FinanceGraph.run_many`)
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.nodes.append(record)
+
+    def add_error(self, error: str):
+        with self._lock:
+            self.errors.append(error)
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            **self.metadata,
+            "started_at": self.started_at,
+            "wall_time": (self.finished_at or time.time()) - self.started_at,
+            "nodes": list(self.nodes),
+            "errors": list(self.errors)
+        }
+
+    def save(self, path: str):
+        """
+        Write the trace in a .json file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class Profiler:
+    """
+    Collects the traces of many runs and keeps aggregate counters per node (number of runs,
+    total and max wall time, fetched and output bytes, tokens, errors and the max peak memory of
+    the runs whose memory was measured), along with the last trace. Output bytes are only counted
+    if `measure_outputs` is set, since measuring them serializes the output of every node.
+    """
+    COUNTERS = ["wall_time", "bytes_fetched", "output_bytes", "prompt_tokens", "completion_tokens", "errors"]
+
+    def __init__(self, measure_outputs: bool=False):
+        self.measure_outputs = measure_outputs
+        self.runs = 0
+        self.last_trace = None
+        self.nodes = {}
+        self._lock = threading.Lock()
+
+    def new_trace(self, **metadata) -> RunTrace:
+        return RunTrace(measure_outputs=self.measure_outputs, **metadata)
+
+    def add(self, trace: RunTrace):
+        """
+        Finish a trace and add its records to the aggregate counters.
+        """
+        trace.finish()
+        with self._lock:
+            self.runs += 1
+            self.last_trace = trace
+            for record in trace.nodes:
+                stats = self.nodes.setdefault(
+                    record["node"], {
+                        "count": 0, "max_wall_time": 0.0, "memory_count": 0, "max_peak_memory": None,
+                        **{name: 0 for name in self.COUNTERS}
+                    }
+                )
+                stats["count"] += 1
+                stats["max_wall_time"] = max(stats["max_wall_time"], record["wall_time"])
+                if record["peak_memory"] is not None:
+                    stats["memory_count"] += 1
+                    stats["max_peak_memory"] = max(stats["max_peak_memory"] or 0, record["peak_memory"])
+                for name in self.COUNTERS:
+                    stats[name] += len(record[name]) if name == "errors" else record[name]
+
+    def aggregate(self) -> dict:
+        """
+        Return the aggregate counters of every node, including its mean wall time.
+        """
+        with self._lock:
+            return {
+                node: {**stats, "mean_wall_time": stats["wall_time"] / stats["count"]}
+                for node, stats in self.nodes.items()
+            }
+
+
+class _Measurement:
+    """
+    Measurements of a node execution: its start, the bytes it fetched from the network, and the
+    traced memory when it started (if it is the only node running, see `_start`).
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.bytes_fetched = 0
+        self.memory_start = None
+        # whether another node ran at the same time, in which case the process-wide peak is not its own
+        self.overlapped = False
+        self._lock = threading.Lock()
+
+    def add_bytes(self, size: int):
+        with self._lock:
+            self.bytes_fetched += size
+
+
+# measurement of the node that runs in the current context (the threads and tasks it starts inherit it)
+_current = contextvars.ContextVar("node_measurement", default=None)
+# measurements of the nodes that are running in the process
+_running = set()
+_running_lock = threading.Lock()
+
+
+def count_fetched_bytes(size: int):
+    """
+    Add the size of a response body received from the network to the node that requested it (if any).
+    """
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.add_bytes(size)
+
+
+def _output_size(update: dict) -> int:
+    """
+    Size in bytes of the data returned by a node, as json (with the records of the state as dictionaries).
+    """
+    from states.records import to_json
+
+    try:
+        return len(json.dumps(update, default=to_json).encode())
+    except Exception:
+        return 0
+
+
+def _record(name: str, measurement: _Measurement, update, error: Exception | None,
+            measure_output: bool=False) -> dict:
+    """
+    Build the trace record of a node from its measurement and its result (along with the size of
+    its output, if `measure_output` is set).
+    """
+    record = {
+        "node": name,
+        "wall_time": time.perf_counter() - measurement.start,
+        "bytes_fetched": measurement.bytes_fetched,
+        "output_bytes": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "peak_memory": None,
+        "errors": [str(error)] if error is not None else []
+    }
+    # peak memory is process-wide, so it is only recorded for nodes that ran alone
+    if measurement.memory_start is not None and not measurement.overlapped and tracemalloc.is_tracing():
+        record["peak_memory"] = tracemalloc.get_traced_memory()[1] - measurement.memory_start
+
+    if isinstance(update, dict):
+        messages = update.get("messages")
+        messages = messages if isinstance(messages, list) else [messages]
+        llm_messages = [msg for msg in messages if isinstance(msg, AIMessage)]
+        for msg in llm_messages:
+            usage = msg.usage_metadata or {}
+            record["prompt_tokens"] += usage.get("input_tokens", 0)
+            record["completion_tokens"] += usage.get("output_tokens", 0)
+        # the output of the LLM nodes is counted in tokens
+        if measure_output and not llm_messages:
+            record["output_bytes"] = _output_size(update)
+        record["errors"] += update.get("errors", [])
+    return record
+
+
+def _start() -> tuple[_Measurement, contextvars.Token]:
+    measurement = _Measurement()
+    with _running_lock:
+        if _running:
+            measurement.overlapped = True
+            for other in _running:
+                other.overlapped = True
+        elif tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            measurement.memory_start = tracemalloc.get_traced_memory()[0]
+        _running.add(measurement)
+    return measurement, _current.set(measurement)
+
+
+def _finish(measurement: _Measurement, token: contextvars.Token):
+    _current.reset(token)
+    with _running_lock:
+        _running.discard(measurement)
+
+
+def instrument(name: str, func: Callable, afunc: Callable | None=None) -> tuple[Callable, Callable | None]:
+    """
+    Wrap the synchronous and asynchronous functions of a node, so that every execution is
+    recorded in the run trace found in the 'trace' key of the runnable config (if any).
+    Memory is only measured while tracemalloc is tracing, and only for the executions that
+    did not overlap with another node (of this run or of another one).
+    """
+    def bind(function: Callable | None) -> Callable | None:
+        # forward the config only to functions that accept it
+        if function is None or "config" in inspect.signature(function).parameters:
+            return function
+        return lambda state, config: function(state)
+
+    func, afunc = bind(func), bind(afunc)
+
+    def wrapper(state: dict, config: RunnableConfig):
+        trace = (config or {}).get("configurable", {}).get("trace")
+        if trace is None:
+            return func(state, config)
+
+        measurement, token = _start()
+        try:
+            update = func(state, config)
+        except Exception as e:
+            trace.add(_record(name, measurement, None, e))
+            raise
+        finally:
+            _finish(measurement, token)
+        trace.add(_record(name, measurement, update, None, trace.measure_outputs))
+        return update
+
+    async def awrapper(state: dict, config: RunnableConfig):
+        trace = (config or {}).get("configurable", {}).get("trace")
+        if trace is None:
+            return await afunc(state, config)
+
+        measurement, token = _start()
+        try:
+            update = await afunc(state, config)
+        except Exception as e:
+            trace.add(_record(name, measurement, None, e))
+            raise
+        finally:
+            _finish(measurement, token)
+        trace.add(_record(name, measurement, update, None, trace.measure_outputs))
+        return update
+
+    return wrapper, awrapper if afunc is not None else None
@@ -0,0 +1,70 @@
+"""
+File containing token-bucket rate limiters for the external data services, shared by every
+thread of the process (i.e. all the workers of the watchlist daemon).
+"""
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: allows bursts of up to `capacity` requests, refilled at `rate`
+    requests per second.
+    """
+    def __init__(self, rate: float, capacity: float | None=None):
+        if rate <= 0:
+            raise ValueError("The rate of a rate limiter must be positive!")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float=1, timeout: float | None=None) -> bool:
+        """
+        Wait until `tokens` tokens are available and take them. Returns False if they were not
+        available within `timeout` seconds (waits forever if `timeout` is None).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if deadline is not None:
+                if time.monotonic() + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+# rate limiters of the process, by service name ('yahoo', 'serpapi')
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def set_rate_limit(service: str, rate: float | None, capacity: float | None=None):
+    """
+    Limit the requests to a service to `rate` per second, with bursts of up to `capacity`
+    requests. A `rate` of None removes the limit.
+    """
+    with _limiters_lock:
+        if rate is None:
+            _limiters.pop(service, None)
+        else:
+            _limiters[service] = TokenBucket(rate, capacity)
+
+
+def wait_for(service: str):
+    """
+    Wait until a request to a service is allowed by its rate limiter (if it has one).
+    """
+    limiter = _limiters.get(service)
+    if limiter is not None:
+        limiter.acquire()
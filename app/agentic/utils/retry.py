@@ -0,0 +1,68 @@
+"""
+File containing the retries of transient failures (connection errors, timeouts, rate limits and
+server errors) of the requests to the data services and of the LLM calls.
+"""
+import time
+import random
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+# number of attempts of every request (and graph node), and the backoff between them
+DEFAULT_RETRY_ATTEMPTS = 3
+RETRY_INITIAL_INTERVAL = 0.5
+RETRY_BACKOFF_FACTOR = 2.0
+RETRY_MAX_INTERVAL = 8.0
+# transient errors of the client libraries (httpx, openai, yfinance), which are not imported here, by class name
+TRANSIENT_ERROR_NAMES = {
+    "ConnectError", "TimeoutException", "APIConnectionError", "APITimeoutError", "RateLimitError", "YFRateLimitError"
+}
+
+
+def _status_code(exc: BaseException) -> int | None:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Whether an exception is a transient failure that may succeed when retried: a connection error,
+    a timeout, or a response with a "too many requests" or server error status.
+    """
+    import requests
+
+    if isinstance(exc, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__):
+        return True
+    status = _status_code(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_interval(attempt: int, initial_interval: float=RETRY_INITIAL_INTERVAL,
+                   backoff_factor: float=RETRY_BACKOFF_FACTOR, max_interval: float=RETRY_MAX_INTERVAL) -> float:
+    """
+    Returns the seconds to wait after the given failed attempt (starting from 1): exponential
+    backoff with full jitter, so that concurrent runs do not retry at the same time.
+    """
+    return random.uniform(0, min(max_interval, initial_interval * backoff_factor ** (attempt - 1)))
+
+
+def call_with_retry(func: Callable, *args, attempts: int=DEFAULT_RETRY_ATTEMPTS, **kwargs):
+    """
+    Call a function, retrying it with backoff (see `retry_interval`) when it fails with a transient
+    error, up to `attempts` times in total. Other errors (and the last transient one) are raised.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= attempts or not is_transient(e):
+                raise
+            interval = retry_interval(attempt)
+            logger.info("Retrying %s in %.2f s (attempt %d) after %r", getattr(func, "__name__", func), interval, attempt, e)
+            time.sleep(interval)
@@ -0,0 +1,356 @@
+"""
+File containing a columnar store for the output of the graph runs: price bars, technical
+indicators and financial metrics are appended to partitioned Parquet (or Arrow IPC) datasets,
+and the reports are kept in a single indexed SQLite database.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+import datetime as dt
+import pandas as pd
+from contextlib import contextmanager
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+except ImportError:
+    pa = None
+
+from utils.indicators import INDICATORS
+
+
+# price fields stored for each bar
+PRICE_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+# financial metrics stored for each run (see get_financial_metrics)
+METRIC_FIELDS = ["pe_ratio", "price_to_book", "debt_to_equity", "profit_margins"]
+# file extension of each dataset format
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def _schema(fields: list[str]) -> "pa.Schema":
+    """
+    Returns the schema of a dataset with the given float columns. Rows are keyed by ticker and
+    date, and are partitioned by the date on which they were stored (`run_date`).
+    """
+    return pa.schema(
+        [("ticker", pa.string()), ("date", pa.date32()), ("stored_at", pa.float64())]
+        + [(field, pa.float64()) for field in fields]
+        + [("run_date", pa.string())]
+    )
+
+
+def _float(value) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ReportStore:
+    """
+    Store of the fetched data and the reports of many runs, in `root`:
+        - prices/, indicators/, metrics/: datasets in `format` ('parquet' or 'arrow'), hive-partitioned
+          by run date and sorted by ticker and date. Only the price bars (and indicator points) that are
+          not older than the last stored one are appended, and rows stored again replace the older ones
+          when the datasets are read.
+        - reports.sqlite: the LLM responses, errors and trace of every run, indexed by ticker and date.
+
+    Runs are buffered and written together once `batch_size` of them have been added (or on `flush`),
+    so that every dataset gets one file per batch instead of one per run. Reads memory-map the files.
+    """
+    def __init__(self, root: str, format: str="parquet", batch_size: int=1):
+        if pa is None:
+            raise ImportError(f"Output format '{format}' requires the pyarrow package!")
+        if format not in FORMATS:
+            raise ValueError(f"Unknown output format '{format}' (expected one of {', '.join(FORMATS)})")
+        if not os.path.exists(root):
+            os.makedirs(root)
+        self.root = root
+        self.format = format
+        self.batch_size = batch_size
+        self.path = os.path.join(root, "reports.sqlite")
+        self.schemas = {
+            "prices": _schema(PRICE_FIELDS),
+            "indicators": _schema(INDICATORS),
+            "metrics": _schema(METRIC_FIELDS)
+        }
+        # buffered rows of each dataset, and buffered reports
+        self._rows = {name: [] for name in self.schemas}
+        self._reports = []
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    ticker TEXT NOT NULL,
+                    exchange TEXT,
+                    date TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    errors TEXT,
+                    context_tokens TEXT,
+                    trace TEXT
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    run_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (run_id, name)
+                );
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    ticker TEXT PRIMARY KEY,
+                    last_date TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS runs_ticker_date ON runs (ticker, date);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open a connection to the report database, commit on success and always close it.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _dataset_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _last_date(self, ticker: str) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT last_date FROM watermarks WHERE ticker = ?", (ticker,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, final_state: dict, trace=None, write: bool=True):
+        """
+        Buffer the data and the reports of a final graph state (along with the trace of its run, if
+        given), and write the buffers if they hold `batch_size` runs (unless `write` is unset, i.e.
+        when the caller flushes a batch of its own).
+        """
+        now = time.time()
+        run_date = dt.date.today().isoformat()
+        ticker = final_state["stock_ticker"]
+        rows = {name: [] for name in self.schemas}
+
+        # the last stored bar is stored again, since it may have been incomplete when it was stored
+        last_date = self._last_date(ticker)
+        stock_price_indicators = final_state.get("stock_price_indicators")
+        if stock_price_indicators is not None:
+            prices = stock_price_indicators.prices
+            for date, values in prices.rows():
+                if last_date is None or date >= last_date:
+                    record = dict(zip(prices.fields, values))
+                    rows["prices"].append({
+                        "ticker": ticker, "date": dt.date.fromisoformat(date), "stored_at": now, "run_date": run_date,
+                        **{field: _float(record.get(field)) for field in PRICE_FIELDS}
+                    })
+
+            # indicator points by date
+            indicators = stock_price_indicators.indicators
+            for date, values in indicators.rows():
+                if last_date is None or date >= last_date:
+                    points = dict(zip(indicators.names, values))
+                    rows["indicators"].append({
+                        "ticker": ticker, "date": dt.date.fromisoformat(date), "stored_at": now, "run_date": run_date,
+                        **{name: _float(points.get(name)) for name in INDICATORS}
+                    })
+
+        metrics = final_state.get("financial_metrics")
+        if metrics:
+            rows["metrics"].append({
+                "ticker": ticker, "date": dt.date.fromisoformat(run_date), "stored_at": now, "run_date": run_date,
+                **{field: _float(metrics.get(field)) for field in METRIC_FIELDS}
+            })
+
+        report = {
+            "run_id": trace.run_id if trace is not None else str(uuid.uuid4()),
+            "ticker": ticker,
+            "exchange": final_state.get("stock_exchange"),
+            "date": run_date,
+            "stored_at": now,
+            "errors": json.dumps(final_state.get("errors", [])),
+            "context_tokens": json.dumps(final_state.get("context_tokens", {})),
+            "trace": json.dumps(trace.to_dict()) if trace is not None else None,
+            "messages": [(message.name, message.content) for message in final_state.get("messages", [])]
+        }
+
+        with self._lock:
+            for name, dataset_rows in rows.items():
+                self._rows[name].extend(dataset_rows)
+            self._reports.append(report)
+            full = len(self._reports) >= self.batch_size
+        if full and write:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered runs: one file per dataset and run date, and a single database transaction.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, {name: [] for name in self.schemas}
+            reports, self._reports = self._reports, []
+            if not reports:
+                return
+
+            for name, dataset_rows in rows.items():
+                if dataset_rows:
+                    table = pa.Table.from_pylist(dataset_rows, schema=self.schemas[name])
+                    self._write(name, table.sort_by([("ticker", "ascending"), ("date", "ascending")]))
+
+            # the newest stored bar of each ticker
+            watermarks = {}
+            for row in rows["prices"]:
+                date = row["date"].isoformat()
+                watermarks[row["ticker"]] = max(watermarks.get(row["ticker"], date), date)
+
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO runs (run_id, ticker, exchange, date, stored_at, errors, context_tokens, trace) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(r["run_id"], r["ticker"], r["exchange"], r["date"], r["stored_at"], r["errors"],
+                      r["context_tokens"], r["trace"]) for r in reports]
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO messages (run_id, name, content) VALUES (?, ?, ?)",
+                    [(r["run_id"], name, content) for r in reports for name, content in r["messages"]]
+                )
+                conn.executemany(
+                    "INSERT INTO watermarks (ticker, last_date) VALUES (?, ?) "
+                    "ON CONFLICT (ticker) DO UPDATE SET last_date = MAX(last_date, excluded.last_date)",
+                    list(watermarks.items())
+                )
+
+    def _write(self, name: str, table: "pa.Table", directory: str | None=None):
+        ds.write_dataset(
+            table,
+            directory or self._dataset_dir(name),
+            format="parquet" if self.format == "parquet" else "ipc",
+            partitioning=ds.partitioning(pa.schema([("run_date", pa.string())]), flavor="hive"),
+            # every batch adds its own files next to the existing ones
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.{FORMATS[self.format]}",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+
+    def _dataset(self, name: str) -> "ds.Dataset | None":
+        path = self._dataset_dir(name)
+        if not os.path.exists(path):
+            return None
+        return ds.dataset(
+            path,
+            schema=self.schemas[name],
+            format="parquet" if self.format == "parquet" else "ipc",
+            partitioning=ds.partitioning(pa.schema([("run_date", pa.string())]), flavor="hive"),
+            filesystem=LocalFileSystem(use_mmap=True)
+        )
+
+    def read(self, name: str, ticker: str | list[str] | None=None, start: str | None=None,
+             end: str | None=None, columns: list[str] | None=None) -> pd.DataFrame:
+        """
+        Read the rows of a dataset ('prices', 'indicators' or 'metrics') for the given ticker(s) and
+        range of dates (inclusive, as YYYY-mm-dd), with a row per ticker and date, sorted by both.
+        Only the row groups that may match are read from the memory-mapped files.
+        """
+        dataset = self._dataset(name)
+        if dataset is None:
+            return pd.DataFrame(columns=["ticker", "date"] + (columns or [f.name for f in self.schemas[name]][3:-1]))
+
+        condition = None
+        if ticker is not None:
+            condition = ds.field("ticker").isin([ticker] if isinstance(ticker, str) else ticker)
+        for value, op in [(start, "__ge__"), (end, "__le__")]:
+            if value is not None:
+                expression = getattr(ds.field("date"), op)(pa.scalar(dt.date.fromisoformat(value), pa.date32()))
+                condition = expression if condition is None else condition & expression
+
+        fields = columns or [f.name for f in self.schemas[name]][3:-1]
+        df = dataset.to_table(columns=["ticker", "date", "stored_at", *fields], filter=condition).to_pandas()
+        # rows stored again replace the older ones
+        df = df.sort_values("stored_at").drop_duplicates(["ticker", "date"], keep="last")
+        return df.drop(columns="stored_at").sort_values(["ticker", "date"]).reset_index(drop=True)
+
+    def prices(self, ticker: str | list[str] | None=None, start: str | None=None, end: str | None=None) -> pd.DataFrame:
+        """
+        Returns the stored price bars of the given ticker(s), see `read`.
+        """
+        return self.read("prices", ticker, start, end)
+
+    def indicators(self, ticker: str | list[str] | None=None, start: str | None=None, end: str | None=None) -> pd.DataFrame:
+        """
+        Returns the stored technical indicators of the given ticker(s), see `read`.
+        """
+        return self.read("indicators", ticker, start, end)
+
+    def metrics(self, ticker: str | list[str] | None=None, start: str | None=None, end: str | None=None) -> pd.DataFrame:
+        """
+        Returns the financial metrics of the given ticker(s) as stored on every date, see `read`.
+        """
+        return self.read("metrics", ticker, start, end)
+
+    def reports(self, ticker: str, start: str | None=None, end: str | None=None) -> list[dict]:
+        """
+        Returns the stored runs of a ticker within a range of dates (inclusive, as YYYY-mm-dd), oldest
+        first, each one with its LLM responses by node name.
+        """
+        query = "SELECT run_id, ticker, exchange, date, stored_at, errors, context_tokens FROM runs WHERE ticker = ?"
+        params = [ticker]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(end)
+
+        with self._connect() as conn:
+            runs = conn.execute(query + " ORDER BY stored_at", params).fetchall()
+            reports = []
+            for run_id, ticker, exchange, date, stored_at, errors, context_tokens in runs:
+                messages = conn.execute("SELECT name, content FROM messages WHERE run_id = ?", (run_id,)).fetchall()
+                reports.append({
+                    "run_id": run_id,
+                    "ticker": ticker,
+                    "exchange": exchange,
+                    "date": date,
+                    "stored_at": stored_at,
+                    "errors": json.loads(errors),
+                    "context_tokens": json.loads(context_tokens),
+                    "messages": dict(messages)
+                })
+        return reports
+
+    def trace(self, run_id: str) -> dict | None:
+        """
+        Returns the trace of a stored run, or None if it was stored without one.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT trace FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row is not None and row[0] is not None else None
+
+    def compact(self):
+        """
+        Rewrite every dataset without the replaced rows, with a single file per run date. Must not
+        run while other processes write to the store.
+        """
+        self.flush()
+        with self._lock:
+            for name in self.schemas:
+                dataset = self._dataset(name)
+                if dataset is None:
+                    continue
+                table = dataset.to_table()
+                df = table.to_pandas().sort_values("stored_at").drop_duplicates(["ticker", "date"], keep="last")
+                table = pa.Table.from_pandas(df, schema=self.schemas[name], preserve_index=False)
+
+                # write the compacted dataset next to the current one, then swap them
+                path = self._dataset_dir(name)
+                self._write(name, table.sort_by([("ticker", "ascending"), ("date", "ascending")]), path + ".compact")
+                shutil.rmtree(path)
+                os.rename(path + ".compact", path)
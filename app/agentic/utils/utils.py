@@ -2,71 +2,259 @@
 File containing utility functions.
 """
 import os
+import asyncio
+import threading
+import contextvars
 from typing import Literal
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
 
-from langchain_ollama import ChatOllama
-from langchain_community.chat_models import ChatLlamaCpp
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
+import requests
 
+from utils.html_text import StreamingTextExtractor, html_to_text
+from utils.article_store import ArticleStore, normalize_url
+from utils.data_access import get_session, single_flight, run_blocking
+from utils.model_pool import llama_cpp_model, ollama_model, pooled_model
+from utils.process_pool import run_in_pool
+from utils.profiling import count_fetched_bytes
 
-def extract_text_from_url(url: str) -> str:
+
+# default settings for article fetching
+ARTICLE_MAX_WORKERS = 5
+ARTICLE_TIMEOUT = 10
+ARTICLE_DEADLINE = 30
+# maximum number of characters extracted from each article
+ARTICLE_MAX_CHARS = 20000
+# maximum number of bytes downloaded from each article, when it is parsed in a process pool
+ARTICLE_MAX_BYTES = 2 * 1024 * 1024
+
+
+class DownloadCancelled(Exception):
+    """
+    Raised by a download that stopped because its `cancel` event was set.
+    """
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the http session shared by all article fetches of the process, so that connections are reused.
+    """
+    return get_session("article")
+
+
+def download_article(url: str, timeout: float=ARTICLE_TIMEOUT, max_chars: int | None=ARTICLE_MAX_CHARS,
+                     engine: str="auto", headers: dict | None=None, pool: Executor | None=None,
+                     cancel: threading.Event | None=None) -> tuple[int, str, dict]:
+    """
+    Downloads a page and extracts its text, returning the status code, the text and the headers
+    of the response. The text of a '304 Not Modified' response (to a conditional GET) is empty.
+
+    The page is parsed while it is being downloaded, and the download stops as soon as
+    `max_chars` characters of text have been extracted. If a process pool is given, the page
+    (up to `ARTICLE_MAX_BYTES` bytes) is downloaded first and parsed in one of its workers instead,
+    so that parsing does not hold the GIL of this process.
+
+    If the `cancel` event is set (i.e. when the caller gave up on the article), the download stops
+    at its next chunk (whose read is limited by `timeout` seconds) with a `DownloadCancelled` error.
+    """
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            raise DownloadCancelled(url)
+
+    check_cancel()
+    # stream the html content from the url
+    with get_http_session().get(url, timeout=timeout, stream=True, headers=headers) as response:
+        response.raise_for_status()
+        if response.status_code == 304:
+            return 304, "", response.headers
+        # use the charset of the response if it is specified, else assume utf-8
+        content_type = response.headers.get("content-type", "")
+        encoding = response.encoding if "charset" in content_type.lower() else "utf-8"
+
+        if pool is not None:
+            chunks, size = [], 0
+            for chunk in response.iter_content(chunk_size=16384):
+                check_cancel()
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= ARTICLE_MAX_BYTES:
+                    break
+            count_fetched_bytes(size)
+        else:
+            # parse the html incrementally, as the chunks arrive
+            extractor = StreamingTextExtractor(max_chars=max_chars, engine=engine, encoding=encoding)
+            for chunk in response.iter_content(chunk_size=16384):
+                check_cancel()
+                count_fetched_bytes(len(chunk))
+                if extractor.feed(chunk):
+                    break
+
+    if pool is not None:
+        # the page is parsed after its connection is released, and only its raw bytes go to the worker
+        # (and only the text comes back)
+        text = run_in_pool(pool, html_to_text, b"".join(chunks), max_chars, engine, encoding)
+        return response.status_code, text, response.headers
+    return response.status_code, extractor.close(), response.headers
+
+
+def extract_text_from_url(url: str, timeout: float=ARTICLE_TIMEOUT, max_chars: int | None=ARTICLE_MAX_CHARS,
+                          engine: str="auto", store: ArticleStore | None=None, pool: Executor | None=None,
+                          cancel: threading.Event | None=None) -> str:
     """
     Extracts text from a given url and returns it
     in a human-readable format.
+
+    If an article store is given, it is consulted first: fresh articles are returned without
+    any request, stale ones are revalidated with a conditional GET (and only downloaded again
+    if they changed), and downloaded ones are added to it.
+
+    Concurrent fetches of the same article (i.e. by the runs of stocks that link to the same
+    story) share a single request. If a process pool is given, articles are parsed in its workers.
+
+    Failed downloads return an empty text, while cancelled ones (see `download_article`) raise
+    `DownloadCancelled`, along with the identical fetches that shared them.
     """
+    return single_flight(
+        "article", normalize_url(url), _extract_text, url, timeout, max_chars, engine, store, pool, cancel
+    )
+
+
+def _extract_text(url: str, timeout: float, max_chars: int | None, engine: str, store: ArticleStore | None,
+                  pool: Executor | None, cancel: threading.Event | None) -> str:
     try:
-        # get the html content from the url
-        html = urlopen(url).read()
-        # parse the html using bs4
-        soup = BeautifulSoup(html, features="html.parser")
-
-        # kill all script and style elements
-        for script in soup(["script", "style"]):
-            script.extract() 
-
-        # get text
-        text = soup.get_text()
-
-        # break into lines and remove leading and trailing space on each
-        lines = (line.strip() for line in text.splitlines())
-        # drop blank lines and form the final extracted text
-        text = '\n'.join(line for line in lines if line)
+        if store is None:
+            return download_article(url, timeout, max_chars, engine, pool=pool, cancel=cancel)[1]
+
+        entry = store.get(url)
+        if entry is not None and entry["fresh"]:
+            return entry["text"]
+        try:
+            status, text, headers = download_article(
+                url, timeout, max_chars, engine, store.conditional_headers(entry), pool, cancel
+            )
+        except Exception:
+            # a stale article is better than none
+            if entry is not None:
+                return entry["text"]
+            raise
+
+        if status == 304 and entry is not None:
+            store.revalidate(url)
+            return entry["text"]
+        if text:
+            store.put(url, text, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"))
         return text
+    except DownloadCancelled:
+        # not a result, so that it is not reused by later fetches of the article
+        raise
     except:
         return ""
-    
 
-def llm_endpoint(type: Literal["hugging-face", "ollama", "llama-cpp"], config: dict = {}) -> BaseChatModel:
+
+def fetch_articles(urls: list[str], max_workers: int=ARTICLE_MAX_WORKERS, timeout: float=ARTICLE_TIMEOUT,
+                   deadline: float=ARTICLE_DEADLINE, store: ArticleStore | None=None,
+                   pool: Executor | None=None) -> list[str]:
+    """
+    Extracts the text of multiple urls concurrently, using at most `max_workers` threads.
+    Each request is limited by `timeout` seconds and the whole operation by `deadline` seconds.
+    Returns the texts in the order of the given urls, with an empty string for every article
+    that failed or did not finish before the deadline. Articles are looked up in the article
+    store first (if given), and parsed in the workers of the process pool (if given).
+    """
+    if not urls:
+        return []
+
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    # every download runs in a copy of the caller's context, so that its bytes are counted for the calling node
+    futures = [
+        executor.submit(
+            contextvars.copy_context().run, extract_text_from_url, url, timeout, store=store, pool=pool, cancel=cancel
+        )
+        for url in urls
+    ]
+    wait(futures, timeout=deadline)
+    # do not wait for late articles, just drop them: the ones that did not start are cancelled, and
+    # the running ones stop at their next chunk
+    cancel.set()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    return [
+        future.result() if future.done() and not future.cancelled() and future.exception() is None else ""
+        for future in futures
+    ]
+
+
+async def afetch_articles(urls: list[str], max_workers: int=ARTICLE_MAX_WORKERS, timeout: float=ARTICLE_TIMEOUT,
+                          deadline: float=ARTICLE_DEADLINE, store: ArticleStore | None=None,
+                          pool: Executor | None=None) -> list[str]:
+    """
+    Asynchronous version of `fetch_articles`. Blocking downloads run in the article thread pool
+    of the process (see `utils.data_access.get_executor`), with at most `max_workers` of them in
+    flight at a time. Late downloads are cancelled when the deadline passes, or when the caller
+    is cancelled.
+    """
+    if not urls:
+        return []
+
+    cancel = threading.Event()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def fetch(url: str) -> str:
+        async with semaphore:
+            return await run_blocking("article", extract_text_from_url, url, timeout, store=store, pool=pool, cancel=cancel)
+
+    tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+    try:
+        await asyncio.wait(tasks, timeout=deadline)
+    finally:
+        # do not wait for late articles, just drop them: the ones that did not start are cancelled,
+        # and the running ones stop at their next chunk
+        cancel.set()
+        for task in tasks:
+            task.cancel()
+
+    return [task.result() if task.done() and not task.cancelled() and task.exception() is None else "" for task in tasks]
+
+
+def llm_endpoint(type: Literal["hugging-face", "ollama", "llama-cpp", "model-server"], config: dict = {}) -> BaseChatModel:
     """
     Returns a ChatModel using the given serving type and configuration.
+
+    Models are taken from the model pool of the process, so that they are loaded once and shared
+    by every caller, and only the backend of the given serving type is imported. The 'model-server' type uses a model served by a
+    local worker server (see model_server.py), shared by all the processes that connect to it.
     """
     if type == "hugging-face":
         api_key = os.getenv("HUGGINGFACEHUB_API_TOKEN", "")
         if not api_key:
             raise KeyError("You do not have a hugging-face api key!")
+        from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+
         # return  LLM from Huggingface
-        hf_endpoint = HuggingFaceEndpoint(
-            repo_id=config.get("model_name", "Qwen/Qwen2.5-72B-Instruct"),
-            task="text-generation",
-            huggingfacehub_api_token=api_key
+        repo_id = config.get("model_name", "Qwen/Qwen2.5-72B-Instruct")
+        return pooled_model(
+            "hugging-face", {"repo_id": repo_id},
+            lambda: ChatHuggingFace(llm=HuggingFaceEndpoint(
+                repo_id=repo_id,
+                task="text-generation",
+                huggingfacehub_api_token=api_key
+            ))
         )
-        return ChatHuggingFace(llm=hf_endpoint)
 
     elif type == "ollama":
         # ensure that model name is provided
         if not config.get("model_name", ""):
             raise KeyError("Ollama model name is not provided!")
         # return LLM from ollama
-        return ChatOllama(
+        return ollama_model(
             # if no ollama url is specified, use localhost with the default Ollama port
             base_url=config.get("url", "http://127.0.0.1:11434"),
             model=config["model_name"],
             temperature=0.1,
             num_predict=-2,
+            # keep the model (and the cached prefill of the shared prompt prefix) loaded between runs
+            keep_alive=config.get("keep_alive", "30m"),
         )
     
     elif type == "llama-cpp":
@@ -77,14 +265,30 @@ def llm_endpoint(type: Literal["hugging-face", "ollama", "llama-cpp"], config: d
         elif model_path and not os.path.exists(model_path):
             raise FileNotFoundError(f"File '{model_path}' does not exist!")
         # return LLM from llama.cpp
-        return ChatLlamaCpp(
+        return llama_cpp_model(
+            model_path,
+            # reuse the prefill of prompt prefixes (i.e. the shared system prompt) from memory or disk
+            prompt_cache=config.get("prompt_cache"),
+            prompt_cache_dir=config.get("prompt_cache_dir"),
             temperature=0.5,
-            model_path=model_path,
             n_ctx=10000,
             max_tokens=512,
             repeat_penalty=1.5,
             top_p=0.5
         )
             
+    elif type == "model-server":
+        from langchain_openai import ChatOpenAI
+
+        # the worker server exposes an OpenAI-compatible api, on localhost by default
+        return ChatOpenAI(
+            base_url=config.get("url", "http://127.0.0.1:8765").rstrip("/") + "/v1",
+            model=config.get("model_name", "local"),
+            api_key="model-server",
+            # every request carries a temperature, which the server applies to the served model,
+            # so the client's default (0.7) is replaced by the one of the Ollama models
+            temperature=0.1
+        )
+
     else:
         raise ValueError(f"Type '{type}' is not supported!")
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Benchmark comparing the streaming html-to-text extractor against the previous
+BeautifulSoup implementation, using the saved html pages of fixtures/html.
+
+Run with:
+    python app/benchmarks/bench_html_extraction.py [--repeat N] [--max-chars N]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic"))
+
+from utils.html_text import html_to_text, etree
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html")
+
+
+def bs4_html_to_text(html: bytes) -> str:
+    """
+    Previous implementation of the extraction: full BeautifulSoup tree parse.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, features="html.parser")
+    for script in soup(["script", "style"]):
+        script.extract()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def measure(func, html: bytes, repeat: int) -> tuple[float, float, int]:
+    """
+    Return the mean time (ms), the peak traced memory (MB) and the output size of a function.
+    """
+    tracemalloc.start()
+    text = func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    elapsed = (time.perf_counter() - start) / repeat
+    return elapsed * 1000, peak / 2**20, len(text)
+
+
+def main(args):
+    engines = {"bs4 (baseline)": bs4_html_to_text}
+    engines["stream html.parser"] = lambda html: html_to_text(html, engine="html.parser")
+    engines[f"stream html.parser, max {args.max_chars}"] = \
+        lambda html: html_to_text(html, max_chars=args.max_chars, engine="html.parser")
+    if etree is not None:
+        engines["stream lxml"] = lambda html: html_to_text(html, engine="lxml")
+        engines[f"stream lxml, max {args.max_chars}"] = \
+            lambda html: html_to_text(html, max_chars=args.max_chars, engine="lxml")
+
+    print(f"{'fixture':<24}{'engine':<36}{'time (ms)':>12}{'peak (MB)':>12}{'chars':>10}")
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            html = f.read()
+        for engine, func in engines.items():
+            try:
+                ms, mb, chars = measure(func, html, args.repeat)
+            except ImportError as e:
+                print(f"{name:<24}{engine:<36}  skipped ({e})")
+                continue
+            print(f"{name:<24}{engine:<36}{ms:>12.2f}{mb:>12.2f}{chars:>10}")
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="bench_html_extraction")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of timed runs per fixture and engine")
+    parser.add_argument("--max-chars", dest="max_chars", type=int, default=20000,
+                        help="Character limit used by the limited streaming engines")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_input())
@@ -0,0 +1,114 @@
+"""
+Benchmark comparing the vectorized indicator engine against the previous `ta`-based
+implementation, on synthetic weekly price data for a batch of tickers. It also reports
+the largest difference between the values of the two implementations.
+
+Run with:
+    python app/benchmarks/bench_indicators.py [--tickers N] [--bars N] [--repeat N]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic"))
+
+from utils.indicators import compute_indicators_frame, INDICATORS
+
+
+def synthetic_prices(n_tickers: int, n_bars: int, seed: int=0) -> dict[str, pd.DataFrame]:
+    """
+    Generate random-walk weekly price data for `n_tickers` tickers.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=n_bars, freq="W-MON", name="Date")
+    frames = {}
+    for i in range(n_tickers):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, n_bars)))
+        spread = close * rng.uniform(0.01, 0.05, n_bars)
+        frames[f"T{i:04d}"] = pd.DataFrame({
+            "Open": close + rng.normal(0, 1, n_bars),
+            "High": close + spread,
+            "Low": close - spread,
+            "Close": close,
+            "Volume": rng.integers(10**5, 10**7, n_bars).astype(float),
+        }, index=dates)
+    return frames
+
+
+def ta_indicators(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """
+    Previous implementation: one `ta` indicator object per indicator, on a single ticker.
+    """
+    from ta.momentum import RSIIndicator, StochasticOscillator
+    from ta.trend import MACD
+    from ta.volume import volume_weighted_average_price
+
+    close, high, low, volume = df["Close"], df["High"], df["Low"], df["Volume"]
+    macd = MACD(close)
+    return {
+        "RSI": RSIIndicator(close, window=14).rsi(),
+        "Stochastic_Oscillator": StochasticOscillator(high, low, close, window=14).stoch(),
+        "MACD": macd.macd(),
+        "MACD_Signal": macd.macd_signal(),
+        "volume_weighted_average_price": volume_weighted_average_price(
+            high=high, low=low, close=close, volume=volume),
+    }
+
+
+def ta_path(frames: dict[str, pd.DataFrame]) -> dict:
+    """
+    Previous per-ticker path, including the conversion of the last 12 points to dictionaries.
+    """
+    results = {}
+    for ticker, df in frames.items():
+        results[ticker] = {
+            name: {date.strftime('%Y-%m-%d'): int(value) for date, value in series.iloc[-12:].dropna().to_dict().items()}
+            for name, series in ta_indicators(df).items()
+        }
+    return results
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(args):
+    frames = synthetic_prices(args.tickers, args.bars)
+    print(f"{args.tickers} tickers x {args.bars} bars, mean of {args.repeat} runs")
+
+    vectorized_ms = timed(lambda: compute_indicators_frame(frames), args.repeat)
+    print(f"{'vectorized engine':<24}{vectorized_ms:>12.2f} ms")
+
+    try:
+        ta_ms = timed(lambda: ta_path(frames), args.repeat)
+    except ImportError as e:
+        print(f"{'ta (baseline)':<24}  skipped ({e})")
+        return
+    print(f"{'ta (baseline)':<24}{ta_ms:>12.2f} ms  ({ta_ms / vectorized_ms:.1f}x slower)")
+
+    # compare the values of the two implementations
+    engine = compute_indicators_frame(frames)
+    for name in INDICATORS:
+        diff = max(
+            np.nanmax(np.abs(engine[(name, ticker)].to_numpy() - ta_indicators(df)[name].to_numpy()), initial=0)
+            for ticker, df in frames.items()
+        )
+        print(f"max abs difference {name:<32}{diff:.2e}")
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="bench_indicators")
+    parser.add_argument("--tickers", type=int, default=300, help="Number of tickers")
+    parser.add_argument("--bars", type=int, default=72, help="Number of weekly bars per ticker")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_input())
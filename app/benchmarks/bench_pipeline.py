@@ -0,0 +1,407 @@
+"""
+End-to-end benchmark of the FinanceGraph pipeline, running without network access: market
+data, financial statements and articles are replayed from fixtures/market, and the LLM is a
+deterministic fake chat model with configurable latency (see offline.py).
+
+It measures the latency of single runs (synchronous and asynchronous), the throughput of
+batch runs over many tickers, the cost of every node, the peak traced memory and the size of
+the final graph state of every run. Results can be saved as json and compared against a
+previous baseline, failing on regressions. With --resume, it also measures the recovery of a
+checkpointed run whose last step failed, and with --router, the calls and savings of routing
+the short analysis prompts to a faster small model.
+
+Run with:
+    python app/benchmarks/bench_pipeline.py [--tickers N] [--repeat N] [--llm-latency S]
+        [--resume] [--router] [--output results.json] [--baseline results.json]
+
+Refresh the fixtures from the live services (requires network access and api keys) with:
+    python app/benchmarks/bench_pipeline.py --record AAPL:NASDAQ MSFT:NASDAQ
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic"))
+
+from offline import FakeChatModel, MarketFixtures, offline, record_fixtures, MARKET_FIXTURES_DIR
+from utils.data_access import clear_recent_results
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summary(values: list[float]) -> dict:
+    return {
+        "mean": statistics.mean(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "max": max(values)
+    }
+
+
+def make_graph(args, cache_dir: str | None=None, checkpoint_dir: str | None=None):
+    from finance_graph import FinanceGraph
+
+    fg = FinanceGraph(
+        type="ollama",
+        model_name="fake",
+        cache_dir=cache_dir,
+        checkpoint_dir=checkpoint_dir,
+        process_workers=args.process_workers,
+        # measure the output size of every node
+        profile="nodes",
+        incremental_indicators=args.incremental_indicators and cache_dir is not None,
+        # the small model of the router is the faster fake model of `main`
+        router={"model_name": "small", "max_context_tokens": args.router_max_tokens} if args.router else None
+    )
+    fg.build()
+    return fg
+
+
+def topology(fg) -> dict:
+    """
+    Returns the nodes and edges of the compiled graph.
+    """
+    graph = fg.graph.get_graph()
+    return {
+        "nodes": sorted(graph.nodes),
+        "edges": sorted(f"{edge.source} -> {edge.target}" for edge in graph.edges)
+    }
+
+
+def bench_latency(args, stocks: list[tuple[str, str]]) -> tuple[dict, dict]:
+    """
+    Time single runs, one stock at a time, with the synchronous and the asynchronous path.
+    """
+    fg = make_graph(args)
+    sync_times, async_times = [], []
+    for i in range(args.repeat):
+        ticker, exchange = stocks[i % len(stocks)]
+        # every run fetches its data, instead of reusing the recent results of the previous one
+        clear_recent_results()
+        start = time.perf_counter()
+        _, success = fg.run(ticker, exchange)
+        sync_times.append(time.perf_counter() - start)
+        if not success:
+            raise RuntimeError(f"Run for {ticker} failed")
+
+        clear_recent_results()
+        start = time.perf_counter()
+        _, success = asyncio.run(fg.arun(ticker, exchange))
+        async_times.append(time.perf_counter() - start)
+        if not success:
+            raise RuntimeError(f"Asynchronous run for {ticker} failed")
+    return {"run": summary(sync_times), "arun": summary(async_times)}, fg.profiler.aggregate()
+
+
+def bench_throughput(args, stocks: list[tuple[str, str]], cache_dir: str | None) -> dict:
+    """
+    Time a batch run over all the stocks, measuring the peak traced memory of the whole batch.
+    """
+    fg = make_graph(args, cache_dir)
+    clear_recent_results()
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = fg.run_many(stocks, max_concurrency=args.max_concurrency)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    failed = [ticker for ticker, (_, success) in results.items() if not success]
+    errors = sum(stats["errors"] for stats in fg.profiler.aggregate().values())
+    results = {
+        "stocks": len(stocks),
+        "wall_time": elapsed,
+        "stocks_per_second": len(stocks) / elapsed,
+        "peak_memory": peak,
+        "failed": len(failed),
+        "node_errors": errors
+    }
+    if fg.route_stats is not None:
+        results["routing"] = fg.route_stats.to_dict()
+    return results
+
+
+def deep_size(value, seen: set | None=None) -> int:
+    """
+    Returns the bytes of an object along with everything it references (objects that are
+    referenced more than once are counted once).
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif not isinstance(value, (str, bytes, int, float, type)):
+        if hasattr(value, "__dict__"):
+            size += deep_size(vars(value), seen)
+        for name in getattr(type(value), "__slots__", ()):
+            size += deep_size(getattr(value, name, None), seen)
+    return size
+
+
+def bench_state(args, stocks: list[tuple[str, str]]) -> dict:
+    """
+    Measure the size of the final graph state of every stock (the data that the graph keeps, and
+    copies or checkpoints, along every run).
+    """
+    fg = make_graph(args)
+    sizes = []
+    for ticker, exchange in stocks:
+        final_state = fg.graph.invoke(
+            {"messages": [], "stock_ticker": ticker, "stock_exchange": exchange},
+            config=fg._run_config(fg.profiler.new_trace(stock_ticker=ticker, stock_exchange=exchange), ticker)
+        )
+        sizes.append(deep_size(final_state))
+    return {"mean": statistics.mean(sizes), "max": max(sizes)}
+
+
+def bench_burst(args, stocks: list[tuple[str, str]], counters: dict) -> dict:
+    """
+    Run `args.burst` reports for the same stock at the same time, and count the upstream calls they
+    made (concurrent and recent identical requests share a single call, so there should be one call
+    of each kind, whatever the size of the burst).
+    """
+    fg = make_graph(args)
+    ticker, exchange = stocks[0]
+    clear_recent_results()
+    before = dict(counters)
+
+    async def burst():
+        return await asyncio.gather(*(fg.arun(ticker, exchange) for _ in range(args.burst)), return_exceptions=True)
+
+    start = time.perf_counter()
+    results = asyncio.run(burst())
+    elapsed = time.perf_counter() - start
+    return {
+        "runs": args.burst,
+        "wall_time": elapsed,
+        "failed": sum(1 for result in results if isinstance(result, Exception) or not result[1]),
+        "calls": {name: counters[name] - before.get(name, 0) for name in counters}
+    }
+
+
+def bench_resume(args, stocks: list[tuple[str, str]], counters: dict, checkpoint_dir: str) -> dict:
+    """
+    Run a checkpointed report whose report writer fails, then resume it, and count the LLM and
+    upstream calls of the resumed run (only the failed step should run again).
+    """
+    fg = make_graph(args, checkpoint_dir=checkpoint_dir)
+    ticker, exchange = stocks[0]
+    generate = FakeChatModel._generate
+    llm_calls = []
+    failures = [ValueError("Report writer failure")]
+
+    def failing_generate(self, messages, *a, **kwargs):
+        llm_calls.append(messages)
+        # the first prompt of the report writer fails
+        if failures and "You are the reporter" in str(messages[-1].content):
+            raise failures.pop()
+        return generate(self, messages, *a, **kwargs)
+
+    with mock.patch.object(FakeChatModel, "_generate", failing_generate):
+        start = time.perf_counter()
+        try:
+            fg.run(ticker, exchange)
+        except ValueError:
+            pass
+        failed_time = time.perf_counter() - start
+        failed_calls = len(llm_calls)
+
+        llm_calls.clear()
+        before = dict(counters)
+        start = time.perf_counter()
+        _, success = fg.run(ticker, exchange, resume=True)
+        resumed_time = time.perf_counter() - start
+    return {
+        "failed_run": {"wall_time": failed_time, "llm_calls": failed_calls},
+        "resumed_run": {
+            "wall_time": resumed_time,
+            "llm_calls": len(llm_calls),
+            "nodes": [record["node"] for record in fg.profiler.last_trace.nodes],
+            "success": bool(success),
+            "calls": {name: counters[name] - before.get(name, 0) for name in counters}
+        }
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Returns the regressions of the results against a baseline: latencies and memory that grew
+    (or throughput that dropped) by more than `tolerance`, new errors and topology changes.
+    """
+    regressions = []
+
+    def check(name: str, value: float, reference: float, higher_is_better: bool=False, min_delta: float=0.0):
+        # differences smaller than `min_delta` are noise
+        if not reference or abs(value - reference) < min_delta:
+            return
+        change = (value - reference) / reference
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {reference:.4g} -> {value:.4g} ({change:+.0%})")
+
+    for mode in ["run", "arun"]:
+        for stat in ["mean", "p95"]:
+            check(f"latency {mode} {stat}", results["latency"][mode][stat], baseline["latency"][mode][stat])
+    check("throughput", results["throughput"]["stocks_per_second"],
+          baseline["throughput"]["stocks_per_second"], higher_is_better=True)
+    check("peak memory", results["throughput"]["peak_memory"], baseline["throughput"]["peak_memory"])
+    if "state_size" in baseline["throughput"]:
+        check("state size", results["throughput"]["state_size"]["mean"], baseline["throughput"]["state_size"]["mean"])
+    for node, stats in results["nodes"].items():
+        if node in baseline["nodes"]:
+            check(f"node {node}", stats["mean_wall_time"], baseline["nodes"][node]["mean_wall_time"], min_delta=0.002)
+
+    for name in ["failed", "node_errors"]:
+        if results["throughput"][name] > baseline["throughput"][name]:
+            regressions.append(f"{name}: {baseline['throughput'][name]} -> {results['throughput'][name]}")
+    for name in ["nodes", "edges"]:
+        added = set(results["topology"][name]) - set(baseline["topology"][name])
+        removed = set(baseline["topology"][name]) - set(results["topology"][name])
+        if added or removed:
+            regressions.append(f"topology {name}: added {sorted(added)}, removed {sorted(removed)}")
+    return regressions
+
+
+def main(args):
+    if args.record:
+        stocks = [(item.partition(":")[0], item.partition(":")[2] or "NASDAQ") for item in args.record]
+        record_fixtures(stocks, args.fixtures_dir)
+        print(f"Recorded fixtures of {len(stocks)} stocks in {args.fixtures_dir}")
+        return
+
+    fixtures = MarketFixtures(args.fixtures_dir)
+    recorded = {ticker: results.get("search_parameters", {}).get("q", f"{ticker}:NASDAQ").partition(":")[2]
+                for ticker, results in fixtures.search_results.items()}
+    # tickers beyond the recorded ones replay the data of a recorded ticker
+    stocks = [(ticker, recorded[ticker]) for ticker in fixtures.tickers][:args.tickers]
+    stocks += [(f"BENCH{i:04d}", "NASDAQ") for i in range(args.tickers - len(stocks))]
+
+    llm = FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency)
+    small_llm = FakeChatModel(latency=args.small_llm_latency, token_latency=args.token_latency / 4)
+    counters = {}
+    with offline(fixtures, network_latency=args.network_latency, llm=llm, counters=counters,
+                 models={"small": small_llm}), \
+            tempfile.TemporaryDirectory() as cache_dir:
+        latency, nodes = bench_latency(args, stocks)
+        throughput = bench_throughput(args, stocks, cache_dir if args.cache else None)
+        throughput["state_size"] = bench_state(args, stocks)
+        results = {
+            "config": {name: value for name, value in vars(args).items() if name not in ["output", "baseline", "record"]},
+            "latency": latency,
+            "throughput": throughput,
+            "nodes": nodes,
+            "topology": topology(make_graph(args)),
+            "calls": counters
+        }
+        if args.burst:
+            results["burst"] = bench_burst(args, stocks, counters)
+        if args.resume:
+            results["resume"] = bench_resume(args, stocks, counters, os.path.join(cache_dir, "checkpoints"))
+
+    print(f"{'latency (s)':<24}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for mode, stats in latency.items():
+        print(f"{mode:<24}" + "".join(f"{stats[name]:>10.3f}" for name in ["mean", "p50", "p95", "max"]))
+    print()
+    print(f"run_many: {throughput['stocks']} stocks in {throughput['wall_time']:.2f} s "
+          f"({throughput['stocks_per_second']:.2f} stocks/s), peak memory {throughput['peak_memory'] / 2**20:.1f} MB, "
+          f"{throughput['failed']} failed runs, {throughput['node_errors']} node errors")
+    print(f"final state per run: {throughput['state_size']['mean'] / 1024:.1f} KB "
+          f"(max {throughput['state_size']['max'] / 1024:.1f} KB)")
+    if "routing" in throughput:
+        routing = throughput["routing"]
+        print(f"{'route':<24}{'calls':>10}{'mean (ms)':>12}{'tokens':>10}")
+        for route, stats in routing["routes"].items():
+            print(f"{route:<24}{stats['calls']:>10}{stats['mean_wall_time'] * 1000:>12.2f}"
+                  f"{stats['prompt_tokens'] + stats['completion_tokens']:>10}")
+        saved_time = f"{routing['saved_time']:.2f} s" if routing["saved_time"] is not None else "unknown"
+        print(f"routed away from the large model: {routing['saved_tokens']} tokens, {saved_time}")
+    print()
+    print(f"{'node':<28}{'runs':>6}{'mean (ms)':>12}{'max (ms)':>12}{'KB':>10}{'out KB':>10}{'tokens':>10}")
+    for node, stats in sorted(nodes.items(), key=lambda item: -item[1]["mean_wall_time"]):
+        print(f"{node:<28}{stats['count']:>6}{stats['mean_wall_time'] * 1000:>12.2f}{stats['max_wall_time'] * 1000:>12.2f}"
+              f"{stats['bytes_fetched'] / 1024:>10.1f}{stats['output_bytes'] / 1024:>10.1f}"
+              f"{stats['prompt_tokens'] + stats['completion_tokens']:>10}")
+    print()
+    print("replayed calls: " + ", ".join(f"{name} {count}" for name, count in results["calls"].items()))
+    if args.burst:
+        burst = results["burst"]
+        print(f"burst of {burst['runs']} runs for {stocks[0][0]} in {burst['wall_time']:.2f} s ({burst['failed']} failed), "
+              f"upstream calls: " + ", ".join(f"{name} {count}" for name, count in burst["calls"].items()))
+    if args.resume:
+        failed, resumed = results["resume"]["failed_run"], results["resume"]["resumed_run"]
+        print(f"failed run: {failed['wall_time']:.2f} s, {failed['llm_calls']} LLM calls; "
+              f"resumed run: {resumed['wall_time']:.2f} s, {resumed['llm_calls']} LLM calls, "
+              f"steps {', '.join(resumed['nodes'])}, upstream calls: "
+              + ", ".join(f"{name} {count}" for name, count in resumed["calls"].items()))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="bench_pipeline")
+    parser.add_argument("--tickers", type=int, default=16, help="Number of stocks of the batch run")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed single runs")
+    parser.add_argument("--max-concurrency", dest="max_concurrency", type=int, default=4,
+                        help="Maximum number of stocks processed at the same time in the batch run")
+    parser.add_argument("--llm-latency", dest="llm_latency", type=float, default=0.05,
+                        help="Seconds before the first token of every fake LLM response")
+    parser.add_argument("--token-latency", dest="token_latency", type=float, default=0.0,
+                        help="Seconds per token of every fake LLM response")
+    parser.add_argument("--network-latency", dest="network_latency", type=float, default=0.0,
+                        help="Seconds added to every replayed network call")
+    parser.add_argument("--cache", action="store_true", help="Use an on-disk market data cache in the batch run")
+    parser.add_argument("--incremental-indicators", dest="incremental_indicators", action="store_true",
+                        help="Update indicators incrementally in the batch run (requires --cache)")
+    parser.add_argument("--process-workers", dest="process_workers", type=int, default=0,
+                        help="Parse the articles and compute the indicators in this many worker processes")
+    parser.add_argument("--burst", type=int, default=0,
+                        help="Also run this many reports for the same stock at the same time, counting their upstream calls "
+                             "(use with --network-latency, so that their requests overlap)")
+    parser.add_argument("--router", action="store_true",
+                        help="Route the short analysis prompts to a faster small model, reporting the calls and savings per route")
+    parser.add_argument("--small-llm-latency", dest="small_llm_latency", type=float, default=0.01,
+                        help="Seconds before the first token of the small model of --router (default is 0.01)")
+    parser.add_argument("--router-max-tokens", dest="router_max_tokens", type=int, default=2048,
+                        help="Maximum number of prompt tokens routed to the small model (default is 2048)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Also run a checkpointed report whose report writer fails, and resume it")
+    parser.add_argument("--fixtures-dir", dest="fixtures_dir", default=MARKET_FIXTURES_DIR,
+                        help="Directory of the recorded fixtures")
+    parser.add_argument("--output", help="Save the results in a .json file")
+    parser.add_argument("--baseline", help="Compare the results against a .json file saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown over the baseline that counts as a regression (default is 0.25)")
+    parser.add_argument("--record", nargs="+", metavar="TICKER:EXCHANGE",
+                        help="Record the fixtures of the given stocks from the live services instead of benchmarking")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_input())
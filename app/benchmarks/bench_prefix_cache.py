@@ -0,0 +1,143 @@
+"""
+Benchmark of the prefill time saved by reusing the KV cache of the shared prompt prefix, with
+a local model. The prompts of every report are rendered from the recorded fixtures (see
+offline.py), and the time to the first token of each prompt (which is dominated by its
+prefill) is measured:
+    - llama.cpp: with a cleared context before every prompt and no prompt cache (cold), and
+      with a prompt cache (warm), reporting the prefill time saved per report.
+    - Ollama: with the model kept loaded, reporting the number of prompt tokens the server
+      actually evaluated for each prompt (the rest was reused from its cache).
+
+Run with:
+    python app/benchmarks/bench_prefix_cache.py --serving-type llama-cpp --model-path model.gguf [--reports N]
+    python app/benchmarks/bench_prefix_cache.py --serving-type ollama -m llama3.2 [--url URL]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic"))
+
+from langchain_core.messages import AIMessage
+
+from offline import MarketFixtures, offline
+from nodes.llm_node import LLMNode
+from nodes.simple_nodes import (
+    get_stock_prices,
+    get_financial_metrics,
+    get_general_financial_info,
+    combine_stock_data
+)
+from utils.utils import llm_endpoint
+from utils.context import render_contexts
+from utils.model_pool import clear_pool
+from utils.prompts import (
+    TECHNICAL_ANALYSIS_PROMPT,
+    SENTIMENT_ANALYSIS_PROMPT,
+    VALUATION_ANALYSIS_PROMPT,
+    REPORT_WRITING_PROMPT
+)
+
+PROMPTS = {
+    "technical_analysis": TECHNICAL_ANALYSIS_PROMPT,
+    "sentiment_analysis": SENTIMENT_ANALYSIS_PROMPT,
+    "valuation_analysis": VALUATION_ANALYSIS_PROMPT,
+    "report_writer": REPORT_WRITING_PROMPT
+}
+
+
+def report_states(fixtures: MarketFixtures, n_reports: int) -> list[dict]:
+    """
+    Run the deterministic nodes on the recorded fixtures and return the final state of each report.
+    """
+    states = []
+    with offline(fixtures):
+        for ticker in (fixtures.tickers * n_reports)[:n_reports]:
+            state = {"messages": [], "stock_ticker": ticker, "stock_exchange": "NASDAQ"}
+            for node in [get_stock_prices, get_financial_metrics]:
+                state.update(node(state, None))
+            state.update(get_general_financial_info(state))
+            state.update(combine_stock_data(state, None))
+            # the report writer gets placeholder analyses
+            state["messages"] = [
+                AIMessage(content=f"The {name.replace('_', ' ')} of {ticker} is mostly positive.", name=name)
+                for name in list(PROMPTS)[:3]
+            ]
+            states.append(state)
+    return states
+
+
+def time_to_first_token(model, messages) -> float:
+    """
+    Return the seconds until the first generated token of a prompt.
+    """
+    start = time.perf_counter()
+    for _ in model.stream(messages):
+        break
+    return time.perf_counter() - start
+
+
+def prompts(states: list[dict]):
+    """
+    Yield the (report index, prompt name, prompt messages) of every report, in the order the pipeline sends them.
+    """
+    for i, state in enumerate(states):
+        for name, prompt in PROMPTS.items():
+            inputs = {**LLMNode._inputs(state), **render_contexts(state, prompt.input_variables)}
+            yield i, name, prompt.invoke(inputs).to_messages()
+
+
+def main(args):
+    config = {"model_path": args.model_path or ""}
+    if args.model_name is not None:
+        config["model_name"] = args.model_name
+    if args.url is not None:
+        config["url"] = args.url
+
+    states = report_states(MarketFixtures(), args.reports)
+    prefix = REPORT_WRITING_PROMPT.messages[0].prompt.format()
+    print(f"{args.reports} reports, shared system prompt of ~{len(prefix) // 4} tokens per prompt\n")
+
+    if args.serving_type == "llama-cpp":
+        # cold: every prompt starts from an empty context
+        model = llm_endpoint(type="llama-cpp", config=config)
+        cold = {}
+        for i, name, messages in prompts(states):
+            model.client.reset()
+            cold[i, name] = time_to_first_token(model, messages)
+        clear_pool()
+        # warm: prompts restore the state of their longest cached prefix
+        model = llm_endpoint(type="llama-cpp", config={**config, "prompt_cache": "ram"})
+        warm = {(i, name): time_to_first_token(model, messages) for i, name, messages in prompts(states)}
+
+        print(f"{'report':<8}{'prompt':<24}{'cold (s)':>10}{'warm (s)':>10}")
+        for (i, name), elapsed in cold.items():
+            print(f"{i:<8}{name:<24}{elapsed:>10.3f}{warm[i, name]:>10.3f}")
+        saved = [sum(cold[i, name] - warm[i, name] for name in PROMPTS) for i in range(len(states))]
+        print(f"\nprefill time saved per report: {sum(saved) / len(saved):.3f} s (first report {saved[0]:.3f} s)")
+
+    else:
+        # generate a single token, so that the response time is dominated by the prefill
+        model = llm_endpoint(type="ollama", config=config).model_copy(update={"num_predict": 1})
+        print(f"{'report':<8}{'prompt':<24}{'time (s)':>10}{'evaluated tokens':>18}{'prefill (s)':>12}")
+        for i, name, messages in prompts(states):
+            start = time.perf_counter()
+            metadata = model.invoke(messages).response_metadata
+            print(f"{i:<8}{name:<24}{time.perf_counter() - start:>10.3f}{metadata.get('prompt_eval_count', 0):>18}"
+                  f"{metadata.get('prompt_eval_duration', 0) / 1e9:>12.3f}")
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="bench_prefix_cache")
+    parser.add_argument("--serving-type", dest="serving_type", choices=["llama-cpp", "ollama"], required=True,
+                        help="Local LLM serving method")
+    parser.add_argument("-m", "--model-name", dest="model_name", help="Ollama model")
+    parser.add_argument("--model-path", dest="model_path", help="Path of the llama.cpp model file")
+    parser.add_argument("--url", help="Ollama url")
+    parser.add_argument("--reports", type=int, default=3, help="Number of reports whose prompts are sent")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_input())
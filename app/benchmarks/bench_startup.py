@@ -0,0 +1,97 @@
+"""
+Benchmark of the startup time of the CLI, based on `python -X importtime`. Every scenario runs
+in a fresh interpreter, and the wall time and total import time are reported, along with the
+modules that take the longest to import.
+
+Run with:
+    python app/benchmarks/bench_startup.py [--repeat N] [--top N] [--serving-type TYPE]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+AGENTIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic")
+
+# lines of -X importtime: "import time: self [us] | cumulative | imported package"
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def scenarios(serving_type: str) -> dict[str, list[str]]:
+    """
+    Returns the command line arguments of every measured scenario.
+    """
+    return {
+        "finance_graph.py --help": [os.path.join(AGENTIC_DIR, "finance_graph.py"), "--help"],
+        "import finance_graph": ["-c", "import finance_graph"],
+        f"build graph ({serving_type})": [
+            "-c",
+            "from finance_graph import FinanceGraph\n"
+            f"fg = FinanceGraph(type={serving_type!r}, model_name='model', model_path='model.gguf')\n"
+            "fg.build()"
+        ]
+    }
+
+
+def measure(args: list[str]) -> tuple[float, dict[str, tuple[int, int]]]:
+    """
+    Run the interpreter with the given arguments and return its wall time (s) and the (self,
+    cumulative) import time (us) of every top-level module it imported.
+    """
+    env = {**os.environ, "PYTHONPATH": AGENTIC_DIR}
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], cwd=AGENTIC_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("\n".join(errors[-5:]))
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), len(match[3]), match[4]
+        # modules imported at the top level have the smallest indentation
+        if indent == 1:
+            modules[name] = (self_us, cumulative_us)
+    return elapsed, modules
+
+
+def main(args):
+    for name, command in scenarios(args.serving_type).items():
+        wall_times, import_times = [], []
+        try:
+            for _ in range(args.repeat):
+                elapsed, modules = measure(command)
+                wall_times.append(elapsed)
+                import_times.append(sum(cumulative for _, cumulative in modules.values()) / 1e6)
+        except RuntimeError as e:
+            print(f"{name:<32}  failed ({e})\n")
+            continue
+
+        print(f"{name:<32}wall {statistics.median(wall_times):.3f} s, imports {statistics.median(import_times):.3f} s "
+              f"(median of {args.repeat})")
+        for module, (_, cumulative) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+            print(f"    {module:<40}{cumulative / 1000:>10.1f} ms")
+        print()
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(prog="bench_startup")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of every scenario")
+    parser.add_argument("--top", type=int, default=8, help="Number of slowest top-level imports shown")
+    parser.add_argument("--serving-type", dest="serving_type", default="ollama",
+                        choices=["ollama", "hugging-face", "llama-cpp", "model-server"],
+                        help="Serving type of the graph built in the last scenario (default is ollama)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_input())
@@ -0,0 +1,353 @@
+"""
+Offline replay of the external services used by the pipeline, for benchmarks that must run
+without network access: recorded `yf.download` bars, `yf.Ticker.info` payloads, `serpapi.search`
+results and article html pages are served from fixtures/market, and the LLM is replaced with a
+deterministic fake chat model with configurable latency.
+
+Fixtures can be refreshed from the live services with `record_fixtures`.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import datetime as dt
+from contextlib import ExitStack, contextmanager
+from typing import Any, AsyncIterator, Iterator
+from unittest import mock
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic"))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.context import estimate_tokens
+
+MARKET_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "market")
+
+# words used to build the responses of the fake chat model
+VOCABULARY = (
+    "the stock shows momentum while valuation remains stretched relative to peers and recent "
+    "earnings support a constructive outlook although volume suggests caution as indicators "
+    "point to consolidation near resistance with balanced risk over the coming quarters"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model for benchmarks. Every response is derived from a hash of the
+    prompt, so identical prompts get identical responses, and takes `latency` seconds before
+    the first token plus `token_latency` seconds per generated token.
+    """
+    latency: float = 0.0
+    token_latency: float = 0.0
+    max_tokens: int = 256
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"latency": self.latency, "token_latency": self.token_latency, "max_tokens": self.max_tokens}
+
+    def _tokens(self, messages: list[BaseMessage]) -> list[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode()).digest()
+        # longer prompts get longer responses, up to `max_tokens`
+        n_tokens = min(self.max_tokens, 32 + estimate_tokens(prompt) // 8)
+        return [VOCABULARY[digest[i % len(digest)] % len(VOCABULARY)] for i in range(n_tokens)]
+
+    def _message(self, messages: list[BaseMessage], tokens: list[str]) -> AIMessage:
+        input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        return AIMessage(
+            content=" ".join(tokens),
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens)
+            }
+        )
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, tokens))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, tokens))])
+
+    def _stream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for i, token in enumerate(self._tokens(messages)):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token if i == 0 else f" {token}"))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: list[BaseMessage], stop=None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self._tokens(messages)):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token if i == 0 else f" {token}"))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class MarketFixtures:
+    """
+    Recorded market data, loaded from a fixtures directory. Tickers without a recording are
+    served the recording of another ticker (always the same one for a given ticker), so that
+    benchmarks can run over any number of tickers.
+    """
+    def __init__(self, fixtures_dir: str=MARKET_FIXTURES_DIR):
+        self.fixtures_dir = fixtures_dir
+        self.prices = {
+            name[:-len(".csv")]: pd.read_csv(os.path.join(fixtures_dir, "prices", name), index_col="Date", parse_dates=True)
+            for name in sorted(os.listdir(os.path.join(fixtures_dir, "prices")))
+        }
+        self.tickers = list(self.prices)
+        with open(os.path.join(fixtures_dir, "info.json"), 'r') as f:
+            self.info = json.load(f)
+        self.search_results = {}
+        for name in sorted(os.listdir(os.path.join(fixtures_dir, "serpapi"))):
+            with open(os.path.join(fixtures_dir, "serpapi", name), 'r') as f:
+                self.search_results[name[:-len(".json")]] = json.load(f)
+        with open(os.path.join(fixtures_dir, "articles.json"), 'r') as f:
+            self.articles = json.load(f)
+        self._pages = {}
+
+    def recorded_ticker(self, ticker: str) -> str:
+        """
+        Returns the recorded ticker whose data is served for the given ticker.
+        """
+        if ticker in self.prices:
+            return ticker
+        return self.tickers[zlib.crc32(ticker.encode()) % len(self.tickers)]
+
+    def bars(self, ticker: str) -> pd.DataFrame:
+        """
+        Returns the recorded bars of a ticker, shifted so that the last bar falls on the current week.
+        """
+        df = self.prices[self.recorded_ticker(ticker)]
+        today = pd.Timestamp(dt.date.today())
+        shift = (today - pd.Timedelta(days=today.weekday())) - df.index[-1]
+        shifted = df.copy()
+        shifted.index = (df.index + shift).rename("Date")
+        return shifted
+
+    def page(self, url: str) -> bytes | None:
+        """
+        Returns the recorded html of an article, or None if it was not recorded.
+        """
+        path = self.articles.get(url)
+        if path is None:
+            return None
+        if path not in self._pages:
+            with open(os.path.join(self.fixtures_dir, path), 'rb') as f:
+                self._pages[path] = f.read()
+        return self._pages[path]
+
+
+class _FakeTicker:
+    def __init__(self, fixtures: MarketFixtures, ticker: str, network_latency: float):
+        self._fixtures = fixtures
+        self._ticker = ticker
+        self._network_latency = network_latency
+
+    @property
+    def info(self) -> dict:
+        time.sleep(self._network_latency)
+        return dict(self._fixtures.info[self._fixtures.recorded_ticker(self._ticker)], symbol=self._ticker)
+
+
+class _FakeSearch:
+    def __init__(self, results: dict):
+        self._results = results
+
+    def as_dict(self) -> dict:
+        return self._results
+
+
+class _FakeResponse:
+    def __init__(self, url: str, content: bytes | None, headers: dict | None=None):
+        self.url = url
+        self.content = content or b""
+        self.status_code = 200 if content is not None else 404
+        self.headers = {"content-type": "text/html; charset=utf-8"}
+        self.encoding = "utf-8"
+        # recorded pages are served with an ETag, and conditional requests for unchanged ones get a 304
+        if content is not None:
+            self.headers["ETag"] = '"' + hashlib.sha1(content).hexdigest() + '"'
+            if (headers or {}).get("If-None-Match") == self.headers["ETag"]:
+                self.status_code, self.content = 304, b""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(f"{self.status_code} Not Found for url: {self.url}")
+
+    def iter_content(self, chunk_size: int=1) -> Iterator[bytes]:
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class _FakeSession:
+    def __init__(self, fixtures: MarketFixtures, network_latency: float):
+        self._fixtures = fixtures
+        self._network_latency = network_latency
+
+    def get(self, url: str, headers: dict | None=None, **kwargs) -> _FakeResponse:
+        time.sleep(self._network_latency)
+        return _FakeResponse(url, self._fixtures.page(url), headers)
+
+
+@contextmanager
+def offline(fixtures: MarketFixtures | None=None, network_latency: float=0.0, llm: BaseChatModel | None=None,
+            counters: dict | None=None, models: dict[str, BaseChatModel] | None=None):
+    """
+    Replay the recorded fixtures instead of calling yahoo finance, serpapi and the article
+    websites, and use `llm` (a `FakeChatModel` by default) for every `FinanceGraph` created in
+    the context, or the model of `models` with the requested model name (i.e. for per-node models
+    and the router's small model). Every replayed call waits `network_latency` seconds, and the
+    number of calls per service is counted in `counters` (if given). Recent results of the
+    data-access layer are dropped when entering and leaving the context.
+    """
+    import yfinance as yf
+    import serpapi
+    from utils import utils
+    from utils.data_access import clear_recent_results
+
+    fixtures = fixtures if fixtures is not None else MarketFixtures()
+    llm = llm if llm is not None else FakeChatModel()
+    counters = counters if counters is not None else {}
+    models = models if models is not None else {}
+    for name in ["download", "info", "search", "article"]:
+        counters.setdefault(name, 0)
+
+    def download(tickers, start=None, end=None, interval="1wk", group_by="column", **kwargs):
+        counters["download"] += 1
+        time.sleep(network_latency)
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        frames = {ticker: fixtures.bars(ticker) for ticker in tickers}
+        data = pd.concat(frames, axis=1)
+        if start is not None:
+            data = data[data.index >= pd.Timestamp(start).normalize()]
+        if end is not None:
+            data = data[data.index <= pd.Timestamp(end)]
+        # yahoo finance keys the columns by (ticker, field) when grouping by ticker
+        return data if group_by == "ticker" else data.swaplevel(axis=1).sort_index(axis=1)
+
+    def ticker(symbol, *args, **kwargs):
+        counters["info"] += 1
+        return _FakeTicker(fixtures, symbol, network_latency)
+
+    def search(params, *args, **kwargs):
+        counters["search"] += 1
+        time.sleep(network_latency)
+        symbol = params.get("q", "").partition(":")[0]
+        return _FakeSearch(fixtures.search_results[fixtures.recorded_ticker(symbol)])
+
+    class Client:
+        def __init__(self, *args, **kwargs):
+            self.session = None
+
+        def search(self, params, *args, **kwargs):
+            return search(params)
+
+    session = _FakeSession(fixtures, network_latency)
+
+    def get_http_session():
+        counters["article"] += 1
+        return session
+
+    with ExitStack() as stack:
+        # results of other contexts (or of the live services) are not replayed
+        clear_recent_results()
+        stack.callback(clear_recent_results)
+        stack.enter_context(mock.patch.object(yf, "download", download))
+        stack.enter_context(mock.patch.object(yf, "Ticker", ticker))
+        stack.enter_context(mock.patch.object(serpapi, "search", search))
+        stack.enter_context(mock.patch.object(serpapi, "Client", Client))
+        stack.enter_context(mock.patch.object(utils, "get_http_session", get_http_session))
+        stack.enter_context(mock.patch.object(
+            utils, "llm_endpoint",
+            lambda type=None, config={}: models.get(config.get("model_name") or config.get("model_path"), llm)
+        ))
+        yield fixtures
+
+
+def record_fixtures(stocks: list[tuple[str, str]], fixtures_dir: str=MARKET_FIXTURES_DIR, weeks: int=80):
+    """
+    Record the live responses of yahoo finance, serpapi and the linked articles for the given
+    (stock ticker, stock exchange) pairs into a fixtures directory (requires network access
+    and the SERPAPI_KEY_TOKEN environment variable).
+    """
+    import yfinance as yf
+    import serpapi
+    from utils.utils import get_http_session
+
+    for name in ["prices", "serpapi", "articles"]:
+        os.makedirs(os.path.join(fixtures_dir, name), exist_ok=True)
+    info_path = os.path.join(fixtures_dir, "info.json")
+    articles_path = os.path.join(fixtures_dir, "articles.json")
+    info, articles = {}, {}
+    if os.path.exists(info_path):
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+    if os.path.exists(articles_path):
+        with open(articles_path, 'r') as f:
+            articles = json.load(f)
+
+    tickers = [ticker for ticker, _ in stocks]
+    data = yf.download(
+        tickers,
+        start=dt.datetime.now() - dt.timedelta(weeks=weeks),
+        end=dt.datetime.now(),
+        interval="1wk",
+        group_by="ticker"
+    )
+    for ticker, exchange in stocks:
+        data[ticker].dropna(how="all").to_csv(os.path.join(fixtures_dir, "prices", f"{ticker}.csv"))
+        info[ticker] = yf.Ticker(ticker).info
+
+        results = serpapi.search({
+            "engine": "google_finance",
+            "q": f"{ticker}:{exchange}",
+            "api_key": os.getenv("SERPAPI_KEY_TOKEN")
+        }).as_dict()
+        with open(os.path.join(fixtures_dir, "serpapi", f"{ticker}.json"), 'w') as f:
+            json.dump(results, f, indent=1)
+
+        # save the raw html of every linked article
+        for item in results.get("news_results", []):
+            item = item["items"][0] if item.get("items") else item
+            try:
+                response = get_http_session().get(item["link"], timeout=10)
+                response.raise_for_status()
+            except Exception:
+                continue
+            path = os.path.join("articles", hashlib.sha1(item["link"].encode()).hexdigest() + ".html")
+            with open(os.path.join(fixtures_dir, path), 'wb') as f:
+                f.write(response.content)
+            articles[item["link"]] = path
+
+    with open(info_path, 'w') as f:
+        json.dump(info, f, indent=1)
+    with open(articles_path, 'w') as f:
+        json.dump(articles, f, indent=1)
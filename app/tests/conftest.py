@@ -0,0 +1,11 @@
+"""
+File containing the shared setup of the tests: the modules of the application (and of the offline
+benchmark harness) are imported the same way the scripts import them.
+"""
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.insert(0, os.path.join(APP_DIR, "agentic"))
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks"))
@@ -0,0 +1,61 @@
+"""
+File containing the tests of the change detection of the state archive.
+"""
+import time
+
+from langchain_core.messages import AIMessage
+
+from nodes.simple_nodes import detect_changes
+from utils.archive import StateArchive
+
+
+ANALYSES = ["technical_analysis", "sentiment_analysis", "valuation_analysis", "report_writer"]
+
+
+def make_state(price: float) -> dict:
+    return {
+        "stock_ticker": "TEST",
+        "stock_price_indicators": None,
+        "financial_metrics": {"price": price},
+        "financial_statements": [],
+        "news_results": [("title", "text")],
+        "errors": []
+    }
+
+
+def run(archive: StateArchive, run_id: str, price: float, max_age: float | None=None) -> dict:
+    """
+    Run the change detection on a state with the given price and archive its final state, with
+    the reused responses kept and the other ones regenerated (as `run_id`).
+    """
+    state = make_state(price)
+    config = {"configurable": {"state_archive": archive, "archive_model": "model", "archive_max_age": max_age}}
+    update = detect_changes(state, config)
+    reused = update["reused_responses"]
+    messages = [AIMessage(content=reused.get(name, f"{name} of {run_id}"), name=name) for name in ANALYSES]
+    archive.put({**state, **update, "messages": messages}, run_id=run_id, model="model")
+    return reused
+
+
+def test_small_changes_add_up(tmp_path):
+    archive = StateArchive(str(tmp_path))
+    assert run(archive, "run-0", 100.0) == {}
+    # every run moves the price by 1%, below the 2% tolerance, so the first runs reuse the responses of run-0
+    assert set(run(archive, "run-1", 101.0)) == set(ANALYSES)
+    assert run(archive, "run-2", 102.0)["technical_analysis"] == "technical_analysis of run-0"
+    # 3% away from the inputs of run-0: the analyses that use the metrics are generated again
+    reused = run(archive, "run-3", 103.0)
+    assert set(reused) == {"sentiment_analysis"}
+    assert reused["sentiment_analysis"] == "sentiment_analysis of run-0"
+    # and the next runs compare against the inputs of run-3
+    assert run(archive, "run-4", 104.0)["technical_analysis"] == "technical_analysis of run-3"
+
+
+def test_reuse_does_not_extend_max_age(tmp_path):
+    archive = StateArchive(str(tmp_path))
+    run(archive, "run-0", 100.0)
+    time.sleep(0.2)
+    assert set(run(archive, "run-1", 100.0, max_age=0.5)) == set(ANALYSES)
+    time.sleep(0.4)
+    # run-1 is recent, but the responses it reused are from run-0
+    assert run(archive, "run-2", 100.0, max_age=0.5) == {}
@@ -0,0 +1,59 @@
+"""
+File containing the tests of the article store and of the conditional fetches that use it.
+"""
+import time
+
+from offline import MarketFixtures, offline
+from utils.article_store import ArticleStore, normalize_url
+from utils.data_access import clear_recent_results
+from utils.utils import extract_text_from_url
+
+
+URL = "https://news.example.com/aapl/0"
+
+
+def test_tracking_variants_share_a_key():
+    assert normalize_url("HTTPS://News.Example.com:443/story/?b=2&utm_source=x&a=1#comments") \
+        == normalize_url("https://news.example.com/story?a=1&b=2&fbclid=abc")
+    assert normalize_url("https://news.example.com/story?a=1") != normalize_url("https://news.example.com/story?a=2")
+
+
+def test_articles_go_stale_and_are_evicted(tmp_path):
+    # room for a single text
+    store = ArticleStore(str(tmp_path), ttl=0.2, max_size=16)
+    store.put("https://a.example.com/1", "same story", etag='"v1"')
+    # the same text under another url is stored once
+    store.put("https://b.example.com/2?utm_medium=feed", "same story")
+
+    entry = store.get("https://a.example.com/1")
+    assert entry["fresh"] and entry["text"] == "same story"
+    assert ArticleStore.conditional_headers(entry) == {"If-None-Match": '"v1"'}
+    time.sleep(0.3)
+    assert not store.get("https://b.example.com/2")["fresh"]
+    store.revalidate("https://b.example.com/2")
+    assert store.get("https://b.example.com/2")["fresh"]
+
+    # a new text goes beyond max_size, so the articles of the shared text are evicted, least recently used first
+    store.put("https://c.example.com/3", "other story")
+    assert store.get("https://a.example.com/1") is None
+    assert store.get("https://b.example.com/2") is None
+    assert store.get("https://c.example.com/3")["text"] == "other story"
+
+
+def test_stale_articles_are_revalidated(tmp_path):
+    store = ArticleStore(str(tmp_path), ttl=0.2)
+    counters = {}
+    with offline(MarketFixtures(), counters=counters):
+        text = extract_text_from_url(URL, store=store)
+        assert text
+        clear_recent_results()
+        # fresh articles are served without a request
+        assert extract_text_from_url(URL, store=store) == text
+        assert counters["article"] == 1
+
+        time.sleep(0.3)
+        clear_recent_results()
+        # stale ones are revalidated with a conditional GET, which the recorded page answers with a 304
+        assert extract_text_from_url(URL, store=store) == text
+        assert counters["article"] == 2
+    assert store.stats() == {"hits": 1, "revalidated": 1, "misses": 1}
@@ -0,0 +1,68 @@
+"""
+File containing the tests of the SQLite market data cache.
+"""
+import time
+
+import pandas as pd
+
+from utils.cache import MarketDataCache, BAR_SIZE
+
+
+def make_prices(start: str, weeks: int, price: float=100.0) -> pd.DataFrame:
+    dates = pd.date_range(start, periods=weeks, freq="W-MON")
+    return pd.DataFrame(
+        {"Open": price, "High": price + 1, "Low": price - 1, "Close": price, "Volume": 1000.0},
+        index=dates
+    )
+
+
+def test_prices_round_trip_and_expire(tmp_path):
+    cache = MarketDataCache(str(tmp_path), ttl=0.2)
+    df = make_prices("2024-01-01", 10)
+    cache.put_prices("TEST", "1wk", df, range_start="2024-01-01")
+
+    cached, fresh = cache.get_prices("TEST", "1wk", "2024-01-01")
+    assert fresh
+    pd.testing.assert_frame_equal(cached, df, check_names=False, check_freq=False)
+    # a range that starts before the cached one is a miss
+    assert cache.get_prices("TEST", "1wk", "2023-12-01") == (None, False)
+
+    time.sleep(0.3)
+    # expired bars are kept, so that only newer bars need to be fetched
+    cached, fresh = cache.get_prices("TEST", "1wk", "2024-01-01")
+    assert not fresh and len(cached) == 10
+
+
+def test_new_bars_extend_the_cached_range(tmp_path):
+    cache = MarketDataCache(str(tmp_path))
+    cache.put_prices("TEST", "1wk", make_prices("2024-01-01", 10), range_start="2024-01-01")
+    # the last cached bar is fetched again along with the new ones
+    cache.put_prices("TEST", "1wk", make_prices("2024-03-04", 3, price=110.0))
+
+    cached, _ = cache.get_prices("TEST", "1wk", "2024-01-01")
+    assert len(cached) == 12
+    assert cached["Close"].iloc[-3:].tolist() == [110.0] * 3
+
+
+def test_metrics_expire(tmp_path):
+    cache = MarketDataCache(str(tmp_path), ttl=0.2)
+    cache.put_metrics("TEST", {"pe_ratio": 20.0})
+    assert cache.get_metrics("TEST") == {"pe_ratio": 20.0}
+    time.sleep(0.3)
+    assert cache.get_metrics("TEST") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # room for the bars of two tickers only
+    cache = MarketDataCache(str(tmp_path), max_size=2 * 10 * BAR_SIZE)
+    for ticker in ["A", "B"]:
+        cache.put_prices(ticker, "1wk", make_prices("2024-01-01", 10), range_start="2024-01-01")
+        time.sleep(0.01)
+    # reading A makes B the least recently used entry
+    assert cache.get_prices("A", "1wk", "2024-01-01")[0] is not None
+    time.sleep(0.01)
+    cache.put_prices("C", "1wk", make_prices("2024-01-01", 10), range_start="2024-01-01")
+
+    assert cache.get_prices("B", "1wk", "2024-01-01") == (None, False)
+    assert cache.get_prices("A", "1wk", "2024-01-01")[0] is not None
+    assert cache.get_prices("C", "1wk", "2024-01-01")[0] is not None
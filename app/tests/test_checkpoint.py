@@ -0,0 +1,83 @@
+"""
+File containing the tests of the checkpoints of the graph runs, which let failed runs resume from
+their last completed node.
+"""
+import asyncio
+import time
+
+import pytest
+
+from finance_graph import FinanceGraph
+from offline import FakeChatModel, MarketFixtures, offline
+from utils.checkpoint import prune_threads, thread_ids
+
+
+class FailingChatModel(FakeChatModel):
+    """
+    Fake chat model whose report writing calls raise the errors of `fail`, until there are none left.
+    """
+    fail: list = []
+    calls: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(messages)
+        if self.fail and "You are the reporter" in str(messages[-1].content):
+            raise self.fail.pop(0)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+
+@pytest.fixture
+def graph(tmp_path):
+    llm = FailingChatModel()
+    counters = {}
+    with offline(MarketFixtures(), llm=llm, counters=counters):
+        fg = FinanceGraph(type="ollama", model_name="fake", checkpoint_dir=str(tmp_path / "checkpoints"))
+        yield fg, llm, counters
+
+
+def test_failed_run_resumes_from_its_last_node(graph):
+    fg, llm, counters = graph
+    report, _ = fg.run("AAPL", "NASDAQ")
+    assert thread_ids(fg.checkpointer, "AAPL:") == []
+
+    llm.fail.append(ValueError("model crashed"))
+    with pytest.raises(ValueError):
+        fg.run("AAPL", "NASDAQ")
+    assert len(thread_ids(fg.checkpointer, "AAPL:")) == 1
+
+    fetches = dict(counters)
+    llm.calls.clear()
+    resumed, status = fg.run("AAPL", "NASDAQ", resume=True)
+    # only the report is written again, from the fetched data and the analyses of the failed run
+    assert (resumed, status) == (report, 1)
+    assert len(llm.calls) == 1
+    assert counters == fetches
+    # finished runs cannot be resumed, so their checkpoints are removed
+    assert thread_ids(fg.checkpointer, "AAPL:") == []
+
+
+def test_async_failed_run_resumes(graph):
+    fg, llm, _ = graph
+    llm.fail.append(ValueError("model crashed"))
+    with pytest.raises(ValueError):
+        asyncio.run(fg.arun("MSFT", "NASDAQ"))
+
+    llm.calls.clear()
+    _, status = asyncio.run(fg.arun("MSFT", "NASDAQ", resume=True))
+    assert status == 1 and len(llm.calls) == 1
+
+
+def test_old_threads_are_pruned(graph):
+    fg, llm, _ = graph
+    llm.fail.append(ValueError("model crashed"))
+    with pytest.raises(ValueError):
+        fg.run("AAPL", "NASDAQ")
+
+    prune_threads(fg.checkpointer, max_age=3600)
+    assert len(thread_ids(fg.checkpointer, "AAPL:")) == 1
+    time.sleep(0.2)
+    prune_threads(fg.checkpointer, max_age=0.1)
+    assert thread_ids(fg.checkpointer, "AAPL:") == []
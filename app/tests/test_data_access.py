@@ -0,0 +1,60 @@
+"""
+File containing the tests of the request coalescing of the data-access layer.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.data_access import SingleFlight
+
+
+def test_concurrent_calls_share_one_request():
+    flight = SingleFlight(ttl=0)
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        time.sleep(0.2)
+        return {"key": key}
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: flight.do("AAPL", fetch, "AAPL"), range(8)))
+    assert calls == ["AAPL"]
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"calls": 1, "shared": 7}
+
+
+def test_errors_are_shared_but_not_kept():
+    flight = SingleFlight(ttl=60)
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise OSError("service unavailable")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "AAPL", fail)
+        started.wait()
+        follower = pool.submit(flight.do, "AAPL", lambda: "not called")
+        for future in [leader, follower]:
+            with pytest.raises(OSError):
+                future.result()
+
+    # the failed call is made again
+    assert flight.do("AAPL", lambda: "retried") == "retried"
+    assert flight.stats() == {"calls": 2, "shared": 1}
+
+
+def test_recent_results_expire():
+    flight = SingleFlight(ttl=0.2)
+    assert flight.do("AAPL", lambda: 1) == 1
+    assert flight.do("AAPL", lambda: 2) == 1
+    # other keys are not shared
+    assert flight.do("MSFT", lambda: 3) == 3
+    time.sleep(0.3)
+    assert flight.do("AAPL", lambda: 4) == 4
+    flight.clear()
+    assert flight.do("AAPL", lambda: 5) == 5
@@ -0,0 +1,75 @@
+"""
+File containing the tests of the vectorized and incremental technical indicators, against the
+output of the `ta` library.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from ta.momentum import RSIIndicator, StochasticOscillator
+from ta.trend import MACD
+from ta.volume import volume_weighted_average_price
+
+from utils.indicators import INDICATORS, IncrementalIndicators, compute_indicators_frame
+
+
+def make_prices(bars: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.03, bars))
+    return pd.DataFrame({
+        "High": close * (1 + np.abs(rng.normal(0, 0.02, bars))),
+        "Low": close * (1 - np.abs(rng.normal(0, 0.02, bars))),
+        "Close": close,
+        "Volume": rng.integers(1000, 10**7, bars).astype(float),
+    }, index=pd.date_range("2020-01-06", periods=bars, freq="W-MON"))
+
+
+def ta_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    macd = MACD(close=df["Close"])
+    return pd.DataFrame({
+        "RSI": RSIIndicator(close=df["Close"]).rsi(),
+        "Stochastic_Oscillator": StochasticOscillator(high=df["High"], low=df["Low"], close=df["Close"]).stoch(),
+        "MACD": macd.macd(),
+        "MACD_Signal": macd.macd_signal(),
+        "volume_weighted_average_price": volume_weighted_average_price(
+            high=df["High"], low=df["Low"], close=df["Close"], volume=df["Volume"]
+        ),
+    })
+
+
+def test_vectorized_indicators_match_ta():
+    # tickers with different histories are aligned on the union of their dates
+    frames = {"A": make_prices(120, seed=1), "B": make_prices(80, seed=2).iloc[10:]}
+    indicators = compute_indicators_frame(frames)
+
+    for ticker, df in frames.items():
+        result = indicators.xs(ticker, axis=1, level="ticker").loc[df.index, INDICATORS]
+        pd.testing.assert_frame_equal(result, ta_indicators(df), check_names=False, check_freq=False)
+
+
+def test_incremental_indicators_match_ta():
+    df = make_prices(120, seed=3)
+    expected = ta_indicators(df)
+
+    state = IncrementalIndicators()
+    for i, (date, bar) in enumerate(df.iterrows()):
+        if i % 25 == 0:
+            # the state survives a json round trip
+            state = IncrementalIndicators.from_dict(json.loads(json.dumps(state.to_dict())))
+        values = state.update(date.isoformat(), bar["High"], bar["Low"], bar["Close"], bar["Volume"])
+        for name in INDICATORS:
+            assert values[name] == pytest.approx(expected[name].iloc[i], nan_ok=True, rel=1e-9), (i, name)
+
+
+def test_peek_leaves_the_state_unchanged():
+    df = make_prices(30, seed=4)
+    state = IncrementalIndicators()
+    for date, bar in df.iloc[:-1].iterrows():
+        state.update(date.isoformat(), bar["High"], bar["Low"], bar["Close"], bar["Volume"])
+    before = state.to_dict()
+
+    last = df.iloc[-1]
+    peeked = state.peek(df.index[-1].isoformat(), last["High"], last["Low"], last["Close"], last["Volume"])
+    assert state.to_dict() == before
+    assert peeked.bars == state.bars + 1
@@ -0,0 +1,47 @@
+"""
+File containing the tests of the LLM response caches.
+"""
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from offline import FakeChatModel
+from utils.llm_cache import InMemoryLLMCache, SQLiteLLMCache, llm_cache_key
+
+
+MESSAGES = [SystemMessage("You are a financial analyst."), HumanMessage("Analyze AAPL:NASDAQ.")]
+
+
+def test_key_depends_on_the_prompt_and_the_model():
+    llm = FakeChatModel()
+    key = llm_cache_key(MESSAGES, llm)
+    assert key == llm_cache_key(list(MESSAGES), FakeChatModel())
+    assert key != llm_cache_key(MESSAGES[:1] + [HumanMessage("Analyze MSFT:NASDAQ.")], llm)
+    # the sampling parameters of the model are part of the key
+    assert key != llm_cache_key(MESSAGES, FakeChatModel(max_tokens=64))
+
+
+def test_in_memory_cache_evicts_and_expires():
+    cache = InMemoryLLMCache(ttl=0.2, max_entries=2)
+    cache.put("a", "response a")
+    cache.put("b", "response b")
+    assert cache.get("a") == "response a"
+    # "b" is the least recently used entry
+    cache.put("c", "response c")
+    assert cache.get("b") is None
+    assert cache.get("c") == "response c"
+
+    time.sleep(0.3)
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 2, "misses": 2}
+
+
+def test_sqlite_cache_is_shared_across_instances(tmp_path):
+    key = llm_cache_key(MESSAGES, FakeChatModel())
+    SQLiteLLMCache(str(tmp_path)).put(key, "cached response")
+
+    cache = SQLiteLLMCache(str(tmp_path), ttl=0.2)
+    assert cache.get(key) == "cached response"
+    time.sleep(0.3)
+    assert cache.get(key) is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
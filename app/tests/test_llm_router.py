@@ -0,0 +1,68 @@
+"""
+File containing the tests of the routing of prompts between a small and a large model.
+"""
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from offline import FakeChatModel
+from utils.llm_router import LLMRouter
+
+
+class BrokenChatModel(FakeChatModel):
+    """
+    Fake chat model that fails every call, after streaming `chunks` tokens.
+    """
+    chunks: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("small model is down")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("small model is down")
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in list(super()._stream(messages, stop, run_manager, **kwargs))[:self.chunks]:
+            yield chunk
+        raise ConnectionError("small model is down")
+
+
+SHORT = [HumanMessage("Summarize the outlook of AAPL.")]
+LONG = [HumanMessage("Summarize the outlook of AAPL. " * 100)]
+
+
+def calls(router: LLMRouter) -> dict:
+    return {route: stats["calls"] for route, stats in router.stats.to_dict()["routes"].items()}
+
+
+def test_prompts_are_routed_by_length():
+    router = LLMRouter(FakeChatModel(max_tokens=8), FakeChatModel(), max_tokens=100)
+    assert router.invoke(SHORT).response_metadata["route"] == "small"
+    assert router.invoke(LONG).response_metadata["route"] == "large"
+    assert asyncio.run(router.ainvoke(SHORT)).response_metadata["route"] == "small"
+    assert calls(router) == {"small": 2, "large": 1, "escalated": 0}
+
+
+@pytest.mark.parametrize("small", [BrokenChatModel(), FakeChatModel(max_tokens=0)], ids=["error", "empty"])
+def test_failed_small_calls_are_escalated(small):
+    large = FakeChatModel()
+    router = LLMRouter(small, large, max_tokens=100)
+    response = router.invoke(SHORT)
+    assert response.response_metadata["route"] == "escalated"
+    assert response.content == large.invoke(SHORT).content
+    assert asyncio.run(router.ainvoke(SHORT)).response_metadata["route"] == "escalated"
+    assert calls(router) == {"small": 0, "large": 0, "escalated": 2}
+
+
+def test_streams_are_escalated_until_the_first_token():
+    large = FakeChatModel()
+    router = LLMRouter(BrokenChatModel(), large, max_tokens=100)
+    streamed = "".join(chunk.content for chunk in router.stream(SHORT))
+    assert streamed == large.invoke(SHORT).content
+    assert calls(router)["escalated"] == 1
+
+    # a partially streamed response can not be taken back
+    router = LLMRouter(BrokenChatModel(chunks=2), large, max_tokens=100)
+    with pytest.raises(ConnectionError):
+        list(router.stream(SHORT))
@@ -0,0 +1,64 @@
+"""
+File containing the tests of the columnar report store.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from langchain_core.messages import AIMessage
+
+pytest.importorskip("pyarrow")
+
+from utils.indicators import compute_stock_price_indicators
+from utils.profiling import RunTrace
+from utils.store import ReportStore
+
+
+def make_state(ticker: str, weeks: int, price: float) -> dict:
+    dates = pd.date_range("2024-01-01", periods=weeks, freq="W-MON")
+    close = price + np.arange(weeks, dtype=float)
+    df = pd.DataFrame({"Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 1000.0}, index=dates)
+    return {
+        "stock_ticker": ticker,
+        "stock_exchange": "NASDAQ",
+        "stock_price_indicators": compute_stock_price_indicators(df),
+        "financial_metrics": {"pe_ratio": 20.0, "price_to_book": 3.0},
+        "messages": [AIMessage(content=f"report of {ticker} at {price}", name="report_writer")],
+        "errors": []
+    }
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_stored_bars_are_replaced_by_newer_runs(tmp_path, format):
+    store = ReportStore(str(tmp_path), format=format)
+    store.add(make_state("TEST", 30, price=100.0))
+    # the next run has a new bar, and a different last bar (which was still open in the first run)
+    store.add(make_state("TEST", 31, price=200.0))
+
+    prices = store.prices("TEST")
+    assert len(prices) == 31
+    # only the bars from the last stored one onwards were stored again
+    assert prices["Close"].iloc[0] == 100.0
+    assert prices["Close"].iloc[-2:].tolist() == [229.0, 230.0]
+
+    window = store.prices("TEST", start="2024-03-04", end="2024-03-25")
+    assert window["date"].astype(str).tolist() == ["2024-03-04", "2024-03-11", "2024-03-18", "2024-03-25"]
+
+    store.compact()
+    pd.testing.assert_frame_equal(store.prices("TEST"), prices)
+    # the last 12 points of each run, which overlap but for the new bar
+    assert len(store.indicators("TEST")) == 13
+    assert store.metrics("TEST")["pe_ratio"].tolist() == [20.0]
+
+
+def test_runs_are_written_in_batches(tmp_path):
+    store = ReportStore(str(tmp_path), batch_size=2)
+    trace = RunTrace()
+    store.add(make_state("A", 20, price=10.0), trace)
+    assert store.reports("A") == []
+
+    store.add(make_state("B", 20, price=50.0))
+    assert sorted(store.prices()["ticker"].unique()) == ["A", "B"]
+    [report] = store.reports("A")
+    assert report["run_id"] == trace.run_id
+    assert report["messages"] == {"report_writer": "report of A at 10.0"}
+    assert store.trace(trace.run_id)["run_id"] == trace.run_id